@@ -1,17 +1,39 @@
 """ZTM Gdańsk integration for Home Assistant."""
 from __future__ import annotations
 
+import asyncio
 import logging
+import re
+import time
 from typing import Any
 
+import aiohttp
 import voluptuous as vol
 
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant, ServiceCall
+from homeassistant.const import ATTR_ENTITY_ID, EVENT_HOMEASSISTANT_STOP, Platform
+from homeassistant.core import (
+    Event,
+    HomeAssistant,
+    ServiceCall,
+    ServiceResponse,
+    SupportsResponse,
+    callback,
+)
 import homeassistant.helpers.config_validation as cv
+from homeassistant.exceptions import HomeAssistantError, ServiceValidationError
+from homeassistant.helpers import entity_registry as er
+from homeassistant.helpers.dispatcher import async_dispatcher_send
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util, slugify
 
 from .const import (
+    API_RECORD_PATH,
+    ATTR_DEPARTURES,
+    ATTR_ROUTE,
+    ATTR_STOP_ID,
+    ATTR_STOP_NAME,
+    CONF_ATTRIBUTE_FORMAT,
     CONF_DEPARTURE_FORMAT,
     CONF_ICON_AIR_CONDITIONING,
     CONF_ICON_BIKE,
@@ -19,18 +41,56 @@ from .const import (
     CONF_ICON_LOW_FLOOR,
     CONF_ICON_USB,
     CONF_ICON_WHEELCHAIR,
+    CONF_HEADSIGN_FILTERS,
+    CONF_HEDGE_REQUESTS,
+    CONF_LOOP_LAG_THRESHOLD,
+    CONF_LOOP_MONITOR,
     CONF_MAX_DEPARTURES,
+    CONF_PANEL_ATTRIBUTE_BUDGET,
+    CONF_ROUTE_FILTERS,
     CONF_SCAN_INTERVAL,
+    CONF_STOP_GROUPS,
     CONF_STOPS,
+    CONF_TRACKED_ROUTES,
+    CONF_WALKING_TIMES,
+    DEFAULT_ATTRIBUTE_FORMAT,
+    DEFAULT_LOOP_LAG_THRESHOLD,
     DEFAULT_MAX_DEPARTURES,
+    DEFAULT_PANEL_ATTRIBUTE_BUDGET,
     DEFAULT_SCAN_INTERVAL,
     DOMAIN,
+    SIGNAL_COORDINATORS_CHANGED,
+    STARTUP_TIME_BUDGET,
+    STORAGE_KEY_STOPS,
+    STORAGE_VERSION,
 )
-from .coordinator import ZTMCoordinator
+from .alerts import DepartureAlertScheduler
+from .cache import get_departure_cache
+from .coordinator import ZTMCoordinator, get_coordinators, trip_key
+from .hedging import get_hedge_budget
+from .journey import get_connection_index, journey_as_dict, parse_start, stop_name
+from .loop_monitor import get_loop_monitor
+from .profiler import RefreshProfiler
+from .transport import close_recorders
+from .websocket_api import async_register_websocket_commands
 
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORMS = [Platform.SENSOR]
+PLATFORMS = [Platform.SENSOR, Platform.BINARY_SENSOR]
+
+# Unique IDs of entities showing a single stop (without the entry prefix)
+STOP_UNIQUE_ID = re.compile(r"ztm_(?:stop|next|data_age|leave_now)_(\d+)")
+PANEL_UNIQUE_ID = re.compile(r"ztm_panel(?:_(\d+))?")
+
+# Unique ID prefixes of entities that exist once per config entry
+ENTRY_SCOPED_UNIQUE_IDS = (
+    "ztm_board",
+    "ztm_panel",
+    "ztm_group_",
+    "ztm_metric_",
+    "ztm_route_",
+    "ztm_leave_now_",
+)
 
 # Schema for YAML configuration (still supported)
 CONFIG_SCHEMA = vol.Schema(
@@ -52,11 +112,68 @@ CONFIG_SCHEMA = vol.Schema(
     extra=vol.ALLOW_EXTRA,
 )
 
+TARGET_SCHEMA = vol.Schema(
+    {
+        vol.Optional(ATTR_STOP_ID): vol.All(cv.ensure_list_csv, [cv.positive_int]),
+        vol.Optional(ATTR_ENTITY_ID): cv.entity_ids,
+    }
+)
+
+GET_DEPARTURES_SCHEMA = vol.Schema(
+    {
+        vol.Required(ATTR_STOP_ID): cv.positive_int,
+        vol.Optional(CONF_MAX_DEPARTURES, default=DEFAULT_MAX_DEPARTURES): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=50)
+        ),
+        vol.Optional(ATTR_ROUTE): vol.All(cv.ensure_list_csv, [cv.string]),
+    }
+)
+
+GET_VEHICLE_SCHEMA = vol.Schema(
+    {
+        vol.Required("vehicle_code"): cv.positive_int,
+    }
+)
+
+PLAN_JOURNEY_SCHEMA = vol.Schema(
+    {
+        vol.Required("from_stop_id"): cv.positive_int,
+        vol.Required("to_stop_id"): cv.positive_int,
+        vol.Optional("departure_time"): cv.datetime,
+        vol.Optional("min_transfer", default=2): vol.All(
+            vol.Coerce(float), vol.Range(min=0, max=30)
+        ),
+        vol.Optional("max_options", default=3): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=10)
+        ),
+    }
+)
+
+PROFILE_SCHEMA = vol.Schema(
+    {
+        vol.Optional("refreshes", default=1): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=20)
+        ),
+        vol.Optional("top", default=20): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=100)
+        ),
+    }
+)
+
 
 async def async_setup(hass: HomeAssistant, config: dict[str, Any]) -> bool:
     """Set up ZTM Gdańsk from YAML configuration."""
     hass.data.setdefault(DOMAIN, {})
-    
+    async_register_websocket_commands(hass)
+
+    if API_RECORD_PATH:
+
+        async def async_close_recorders(event: Event) -> None:
+            """Finish API capture files on shutdown."""
+            await hass.async_add_executor_job(close_recorders)
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_close_recorders)
+
     if DOMAIN not in config:
         return True
 
@@ -80,8 +197,9 @@ async def async_setup(hass: HomeAssistant, config: dict[str, Any]) -> bool:
     hass.data[DOMAIN]["stop_ids"] = stop_ids
     hass.data[DOMAIN]["max_departures"] = max_departures
 
-    # Initial data fetch
-    await coordinator.async_config_entry_first_refresh()
+    # Initial data fetch runs in the background, sensors restore their last state
+    await coordinator.async_load_stored_stop_names()
+    hass.async_create_task(coordinator.async_refresh())
 
     # Register services
     await _async_setup_services(hass)
@@ -98,6 +216,7 @@ async def async_setup(hass: HomeAssistant, config: dict[str, Any]) -> bool:
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up ZTM Gdańsk from a config entry (UI)."""
+    setup_start = time.monotonic()
     hass.data.setdefault(DOMAIN, {})
 
     # Get config from entry data or options (options take precedence)
@@ -129,6 +248,13 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     # Get departure format template from options (if configured)
     departure_format = entry.options.get(CONF_DEPARTURE_FORMAT)
 
+    # Get stop groups from options (if configured)
+    stop_groups = entry.options.get(CONF_STOP_GROUPS, {})
+
+    # Get per-stop route/headsign filters from options (if configured)
+    route_filters = entry.options.get(CONF_ROUTE_FILTERS, {})
+    headsign_filters = entry.options.get(CONF_HEADSIGN_FILTERS, {})
+
     _LOGGER.info(
         "Setting up ZTM Gdańsk (UI) with %d stops, interval: %ds, max: %d",
         len(stop_ids),
@@ -138,30 +264,103 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     # Create coordinator
     coordinator = ZTMCoordinator(
-        hass, stop_ids, scan_interval, max_departures, custom_icons, departure_format
+        hass,
+        stop_ids,
+        scan_interval,
+        max_departures,
+        custom_icons,
+        departure_format,
+        stop_groups,
+        route_filters,
+        headsign_filters,
+        storage_id=entry.entry_id,
+    )
+
+    # Opt-in event loop lag monitor (shared by all entries, set up before the
+    # first refresh)
+    if entry.options.get(CONF_LOOP_MONITOR):
+        coordinator.lag_monitor = get_loop_monitor(hass)
+        entry.async_on_unload(
+            coordinator.lag_monitor.async_add_entry(
+                entry.options.get(CONF_LOOP_LAG_THRESHOLD, DEFAULT_LOOP_LAG_THRESHOLD)
+            )
+        )
+
+    # Opt-in hedging of slow departure requests (budget shared by all entries)
+    if entry.options.get(CONF_HEDGE_REQUESTS):
+        coordinator.hedge_budget = get_hedge_budget(hass)
+
+    # Seed stop metadata from storage; the first fetch runs in the background
+    # while sensors show their restored state
+    await coordinator.async_load_stored_stop_names()
+    entry.async_create_background_task(
+        hass, coordinator.async_refresh(), f"{DOMAIN} first refresh"
     )
-    await coordinator.async_config_entry_first_refresh()
 
     # Store data
     hass.data[DOMAIN][entry.entry_id] = {
         "coordinator": coordinator,
         "stop_ids": stop_ids,
         "max_departures": max_departures,
+        "stop_groups": stop_groups,
+        "tracked_routes": entry.options.get(CONF_TRACKED_ROUTES, []),
+        "panel_attribute_budget": entry.options.get(
+            CONF_PANEL_ATTRIBUTE_BUDGET, DEFAULT_PANEL_ATTRIBUTE_BUDGET
+        ),
+        "attribute_format": entry.options.get(
+            CONF_ATTRIBUTE_FORMAT, DEFAULT_ATTRIBUTE_FORMAT
+        ),
     }
 
+    # "Leave now" alerts for stops with a walking time
+    if walking_times := entry.options.get(CONF_WALKING_TIMES):
+        scheduler = DepartureAlertScheduler(hass, coordinator, walking_times)
+        entry.async_on_unload(scheduler.async_start())
+        hass.data[DOMAIN][entry.entry_id]["alerts"] = scheduler
+
     # Register services (once)
     if not hass.services.has_service(DOMAIN, "force_update"):
         await _async_setup_services(hass)
 
     # Setup platforms
+    await _async_migrate_unique_ids(hass, entry)
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
 
+    # Move websocket subscriptions to the new coordinator
+    async_dispatcher_send(hass, SIGNAL_COORDINATORS_CHANGED)
+
     # Listen for options updates
     entry.async_on_unload(entry.add_update_listener(async_reload_entry))
 
+    coordinator.metrics.startup_duration = (time.monotonic() - setup_start) * 1000
+    if coordinator.metrics.startup_duration > STARTUP_TIME_BUDGET * 1000:
+        _LOGGER.warning(
+            "Setup took %.0f ms, over the %.0f ms startup budget",
+            coordinator.metrics.startup_duration,
+            STARTUP_TIME_BUDGET * 1000,
+        )
+    else:
+        _LOGGER.debug("Setup took %.0f ms", coordinator.metrics.startup_duration)
+
     return True
 
 
+async def _async_migrate_unique_ids(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Prefix unique IDs of per-entry entities with the entry ID.
+
+    They used to be the same for every entry, so a second entry could not
+    add its own panel, board, group, metric, line or "leave now" sensors.
+    """
+
+    @callback
+    def _migrate(entity_entry: er.RegistryEntry) -> dict[str, Any] | None:
+        if not entity_entry.unique_id.startswith(ENTRY_SCOPED_UNIQUE_IDS):
+            return None
+        return {"new_unique_id": f"{entry.entry_id}_{entity_entry.unique_id}"}
+
+    await er.async_migrate_entries(hass, entry.entry_id, _migrate)
+
+
 async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
     """Reload config entry when options change."""
     _LOGGER.info("Reloading ZTM Gdańsk due to options change")
@@ -174,57 +373,347 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id, None)
+        async_dispatcher_send(hass, SIGNAL_COORDINATORS_CHANGED)
+        if not get_coordinators(hass):
+            await get_departure_cache(hass).async_close()
 
     return unload_ok
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove stored stop metadata when a config entry is deleted."""
+    await Store(
+        hass, STORAGE_VERSION, STORAGE_KEY_STOPS.format(entry.entry_id)
+    ).async_remove()
+
+
 async def _async_setup_services(hass: HomeAssistant) -> None:
     """Set up services for ZTM Gdańsk."""
 
-    async def refresh_stop_names(call: ServiceCall) -> None:
-        """Refresh stop names cache."""
-        _LOGGER.info("Refreshing stop names cache")
-        
-        # Find all coordinators
-        for key, value in hass.data[DOMAIN].items():
-            if isinstance(value, dict) and "coordinator" in value:
-                coordinator = value["coordinator"]
-                await coordinator.async_refresh_stop_names()
-                await coordinator.async_request_refresh()
-            elif key == "coordinator":
-                await value.async_refresh_stop_names()
-                await value.async_request_refresh()
-
-    async def refresh_vehicles(call: ServiceCall) -> None:
-        """Refresh vehicles cache."""
-        _LOGGER.info("Refreshing vehicles cache")
-
-        # Find all coordinators
-        for key, value in hass.data[DOMAIN].items():
-            if isinstance(value, dict) and "coordinator" in value:
-                coordinator = value["coordinator"]
-                await coordinator.async_refresh_vehicles()
+    async def refresh_stop_names(call: ServiceCall) -> ServiceResponse:
+        """Refresh stop names cache and return what changed."""
+        targets = _async_resolve_target_stops(hass, call)
+        _LOGGER.info("Refreshing stop names cache (stops: %s)", targets or "all")
+
+        async def refresh(coordinator: ZTMCoordinator) -> dict[str, Any] | None:
+            stop_ids = _coordinator_targets(coordinator, targets)
+            if stop_ids is None:
+                changes = await coordinator.async_refresh_stop_names()
                 await coordinator.async_request_refresh()
-            elif key == "coordinator":
-                await value.async_refresh_vehicles()
-                await value.async_request_refresh()
+                return changes
+            if stop_ids:
+                changes = await coordinator.async_refresh_stop_names(stop_ids)
+                coordinator.async_update_listeners()
+                return changes
+            return None
+
+        results = await asyncio.gather(*(refresh(c) for c in get_coordinators(hass)))
+        return _merge_changes(results)
+
+    async def refresh_vehicles(call: ServiceCall) -> ServiceResponse:
+        """Refresh vehicles cache and return what changed."""
+        targets = _async_resolve_target_stops(hass, call)
+        _LOGGER.info("Refreshing vehicles cache (stops: %s)", targets or "all")
+
+        coordinators = get_coordinators(hass)
+        results = await asyncio.gather(*(c.async_refresh_vehicles() for c in coordinators))
+        await _async_refresh_departures(hass, coordinators, targets)
+        return _merge_changes(results)
 
     async def force_update(call: ServiceCall) -> None:
         """Force update of all data."""
-        _LOGGER.info("Forcing data update")
+        targets = _async_resolve_target_stops(hass, call)
+        _LOGGER.info("Forcing data update (stops: %s)", targets or "all")
+
+        await _async_refresh_departures(hass, get_coordinators(hass), targets)
+
+    async def get_departures(call: ServiceCall) -> ServiceResponse:
+        """Return departures of any stop, monitored or not."""
+        stop_id = call.data[ATTR_STOP_ID]
+        coordinators = get_coordinators(hass)
+        if not coordinators:
+            raise HomeAssistantError("ZTM Gdańsk is not set up")
+
+        # Prefer a coordinator monitoring the stop (known name, same icons/format)
+        coordinator = next(
+            (c for c in coordinators if stop_id in c.stop_ids), coordinators[0]
+        )
+        try:
+            departures = await coordinator.async_query_departures(stop_id)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            raise HomeAssistantError(
+                f"Could not fetch departures for stop {stop_id}: {err}"
+            ) from err
+
+        if routes := call.data.get(ATTR_ROUTE):
+            departures = [
+                dep for dep in departures if str(dep.get("routeShortName")) in routes
+            ]
+
+        return {
+            ATTR_STOP_ID: stop_id,
+            ATTR_STOP_NAME: coordinator.get_stop_name(stop_id),
+            ATTR_DEPARTURES: [
+                coordinator.format_departure(dep)
+                for dep in departures[:call.data[CONF_MAX_DEPARTURES]]
+            ],
+        }
+
+    async def get_vehicle(call: ServiceCall) -> ServiceResponse:
+        """Return where a vehicle will be next among the monitored stops."""
+        vehicle_code = call.data["vehicle_code"]
+        coordinators = get_coordinators(hass)
+        if not coordinators:
+            raise HomeAssistantError("ZTM Gdańsk is not set up")
+
+        # A stop monitored by several entries is listed once
+        stops: dict[tuple[str, str], tuple[ZTMCoordinator, dict]] = {}
+        for coordinator in coordinators:
+            for stop_id, dep in coordinator.get_vehicle_departures(vehicle_code):
+                stops.setdefault((stop_id, trip_key(dep)), (coordinator, dep))
+        ordered = sorted(
+            stops.items(), key=lambda item: item[1][1].get("estimatedTime") or ""
+        )
+
+        formatted = [
+            {
+                ATTR_STOP_ID: int(stop_id),
+                ATTR_STOP_NAME: coordinator.get_stop_name(stop_id),
+                **coordinator.format_departure(dep),
+            }
+            for (stop_id, _), (coordinator, dep) in ordered
+        ]
+        return {
+            "vehicle_code": vehicle_code,
+            "next_stop": formatted[0] if formatted else None,
+            "stops": formatted,
+        }
+
+    async def plan_journey(call: ServiceCall) -> ServiceResponse:
+        """Return the earliest-arriving journeys between two monitored stops."""
+        coordinators = get_coordinators(hass)
+        if not coordinators:
+            raise HomeAssistantError("ZTM Gdańsk is not set up")
+
+        origin, target = call.data["from_stop_id"], call.data["to_stop_id"]
+        if origin == target:
+            raise ServiceValidationError("from_stop_id and to_stop_id must differ")
+        for stop_id in (origin, target):
+            if not any(stop_id in c.stop_ids for c in coordinators):
+                raise HomeAssistantError(f"Stop {stop_id} is not monitored")
+
+        index = get_connection_index(hass)
+        journeys = index.plan(
+            str(origin),
+            str(target),
+            parse_start(call.data.get("departure_time")),
+            call.data["min_transfer"] * 60,
+            call.data["max_options"],
+        )
+
+        return {
+            "from_stop_id": origin,
+            "from_stop_name": stop_name(coordinators, origin),
+            "to_stop_id": target,
+            "to_stop_name": stop_name(coordinators, target),
+            "journeys": [journey_as_dict(coordinators, journey) for journey in journeys],
+        }
 
-        for key, value in hass.data[DOMAIN].items():
-            if isinstance(value, dict) and "coordinator" in value:
-                await value["coordinator"].async_request_refresh()
-            elif key == "coordinator":
-                await value.async_request_refresh()
+    async def profile(call: ServiceCall) -> ServiceResponse:
+        """Profile the next N refreshes of every coordinator."""
+        coordinators = get_coordinators(hass)
+        if not coordinators:
+            raise ServiceValidationError("ZTM Gdańsk has no loaded entries to profile")
+        refreshes = call.data["refreshes"]
+        _LOGGER.info("Profiling %d refresh(es) per coordinator", refreshes)
+
+        # cProfile allows one active profiler per thread, so all coordinators
+        # share one and are refreshed sequentially
+        profiler = RefreshProfiler(refreshes * len(coordinators))
+        for coordinator in coordinators:
+            coordinator.profiler = profiler
+            for _ in range(refreshes):
+                await coordinator.async_refresh()
+            coordinator.profiler = None
+
+        path = hass.config.path(
+            f"{DOMAIN}_profile_{dt_util.now().strftime('%Y%m%d_%H%M%S')}.prof"
+        )
+        await hass.async_add_executor_job(profiler.dump, path)
+        _LOGGER.info("Profile written to %s", path)
+
+        return {
+            "file": path,
+            "top": profiler.summary(call.data["top"]),
+        }
 
     hass.services.async_register(
-        DOMAIN, "refresh_stop_names", refresh_stop_names
+        DOMAIN,
+        "refresh_stop_names",
+        refresh_stop_names,
+        schema=TARGET_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        "refresh_vehicles",
+        refresh_vehicles,
+        schema=TARGET_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
     )
     hass.services.async_register(
-        DOMAIN, "refresh_vehicles", refresh_vehicles
+        DOMAIN, "force_update", force_update, schema=TARGET_SCHEMA
     )
     hass.services.async_register(
-        DOMAIN, "force_update", force_update
+        DOMAIN,
+        "get_departures",
+        get_departures,
+        schema=GET_DEPARTURES_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
     )
+    hass.services.async_register(
+        DOMAIN,
+        "get_vehicle",
+        get_vehicle,
+        schema=GET_VEHICLE_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        "plan_journey",
+        plan_journey,
+        schema=PLAN_JOURNEY_SCHEMA,
+        supports_response=SupportsResponse.ONLY,
+    )
+    hass.services.async_register(
+        DOMAIN,
+        "profile",
+        profile,
+        schema=PROFILE_SCHEMA,
+        supports_response=SupportsResponse.OPTIONAL,
+    )
+
+
+
+def _merge_changes(results: list[dict[str, Any] | None]) -> dict[str, Any]:
+    """Merge the index changes reported by several coordinators."""
+    merged: dict[str, Any] = {"version": 0, "updated": False}
+    for result in results:
+        if result is None:
+            continue
+        merged["version"] = max(merged["version"], result["version"])
+        merged["updated"] = merged["updated"] or result["updated"]
+        for kind, keys in result.items():
+            if isinstance(keys, list):
+                merged[kind] = sorted(set(merged.get(kind, [])) | set(keys))
+    return merged
+
+
+@callback
+def _async_resolve_target_stops(
+    hass: HomeAssistant, call: ServiceCall
+) -> set[int] | None:
+    """Return stop IDs targeted by a service call, or None for all stops."""
+    if ATTR_STOP_ID not in call.data and ATTR_ENTITY_ID not in call.data:
+        return None
+
+    targets = set(call.data.get(ATTR_STOP_ID, []))
+    if not call.data.get(ATTR_ENTITY_ID):
+        return targets
+
+    registry = er.async_get(hass)
+    for entity_id in call.data[ATTR_ENTITY_ID]:
+        entry = registry.async_get(entity_id)
+        if entry is None or entry.platform != DOMAIN:
+            _LOGGER.warning("Entity %s is not a ZTM Gdańsk entity", entity_id)
+            continue
+
+        # Per-entry entities are prefixed with the ID of their config entry
+        unique_id = entry.unique_id.removeprefix(f"{entry.config_entry_id}_")
+        entry_data = hass.data[DOMAIN].get(entry.config_entry_id)
+        coordinators = (
+            [entry_data["coordinator"]] if entry_data else get_coordinators(hass)
+        )
+        targets.update(unique_id_stops(unique_id, coordinators))
+    return targets
+
+
+def unique_id_stops(unique_id: str, coordinators: list[ZTMCoordinator]) -> set[int]:
+    """Return the stops an entity of the given coordinators shows.
+
+    unique_id is given without the entry prefix. Lines, groups and panels
+    are resolved first, so a group or panel shard ending in a number is not
+    mistaken for a stop; a stop ID only counts if a coordinator monitors it.
+    """
+    stops: set[int] = set()
+
+    # Line entities target the stops the line currently departs from
+    if unique_id.startswith("ztm_route_"):
+        for coordinator in coordinators:
+            for route, departures in (coordinator.data or {}).get("routes", {}).items():
+                if unique_id == f"ztm_route_{slugify(route)}":
+                    stops.update(int(stop_id) for stop_id, _ in departures)
+        return stops
+
+    if unique_id.startswith("ztm_group_"):
+        for coordinator in coordinators:
+            for group, stop_ids in coordinator.stop_groups.items():
+                if unique_id == f"ztm_group_{slugify(group)}":
+                    stops.update(stop_ids)
+        return stops
+
+    if match := PANEL_UNIQUE_ID.fullmatch(unique_id):
+        shard = int(match.group(1) or 1)
+        for coordinator in coordinators:
+            if shard <= len(coordinator.panel_shards):
+                stops.update(coordinator.panel_shards[shard - 1])
+        return stops
+
+    if match := STOP_UNIQUE_ID.fullmatch(unique_id):
+        stop_id = int(match.group(1))
+        if any(stop_id in coordinator.stop_ids for coordinator in coordinators):
+            stops.add(stop_id)
+    return stops
+
+
+def _coordinator_targets(
+    coordinator: ZTMCoordinator, targets: set[int] | None
+) -> list[int] | None:
+    """Return the targeted stops a coordinator monitors (None means all)."""
+    if targets is None:
+        return None
+    return [stop_id for stop_id in coordinator.stop_ids if stop_id in targets]
+
+
+async def _async_refresh_departures(
+    hass: HomeAssistant, coordinators: list[ZTMCoordinator], targets: set[int] | None
+) -> None:
+    """Refresh departures of all or only the targeted stops.
+
+    Each distinct targeted stop is fetched once and the result is shared by
+    all coordinators monitoring it; coordinators are refreshed concurrently.
+    Coordinators still waiting for their first refresh are refreshed fully.
+    """
+    if targets is None:
+        await asyncio.gather(*(c.async_request_refresh() for c in coordinators))
+        return
+
+    pending = [c for c in coordinators if c.data is None and _coordinator_targets(c, targets)]
+    if pending:
+        await asyncio.gather(*(c.async_request_refresh() for c in pending))
+        coordinators = [c for c in coordinators if c not in pending]
+        if not coordinators:
+            return
+
+    per_coordinator = {c: _coordinator_targets(c, targets) for c in coordinators}
+    distinct = sorted({s for stop_ids in per_coordinator.values() for s in stop_ids})
+    if not distinct:
+        _LOGGER.warning("None of the targeted stops %s are monitored", targets)
+        return
+
+    results = await coordinators[0].async_fetch_departures(distinct)
+    for coordinator, stop_ids in per_coordinator.items():
+        if stop_ids:
+            coordinator.async_update_stop_departures(
+                {str(s): results[str(s)] for s in stop_ids}
+            )
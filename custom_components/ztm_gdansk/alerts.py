@@ -0,0 +1,228 @@
+"""Departure alert scheduler for ZTM Gdańsk."""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import logging
+from typing import Any, Callable
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_point_in_utc_time
+from homeassistant.util import dt as dt_util
+
+from .const import EVENT_DEPARTURE_SOON
+from .coordinator import ZTMCoordinator, departure_key
+
+_LOGGER = logging.getLogger(__name__)
+
+# Heap item kinds
+_LEAVE = 0  # walking deadline reached: alert and switch the stop's binary sensor on
+_DEPART = 1  # vehicle departed: the departure is no longer catchable
+
+
+@dataclass
+class DepartureAlert:
+    """An upcoming departure of a stop with a walking time."""
+
+    stop_id: str
+    key: str
+    departs_at: datetime
+    leave_at: datetime
+    departure: dict[str, Any]
+    fired: bool = False
+
+
+class DepartureAlertScheduler:
+    """Fire alerts exactly when it is time to leave for a departure.
+
+    Deadlines (estimated departure minus the stop's walking time) and
+    departure times are kept in one min-heap with a single timer armed for
+    the earliest entry. A refresh only pushes entries for departures that are
+    new or whose ETA changed; heap items made obsolete by an ETA change are
+    skipped when they come up.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        coordinator: ZTMCoordinator,
+        walking_times: dict[str, int],
+    ) -> None:
+        """Initialize the scheduler."""
+        self.hass = hass
+        self.coordinator = coordinator
+        self.walking_times = walking_times
+        self._alerts: dict[tuple[str, str], DepartureAlert] = {}
+        self._heap: list[tuple[datetime, int, int, tuple[str, str]]] = []
+        self._counter = itertools.count()
+        self._timer: CALLBACK_TYPE | None = None
+        self._timer_at: datetime | None = None
+        self._listeners: dict[str, list[Callable[[], None]]] = {}
+
+    @callback
+    def async_start(self) -> CALLBACK_TYPE:
+        """Follow coordinator updates. Returns a function that stops the scheduler."""
+        unsub = self.coordinator.async_add_listener(self._async_coordinator_updated)
+        if self.coordinator.data is not None:
+            self._async_coordinator_updated()
+
+        @callback
+        def async_stop() -> None:
+            unsub()
+            self._cancel_timer()
+
+        return async_stop
+
+    @callback
+    def async_add_listener(self, stop_id: str, update: Callable[[], None]) -> CALLBACK_TYPE:
+        """Call update whenever the alert state of a stop changes."""
+        self._listeners.setdefault(stop_id, []).append(update)
+
+        @callback
+        def remove() -> None:
+            self._listeners[stop_id].remove(update)
+
+        return remove
+
+    def active_alerts(self, stop_id: str) -> list[DepartureAlert]:
+        """Return departures of a stop it is time to leave for, earliest first."""
+        return sorted(
+            (
+                alert for alert in self._alerts.values()
+                if alert.stop_id == stop_id and alert.fired
+            ),
+            key=lambda alert: alert.departs_at,
+        )
+
+    def next_alert(self, stop_id: str) -> DepartureAlert | None:
+        """Return the next departure of a stop that is not yet due."""
+        pending = [
+            alert for alert in self._alerts.values()
+            if alert.stop_id == stop_id and not alert.fired
+        ]
+        return min(pending, key=lambda alert: alert.leave_at, default=None)
+
+    @callback
+    def _async_coordinator_updated(self) -> None:
+        """Reschedule departures that are new, changed or gone."""
+        now = dt_util.utcnow()
+        seen: set[tuple[str, str]] = set()
+        changed_stops: set[str] = set()
+
+        for stop_id, walking_time in self.walking_times.items():
+            walk = timedelta(minutes=walking_time)
+            for dep in self.coordinator.get_departures(stop_id):
+                departs_at = dt_util.parse_datetime(dep.get("estimatedTime") or "")
+                if departs_at is None or departs_at <= now:
+                    continue
+                key = (stop_id, departure_key(dep))
+                seen.add(key)
+
+                alert = self._alerts.get(key)
+                if alert is None:
+                    alert = DepartureAlert(
+                        stop_id, key[1], departs_at, departs_at - walk, dep,
+                        # Deadlines already passed on first sight do not alert
+                        fired=departs_at - walk <= now,
+                    )
+                    self._alerts[key] = alert
+                    self._push(alert)
+                    changed_stops.add(stop_id)
+                    continue
+
+                alert.departure = dep
+                if alert.departs_at != departs_at:
+                    alert.departs_at = departs_at
+                    alert.leave_at = departs_at - walk
+                    self._push(alert)
+                    changed_stops.add(stop_id)
+
+        for key in [key for key in self._alerts if key not in seen]:
+            alert = self._alerts.pop(key)
+            if alert.fired:
+                changed_stops.add(alert.stop_id)
+
+        # Deadlines an earlier ETA moved into the past fire right away
+        self._process(now, changed_stops)
+
+    def _push(self, alert: DepartureAlert) -> None:
+        """Queue the alert's deadline (unless fired) and departure."""
+        key = (alert.stop_id, alert.key)
+        if not alert.fired:
+            heapq.heappush(self._heap, (alert.leave_at, _LEAVE, next(self._counter), key))
+        heapq.heappush(self._heap, (alert.departs_at, _DEPART, next(self._counter), key))
+
+    @callback
+    def _async_timer_fired(self, now: datetime) -> None:
+        """Handle heap entries that are due."""
+        self._timer = None
+        self._timer_at = None
+        self._process(now, set())
+
+    def _process(self, now: datetime, changed_stops: set[str]) -> None:
+        """Pop due heap entries, fire alerts and notify changed stops."""
+        while self._heap and self._heap[0][0] <= now:
+            when, kind, _, key = heapq.heappop(self._heap)
+            alert = self._alerts.get(key)
+            if alert is None:
+                continue
+            if kind == _LEAVE:
+                # Skip deadlines superseded by a later ETA
+                if alert.fired or alert.leave_at != when:
+                    continue
+                alert.fired = True
+                self._fire_event(alert)
+                changed_stops.add(alert.stop_id)
+            elif alert.departs_at == when:
+                del self._alerts[key]
+                changed_stops.add(alert.stop_id)
+
+        for stop_id in changed_stops:
+            for update in list(self._listeners.get(stop_id, [])):
+                update()
+        self._arm_timer()
+
+    def _fire_event(self, alert: DepartureAlert) -> None:
+        """Fire the departure soon event."""
+        dep = alert.departure
+        self.hass.bus.async_fire(
+            EVENT_DEPARTURE_SOON,
+            {
+                "stop_id": int(alert.stop_id),
+                "stop_name": self.coordinator.get_stop_name(alert.stop_id),
+                "route": dep.get("routeShortName"),
+                "headsign": dep.get("headsign"),
+                "departure_time": alert.departs_at.isoformat(),
+                "leave_at": alert.leave_at.isoformat(),
+                "walking_time": self.walking_times[alert.stop_id],
+                "vehicle_code": dep.get("vehicleCode"),
+            },
+        )
+        _LOGGER.debug(
+            "Departure soon: %s from stop %s at %s",
+            dep.get("routeShortName"),
+            alert.stop_id,
+            alert.departs_at,
+        )
+
+    def _arm_timer(self) -> None:
+        """Arm the timer for the earliest heap entry."""
+        if not self._heap:
+            self._cancel_timer()
+            return
+        when = self._heap[0][0]
+        if self._timer is not None and self._timer_at == when:
+            return
+        self._cancel_timer()
+        self._timer_at = when
+        self._timer = async_track_point_in_utc_time(
+            self.hass, self._async_timer_fired, when
+        )
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer()
+            self._timer = None
+            self._timer_at = None
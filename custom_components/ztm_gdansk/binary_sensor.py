@@ -0,0 +1,89 @@
+"""Binary sensor platform for ZTM Gdańsk."""
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from homeassistant.components.binary_sensor import BinarySensorEntity
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+
+from .alerts import DepartureAlertScheduler
+from .const import ATTR_HEADSIGN, ATTR_ROUTE, ATTR_STOP_ID, DOMAIN
+
+_LOGGER = logging.getLogger(__name__)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up ZTM Gdańsk binary sensors from config entry."""
+    scheduler: DepartureAlertScheduler | None = hass.data[DOMAIN][entry.entry_id].get("alerts")
+    if scheduler is None:
+        return
+
+    async_add_entities(
+        ZTMLeaveNowBinarySensor(scheduler, stop_id, entry.entry_id)
+        for stop_id in scheduler.walking_times
+    )
+
+
+class ZTMLeaveNowBinarySensor(BinarySensorEntity):
+    """On while it is time to leave for a departure from a stop."""
+
+    _attr_has_entity_name = True
+    _attr_should_poll = False
+    _attr_icon = "mdi:walk"
+
+    def __init__(
+        self, scheduler: DepartureAlertScheduler, stop_id: str, entry_id: str
+    ) -> None:
+        """Initialize the binary sensor."""
+        self._scheduler = scheduler
+        self._stop_id = stop_id
+        self._attr_name = "Leave now"
+        self._attr_unique_id = f"{entry_id}_ztm_leave_now_{stop_id}"
+
+    async def async_added_to_hass(self) -> None:
+        """Follow alert state changes of the stop."""
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            self._scheduler.async_add_listener(self._stop_id, self.async_write_ha_state)
+        )
+
+    @property
+    def is_on(self) -> bool:
+        """Return True if a departure is due to leave for."""
+        return bool(self._scheduler.active_alerts(self._stop_id))
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Return the departure to leave for (or the next one) and the walking time."""
+        active = self._scheduler.active_alerts(self._stop_id)
+        alert = active[0] if active else self._scheduler.next_alert(self._stop_id)
+        attributes: dict[str, Any] = {
+            ATTR_STOP_ID: int(self._stop_id),
+            "walking_time": self._scheduler.walking_times[self._stop_id],
+        }
+        if alert is not None:
+            attributes.update({
+                ATTR_ROUTE: alert.departure.get("routeShortName"),
+                ATTR_HEADSIGN: alert.departure.get("headsign"),
+                "departure_time": alert.departs_at.isoformat(),
+                "leave_at": alert.leave_at.isoformat(),
+            })
+        return attributes
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return device info."""
+        return DeviceInfo(
+            identifiers={(DOMAIN, self._stop_id)},
+            name=self._scheduler.coordinator.get_stop_name(self._stop_id),
+            manufacturer="ZTM Gdańsk",
+            model="Przystanek",
+        )
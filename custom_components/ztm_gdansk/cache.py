@@ -0,0 +1,275 @@
+"""Caches shared by ZTM Gdańsk coordinators."""
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+import sys
+import time
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+import aiohttp
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import Event, HomeAssistant
+
+from .const import DEPARTURES_CACHE_SIZE, DEPARTURES_CACHE_TTL, DOMAIN
+from .metrics import FetchRecorder, RefreshMetrics
+from .transport import HttpTransport, Validators, get_transport
+
+_K = TypeVar("_K", bound=Hashable)
+_V = TypeVar("_V")
+
+DATA_DEPARTURE_CACHE = "departure_cache"
+
+
+def approximate_size(value: Any) -> int:
+    """Return the approximate memory footprint of a JSON-like value in bytes."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(k) + approximate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(approximate_size(item) for item in value)
+    return size
+
+
+class TTLCache(Generic[_K, _V]):
+    """Size-bounded LRU cache whose entries expire after a TTL (seconds).
+
+    With ttl=None entries never expire and are only evicted when the cache
+    is full. With size_of, the bytes of all entries are accounted (sizes are
+    computed when a new value is stored).
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float | None,
+        size_of: Callable[[_V], int] | None = None,
+    ) -> None:
+        """Initialize the cache."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self._size_of = size_of
+        self._data: OrderedDict[_K, tuple[float, _V, int]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: _K, max_age: float | None = None) -> _V | None:
+        """Return a value younger than max_age (default: the TTL), or None."""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        if self.ttl is not None or max_age is not None:
+            age = time.monotonic() - item[0]
+            if self.ttl is not None and age > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if max_age is not None and age > max_age:
+                self.misses += 1
+                return None
+        self.hits += 1
+        self._data.move_to_end(key)
+        return item[1]
+
+    def set(self, key: _K, value: _V) -> None:
+        """Store a value, evicting the least recently used entries if full."""
+        previous = self._data.get(key)
+        if previous is not None and previous[1] is value:
+            size = previous[2]
+        else:
+            size = self._size_of(value) if self._size_of else 0
+        if previous is not None:
+            self.bytes -= previous[2]
+        self._data[key] = (time.monotonic(), value, size)
+        self._data.move_to_end(key)
+        self.bytes += size
+        while len(self._data) > self.max_size:
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def pop(self, key: _K) -> _V | None:
+        """Remove and return a value."""
+        if key not in self._data:
+            return None
+        return self._remove(key)
+
+    def _remove(self, key: _K) -> _V:
+        _, value, size = self._data.pop(key)
+        self.bytes -= size
+        return value
+
+    def expire(self) -> int:
+        """Drop expired entries. Returns how many were dropped."""
+        if self.ttl is None:
+            return 0
+        cutoff = time.monotonic() - self.ttl
+        expired = [key for key, item in self._data.items() if item[0] < cutoff]
+        for key in expired:
+            self._remove(key)
+        self.expirations += len(expired)
+        return len(expired)
+
+    def items(self) -> list[tuple[_K, _V]]:
+        """Return non-expired (key, value) pairs, least recently used first."""
+        self.expire()
+        return [(key, item[1]) for key, item in self._data.items()]
+
+    def copy(self) -> TTLCache[_K, _V]:
+        """Return a copy with the same limits and entries."""
+        other: TTLCache[_K, _V] = TTLCache(self.max_size, self.ttl, self._size_of)
+        other._data = self._data.copy()
+        other.bytes = self.bytes
+        return other
+
+    def stats(self) -> dict[str, Any]:
+        """Return size, limits and eviction counters for diagnostics."""
+        return {
+            "entries": len(self._data),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl,
+            "bytes": self.bytes if self._size_of else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def __contains__(self, key: _K) -> bool:
+        """Return True if a non-expired value is stored for key."""
+        item = self._data.get(key)
+        return item is not None and (
+            self.ttl is None or time.monotonic() - item[0] <= self.ttl
+        )
+
+    def __len__(self) -> int:
+        """Return the number of stored entries (including expired ones)."""
+        return len(self._data)
+
+
+class DepartureCache:
+    """Short-lived cache of raw stop departures with request coalescing.
+
+    Concurrent requests for the same stop share one upstream call. The call
+    does not depend on the coordinator that started it: it runs in the
+    cache's own session, and the last response of each stop (body hash,
+    cache validators and decoded departures) is kept here for all of them.
+    """
+
+    def __init__(
+        self, max_size: int, ttl: float, transport: HttpTransport | None = None
+    ) -> None:
+        """Initialize the cache."""
+        self._cache: TTLCache[str, list[dict[str, Any]]] = TTLCache(
+            max_size, ttl, approximate_size
+        )
+        self.responses: TTLCache[
+            str, tuple[bytes, Validators | None, list[dict[str, Any]]]
+        ] = TTLCache(
+            max_size,
+            None,
+            lambda response: len(response[0]) + approximate_size(response[2]),
+        )
+        self._inflight: dict[
+            str, tuple[asyncio.Future[list[dict[str, Any]]], FetchRecorder]
+        ] = {}
+        self._transport = transport or get_transport()
+        self._session: aiohttp.ClientSession | None = None
+        self.hits = 0
+        self.coalesced = 0
+
+    def session(self) -> aiohttp.ClientSession:
+        """Return the session shared fetches run in (opened on first use)."""
+        if self._session is None or self._session.closed:
+            self._session = self._transport.session()
+        return self._session
+
+    async def async_close(self) -> None:
+        """Close the shared session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def async_get(
+        self,
+        stop_id: int | str,
+        fetch: Callable[[FetchRecorder], Awaitable[list[dict[str, Any]]]],
+        max_age: float | None = None,
+        metrics: RefreshMetrics | None = None,
+    ) -> list[dict[str, Any]]:
+        """Return cached departures or fetch them (max_age=0 forces a fetch).
+
+        What the fetch records is applied to the metrics of every caller
+        that waited for it.
+        """
+        key = str(stop_id)
+        if max_age != 0 and (cached := self._cache.get(key, max_age)) is not None:
+            self.hits += 1
+            return cached
+
+        if key in self._inflight:
+            task, recorder = self._inflight[key]
+            self.coalesced += 1
+        else:
+            recorder = FetchRecorder()
+            task = asyncio.ensure_future(self._async_fetch(key, fetch, recorder))
+            self._inflight[key] = (task, recorder)
+            task.add_done_callback(lambda done: self._fetch_done(key, done))
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if metrics is not None and task.done():
+                recorder.apply(metrics)
+
+    async def _async_fetch(
+        self,
+        key: str,
+        fetch: Callable[[FetchRecorder], Awaitable[list[dict[str, Any]]]],
+        recorder: FetchRecorder,
+    ) -> list[dict[str, Any]]:
+        """Fetch departures and store them."""
+        departures = await fetch(recorder)
+        self._cache.set(key, departures)
+        return departures
+
+    def _fetch_done(self, key: str, task: asyncio.Future) -> None:
+        """Forget a finished fetch (its waiters may all have been cancelled)."""
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()
+
+    def set(self, stop_id: int | str, departures: list[dict[str, Any]]) -> None:
+        """Store departures fetched elsewhere."""
+        self._cache.set(str(stop_id), departures)
+
+    def __len__(self) -> int:
+        """Return the number of cached stops."""
+        return len(self._cache)
+
+    def stats(self) -> dict[str, Any]:
+        """Return cache statistics for diagnostics."""
+        return {**self._cache.stats(), "coalesced": self.coalesced}
+
+
+def get_departure_cache(
+    hass: HomeAssistant, transport: HttpTransport | None = None
+) -> DepartureCache:
+    """Return the departure cache shared by all coordinators.
+
+    The transport is only used when the cache is created.
+    """
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if DATA_DEPARTURE_CACHE not in domain_data:
+        cache = domain_data[DATA_DEPARTURE_CACHE] = DepartureCache(
+            DEPARTURES_CACHE_SIZE, DEPARTURES_CACHE_TTL, transport
+        )
+
+        async def _async_close(event: Event) -> None:
+            await cache.async_close()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, _async_close)
+    return domain_data[DATA_DEPARTURE_CACHE]
@@ -10,24 +10,38 @@ import voluptuous as vol
 from homeassistant import config_entries
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.data_entry_flow import FlowResult
-from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers import config_validation as cv, selector
 
 from .const import (
     API_DEPARTURES,
     API_STOPS,
     API_STOPS_GDANSK,
+    ATTRIBUTE_FORMATS,
+    CONF_ATTRIBUTE_FORMAT,
     CONF_DEPARTURE_FORMAT,
+    CONF_HEADSIGN_FILTERS,
+    CONF_HEDGE_REQUESTS,
     CONF_ICON_AIR_CONDITIONING,
     CONF_ICON_BIKE,
     CONF_ICON_KNEELING,
     CONF_ICON_LOW_FLOOR,
     CONF_ICON_USB,
     CONF_ICON_WHEELCHAIR,
+    CONF_LOOP_LAG_THRESHOLD,
+    CONF_LOOP_MONITOR,
     CONF_MAX_DEPARTURES,
+    CONF_PANEL_ATTRIBUTE_BUDGET,
+    CONF_ROUTE_FILTERS,
     CONF_SCAN_INTERVAL,
+    CONF_STOP_GROUPS,
     CONF_STOPS,
+    CONF_TRACKED_ROUTES,
+    CONF_WALKING_TIMES,
+    DEFAULT_ATTRIBUTE_FORMAT,
     DEFAULT_DEPARTURE_FORMAT,
+    DEFAULT_LOOP_LAG_THRESHOLD,
     DEFAULT_MAX_DEPARTURES,
+    DEFAULT_PANEL_ATTRIBUTE_BUDGET,
     DEFAULT_SCAN_INTERVAL,
     DOMAIN,
     ICON_AIR_CONDITIONING,
@@ -37,6 +51,8 @@ from .const import (
     ICON_USB,
     ICON_WHEELCHAIR,
 )
+from .formatting import validate_departure_format
+from .parsing import build_stop_index
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -54,14 +70,14 @@ async def validate_stops(hass: HomeAssistant, stop_ids: list[int]) -> dict[str,
             try:
                 async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
                     if resp.status == 200:
-                        data = await resp.json(content_type=None)
-                        # Find latest date key
-                        date_keys = [k for k in data.keys() if k not in ("lastUpdate", "stops")]
-                        if date_keys:
-                            latest_date = sorted(date_keys, reverse=True)[0]
-                            stops_list = data.get(latest_date, [])
-                            stops_db = {int(stop.get("stopId", 0)): stop for stop in stops_list if stop.get("stopId")}
-                            _LOGGER.debug("Loaded %d stops from database for validation", len(stops_db))
+                        body = await resp.read()
+                        # Decode and index off the event loop
+                        index = await hass.async_add_executor_job(
+                            build_stop_index, body, set(stop_ids)
+                        )
+                        if index:
+                            stops_db = {int(stop_id): info for stop_id, info in index.items()}
+                            _LOGGER.debug("Found %d requested stops in database", len(stops_db))
                             break
             except Exception as err:
                 _LOGGER.debug("Could not load stops from %s: %s", url.split('/')[-1], err)
@@ -88,7 +104,7 @@ async def validate_stops(hass: HomeAssistant, stop_ids: list[int]) -> dict[str,
         for stop_id in stop_ids:
             if stop_id in stops_db:
                 valid_stops.append(stop_id)
-                _LOGGER.debug("Stop %s validated: %s", stop_id, stops_db[stop_id].get("stopName", "Unknown"))
+                _LOGGER.debug("Stop %s validated: %s", stop_id, stops_db[stop_id].get("name", "Unknown"))
             else:
                 _LOGGER.warning("Stop %s not found in stops database", stop_id)
 
@@ -115,6 +131,79 @@ def parse_stops_input(stops_input: str) -> list[int]:
     return stops
 
 
+def parse_stop_groups_input(groups_input: str) -> dict[str, list[int]]:
+    """Parse stop groups input ("Name: id, id" per line) to a dict."""
+    groups = {}
+    for line in groups_input.splitlines():
+        name, sep, stops_str = line.partition(":")
+        name = name.strip()
+        if not sep or not name:
+            continue
+        stops = parse_stops_input(stops_str)
+        if stops:
+            groups[name] = stops
+    return groups
+
+
+def format_stop_groups(groups: dict[str, list[int]]) -> str:
+    """Format stop groups for display in the options form."""
+    return "\n".join(
+        f"{name}: {', '.join(str(s) for s in stops)}" for name, stops in groups.items()
+    )
+
+
+def parse_filters_input(filters_input: str) -> dict[str, dict[str, list[str]]]:
+    """Parse per-stop filters ("stop_id: value, -value" per line) to a dict.
+
+    Values prefixed with "-" are excluded, all others are included.
+    """
+    filters: dict[str, dict[str, list[str]]] = {}
+    for line in filters_input.splitlines():
+        stop_str, sep, values_str = line.partition(":")
+        stop_str = stop_str.strip()
+        if not sep or not stop_str.isdigit():
+            continue
+        rules = filters.setdefault(stop_str, {"include": [], "exclude": []})
+        for value in values_str.split(","):
+            value = value.strip()
+            if value.startswith("-") and value[1:].strip():
+                rules["exclude"].append(value[1:].strip())
+            elif value:
+                rules["include"].append(value)
+    return {stop: rules for stop, rules in filters.items() if any(rules.values())}
+
+
+def format_filters(filters: dict[str, dict[str, list[str]]]) -> str:
+    """Format per-stop filters for display in the options form."""
+    lines = []
+    for stop_id, rules in filters.items():
+        values = rules.get("include", []) + [f"-{v}" for v in rules.get("exclude", [])]
+        lines.append(f"{stop_id}: {', '.join(values)}")
+    return "\n".join(lines)
+
+
+def parse_routes_input(routes_input: str) -> list[str]:
+    """Parse route names separated by commas or spaces (duplicates removed)."""
+    routes = routes_input.replace(",", " ").upper().split()
+    return list(dict.fromkeys(routes))
+
+
+def parse_walking_times_input(walking_input: str) -> dict[str, int]:
+    """Parse walking times ("stop_id: minutes" per line) to a dict."""
+    walking_times = {}
+    for line in walking_input.splitlines():
+        stop_str, sep, minutes_str = line.partition(":")
+        stop_str, minutes_str = stop_str.strip(), minutes_str.strip()
+        if sep and stop_str.isdigit() and minutes_str.isdigit():
+            walking_times[stop_str] = int(minutes_str)
+    return walking_times
+
+
+def format_walking_times(walking_times: dict[str, int]) -> str:
+    """Format walking times for display in the options form."""
+    return "\n".join(f"{stop_id}: {minutes}" for stop_id, minutes in walking_times.items())
+
+
 class ZTMGdanskConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
     """Handle a config flow for ZTM Gdańsk."""
 
@@ -189,7 +278,16 @@ class ZTMGdanskOptionsFlow(config_entries.OptionsFlow):
         """Show options menu."""
         return self.async_show_menu(
             step_id="init",
-            menu_options=["general", "icons", "departure_format"],
+            menu_options=[
+                "general",
+                "icons",
+                "departure_format",
+                "stop_groups",
+                "filters",
+                "routes",
+                "alerts",
+                "advanced",
+            ],
         )
 
     async def async_step_general(
@@ -303,14 +401,21 @@ class ZTMGdanskOptionsFlow(config_entries.OptionsFlow):
         self, user_input: dict[str, Any] | None = None
     ) -> FlowResult:
         """Manage departure string formatting."""
+        errors: dict[str, str] = {}
+
         if user_input is not None:
-            # Merge with existing options (preserve other settings)
-            new_options = dict(self.config_entry.options)
-            new_options.update({
-                CONF_DEPARTURE_FORMAT: user_input.get(CONF_DEPARTURE_FORMAT, DEFAULT_DEPARTURE_FORMAT),
-            })
+            departure_format = user_input.get(CONF_DEPARTURE_FORMAT, DEFAULT_DEPARTURE_FORMAT)
 
-            return self.async_create_entry(title="", data=new_options)
+            if not validate_departure_format(departure_format):
+                errors[CONF_DEPARTURE_FORMAT] = "invalid_format"
+            else:
+                # Merge with existing options (preserve other settings)
+                new_options = dict(self.config_entry.options)
+                new_options.update({
+                    CONF_DEPARTURE_FORMAT: departure_format,
+                })
+
+                return self.async_create_entry(title="", data=new_options)
 
         # Get current format or default
         current_format = self.config_entry.options.get(CONF_DEPARTURE_FORMAT, DEFAULT_DEPARTURE_FORMAT)
@@ -322,4 +427,233 @@ class ZTMGdanskOptionsFlow(config_entries.OptionsFlow):
                     vol.Optional(CONF_DEPARTURE_FORMAT, default=current_format): str,
                 }
             ),
+            errors=errors,
+        )
+
+    async def async_step_stop_groups(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Manage stop groups merged into one departure timeline."""
+        errors: dict[str, str] = {}
+
+        current_stops = self.config_entry.options.get(
+            CONF_STOPS, self.config_entry.data.get(CONF_STOPS, [])
+        )
+
+        if user_input is not None:
+            groups = parse_stop_groups_input(user_input.get(CONF_STOP_GROUPS, ""))
+
+            # Groups can only merge stops that are already monitored
+            unknown = {
+                stop_id
+                for stops in groups.values()
+                for stop_id in stops
+                if stop_id not in current_stops
+            }
+            if unknown:
+                _LOGGER.warning("Stop groups reference unmonitored stops: %s", unknown)
+                errors[CONF_STOP_GROUPS] = "unknown_group_stops"
+            else:
+                # Merge with existing options (preserve other settings)
+                new_options = dict(self.config_entry.options)
+                new_options[CONF_STOP_GROUPS] = groups
+
+                return self.async_create_entry(title="", data=new_options)
+
+        current_groups = format_stop_groups(
+            self.config_entry.options.get(CONF_STOP_GROUPS, {})
+        )
+
+        return self.async_show_form(
+            step_id="stop_groups",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        CONF_STOP_GROUPS,
+                        description={"suggested_value": current_groups},
+                    ): selector.TextSelector(
+                        selector.TextSelectorConfig(multiline=True)
+                    ),
+                }
+            ),
+            errors=errors,
+        )
+
+    async def async_step_filters(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Manage per-stop route and headsign filters."""
+        errors: dict[str, str] = {}
+
+        current_stops = self.config_entry.options.get(
+            CONF_STOPS, self.config_entry.data.get(CONF_STOPS, [])
+        )
+
+        if user_input is not None:
+            route_filters = parse_filters_input(user_input.get(CONF_ROUTE_FILTERS, ""))
+            headsign_filters = parse_filters_input(user_input.get(CONF_HEADSIGN_FILTERS, ""))
+
+            unknown = {
+                int(stop_id)
+                for stop_id in [*route_filters, *headsign_filters]
+                if int(stop_id) not in current_stops
+            }
+            if unknown:
+                _LOGGER.warning("Filters reference unmonitored stops: %s", unknown)
+                errors["base"] = "unknown_filter_stops"
+            else:
+                # Merge with existing options (preserve other settings)
+                new_options = dict(self.config_entry.options)
+                new_options.update({
+                    CONF_ROUTE_FILTERS: route_filters,
+                    CONF_HEADSIGN_FILTERS: headsign_filters,
+                })
+
+                return self.async_create_entry(title="", data=new_options)
+
+        current_routes = format_filters(self.config_entry.options.get(CONF_ROUTE_FILTERS, {}))
+        current_headsigns = format_filters(self.config_entry.options.get(CONF_HEADSIGN_FILTERS, {}))
+
+        return self.async_show_form(
+            step_id="filters",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        CONF_ROUTE_FILTERS,
+                        description={"suggested_value": current_routes},
+                    ): selector.TextSelector(
+                        selector.TextSelectorConfig(multiline=True)
+                    ),
+                    vol.Optional(
+                        CONF_HEADSIGN_FILTERS,
+                        description={"suggested_value": current_headsigns},
+                    ): selector.TextSelector(
+                        selector.TextSelectorConfig(multiline=True)
+                    ),
+                }
+            ),
+            errors=errors,
+        )
+
+    async def async_step_routes(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Manage per-route next departure sensors."""
+        if user_input is not None:
+            # Merge with existing options (preserve other settings)
+            new_options = dict(self.config_entry.options)
+            new_options[CONF_TRACKED_ROUTES] = parse_routes_input(
+                user_input.get(CONF_TRACKED_ROUTES, "")
+            )
+
+            return self.async_create_entry(title="", data=new_options)
+
+        current_routes = ", ".join(self.config_entry.options.get(CONF_TRACKED_ROUTES, []))
+
+        return self.async_show_form(
+            step_id="routes",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        CONF_TRACKED_ROUTES,
+                        description={"suggested_value": current_routes},
+                    ): str,
+                }
+            ),
+        )
+
+    async def async_step_alerts(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Manage per-stop walking times for departure alerts."""
+        errors: dict[str, str] = {}
+
+        current_stops = self.config_entry.options.get(
+            CONF_STOPS, self.config_entry.data.get(CONF_STOPS, [])
+        )
+
+        if user_input is not None:
+            walking_times = parse_walking_times_input(user_input.get(CONF_WALKING_TIMES, ""))
+
+            unknown = {int(s) for s in walking_times if int(s) not in current_stops}
+            if unknown:
+                _LOGGER.warning("Walking times reference unmonitored stops: %s", unknown)
+                errors[CONF_WALKING_TIMES] = "unknown_walking_stops"
+            else:
+                # Merge with existing options (preserve other settings)
+                new_options = dict(self.config_entry.options)
+                new_options[CONF_WALKING_TIMES] = walking_times
+
+                return self.async_create_entry(title="", data=new_options)
+
+        current_walking = format_walking_times(
+            self.config_entry.options.get(CONF_WALKING_TIMES, {})
+        )
+
+        return self.async_show_form(
+            step_id="alerts",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        CONF_WALKING_TIMES,
+                        description={"suggested_value": current_walking},
+                    ): selector.TextSelector(
+                        selector.TextSelectorConfig(multiline=True)
+                    ),
+                }
+            ),
+            errors=errors,
+        )
+
+    async def async_step_advanced(
+        self, user_input: dict[str, Any] | None = None
+    ) -> FlowResult:
+        """Manage diagnostic settings."""
+        if user_input is not None:
+            # Merge with existing options (preserve other settings)
+            new_options = dict(self.config_entry.options)
+            new_options.update({
+                CONF_LOOP_MONITOR: user_input[CONF_LOOP_MONITOR],
+                CONF_LOOP_LAG_THRESHOLD: user_input[CONF_LOOP_LAG_THRESHOLD],
+                CONF_PANEL_ATTRIBUTE_BUDGET: user_input[CONF_PANEL_ATTRIBUTE_BUDGET],
+                CONF_HEDGE_REQUESTS: user_input[CONF_HEDGE_REQUESTS],
+                CONF_ATTRIBUTE_FORMAT: user_input[CONF_ATTRIBUTE_FORMAT],
+            })
+
+            return self.async_create_entry(title="", data=new_options)
+
+        return self.async_show_form(
+            step_id="advanced",
+            data_schema=vol.Schema(
+                {
+                    vol.Optional(
+                        CONF_LOOP_MONITOR,
+                        default=self.config_entry.options.get(CONF_LOOP_MONITOR, False),
+                    ): bool,
+                    vol.Optional(
+                        CONF_LOOP_LAG_THRESHOLD,
+                        default=self.config_entry.options.get(
+                            CONF_LOOP_LAG_THRESHOLD, DEFAULT_LOOP_LAG_THRESHOLD
+                        ),
+                    ): vol.All(vol.Coerce(int), vol.Range(min=10, max=5000)),
+                    vol.Optional(
+                        CONF_PANEL_ATTRIBUTE_BUDGET,
+                        default=self.config_entry.options.get(
+                            CONF_PANEL_ATTRIBUTE_BUDGET, DEFAULT_PANEL_ATTRIBUTE_BUDGET
+                        ),
+                    ): vol.All(
+                        vol.Coerce(int), vol.Any(0, vol.Range(min=2048, max=262144))
+                    ),
+                    vol.Optional(
+                        CONF_HEDGE_REQUESTS,
+                        default=self.config_entry.options.get(CONF_HEDGE_REQUESTS, False),
+                    ): bool,
+                    vol.Optional(
+                        CONF_ATTRIBUTE_FORMAT,
+                        default=self.config_entry.options.get(
+                            CONF_ATTRIBUTE_FORMAT, DEFAULT_ATTRIBUTE_FORMAT
+                        ),
+                    ): vol.In(ATTRIBUTE_FORMATS),
+                }
+            ),
         )
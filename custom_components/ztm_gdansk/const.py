@@ -1,5 +1,6 @@
 """Constants for ZTM Gdańsk integration."""
 from datetime import timedelta
+import os
 
 DOMAIN = "ztm_gdansk"
 
@@ -9,13 +10,55 @@ API_STOPS = "https://ckan.multimediagdansk.pl/dataset/c24aa637-3619-4dc2-a171-a2
 API_STOPS_GDANSK = "https://ckan.multimediagdansk.pl/dataset/c24aa637-3619-4dc2-a171-a23eec8f2172/resource/d3e96eb6-25ad-4d6c-8651-b1eb39155945/download/stopsingdansk.json"
 API_VEHICLES = "https://files.cloudgdansk.pl/d/otwarte-dane/ztm/baza-pojazdow.json?v=2"
 
+# Override all endpoints with a single base URL (used by scale_harness.py
+# to point the integration at a local fake API server)
+API_BASE_OVERRIDE = os.environ.get("ZTM_GDANSK_API_BASE")
+if API_BASE_OVERRIDE:
+    _base = API_BASE_OVERRIDE.rstrip("/")
+    API_DEPARTURES = f"{_base}/departures"
+    API_STOPS = f"{_base}/stops.json"
+    API_STOPS_GDANSK = f"{_base}/stopsingdansk.json"
+    API_VEHICLES = f"{_base}/baza-pojazdow.json"
+
+# Append every API response to this gzip JSONL capture (see transport.py)
+API_RECORD_PATH = os.environ.get("ZTM_GDANSK_RECORD")
+
 # Update intervals
 SCAN_INTERVAL_DEPARTURES = timedelta(seconds=30)
 SCAN_INTERVAL_STOPS = timedelta(hours=24)
 
+# Storage
+STORAGE_VERSION = 1
+STORAGE_KEY_STOPS = DOMAIN + ".{}.stops"  # formatted with entry ID or "yaml"
+STORAGE_SAVE_DELAY = 10  # seconds
+SNAPSHOT_FILE = DOMAIN + ".{}.snapshot"  # formatted with the source name, in .storage
+
+# Shared raw departures cache (used by the get_departures service)
+DEPARTURES_CACHE_SIZE = 200  # stops
+DEPARTURES_CACHE_TTL = SCAN_INTERVAL_DEPARTURES.total_seconds()
+
+# Per-coordinator cache bounds
+CACHE_EXTRA_STOPS = 50  # entries kept for unmonitored stops on top of monitored ones
+FALLBACK_DEPARTURES_TTL = 900  # seconds cached departures may be shown after failures
+SNAPSHOT_DECODED_RECORDS = 256  # decoded stop/vehicle records kept per snapshot
+
+# Hedged departure requests (opt-in, see hedging.py)
+HEDGE_BUDGET_RATIO = 0.1  # hedges earned per request, i.e. at most 10% extra requests
+HEDGE_BUDGET_BURST = 5  # hedges that may be sent in a row
+HEDGE_MIN_SAMPLES = 10  # latencies of a stop recorded before its requests are hedged
+HEDGE_MIN_DELAY = 0.1  # seconds, lower bound of the p95 hedge delay
+
+# Event loop lag monitor (opt-in, see loop_monitor.py)
+LOOP_MONITOR_INTERVAL = 0.05  # seconds between ticks
+LOOP_MONITOR_STALLS = 50  # stalls kept for diagnostics
+
+# Time async_setup_entry may take before a warning is logged
+STARTUP_TIME_BUDGET = 0.5  # seconds
+
 # Retry configuration
 MAX_RETRIES = 3
 RETRY_DELAY = 1.0  # seconds
+REQUEST_TIMEOUT = 15  # seconds per departures request
 
 # Config keys
 CONF_STOPS = "stops"
@@ -28,12 +71,43 @@ CONF_ICON_AIR_CONDITIONING = "icon_air_conditioning"
 CONF_ICON_USB = "icon_usb"
 CONF_ICON_KNEELING = "icon_kneeling"
 CONF_DEPARTURE_FORMAT = "departure_format"
+CONF_STOP_GROUPS = "stop_groups"
+CONF_ROUTE_FILTERS = "route_filters"
+CONF_HEADSIGN_FILTERS = "headsign_filters"
+CONF_TRACKED_ROUTES = "tracked_routes"
+CONF_WALKING_TIMES = "walking_times"
+CONF_LOOP_MONITOR = "loop_monitor"
+CONF_LOOP_LAG_THRESHOLD = "loop_lag_threshold"
+CONF_PANEL_ATTRIBUTE_BUDGET = "panel_attribute_budget"
+CONF_HEDGE_REQUESTS = "hedge_requests"
+CONF_ATTRIBUTE_FORMAT = "attribute_format"
 
 # Defaults
 DEFAULT_SCAN_INTERVAL = 30
 DEFAULT_MAX_DEPARTURES = 5
+DEFAULT_LOOP_LAG_THRESHOLD = 100  # ms
+DEFAULT_PANEL_ATTRIBUTE_BUDGET = 0  # bytes; 0 keeps one unsharded panel
+
+# Departure lists in stop and panel attributes: a list of dicts, or a schema
+# and one array per field
+ATTRIBUTE_FORMAT_RECORDS = "records"
+ATTRIBUTE_FORMAT_COLUMNAR = "columnar"
+ATTRIBUTE_FORMATS = [ATTRIBUTE_FORMAT_RECORDS, ATTRIBUTE_FORMAT_COLUMNAR]
+DEFAULT_ATTRIBUTE_FORMAT = ATTRIBUTE_FORMAT_RECORDS
+
+# Estimated serialized size of panel attributes, used to shard stops across panels
+PANEL_BASE_BYTES = 800  # totals and icon legend
+PANEL_STOP_BYTES = 250  # stop metadata
+PANEL_DEPARTURE_BYTES = 650  # formatted departure and its by_route entry
+PANEL_DEPARTURE_BYTES_COLUMNAR = 300  # the same in the columnar attribute format
 DEFAULT_DEPARTURE_FORMAT = "{route} → {headsign} | {time} ({minutes} min)"
 
+# Events
+EVENT_DEPARTURE_SOON = f"{DOMAIN}_departure_soon"
+
+# Dispatcher signal sent when a config entry's coordinator is set up or unloaded
+SIGNAL_COORDINATORS_CHANGED = f"{DOMAIN}_coordinators_changed"
+
 # Attributes
 ATTR_STOP_NAME = "stop_name"
 ATTR_STOP_ID = "stop_id"
@@ -2,12 +2,19 @@
 from __future__ import annotations
 
 import asyncio
+from contextlib import contextmanager
+import hashlib
+import heapq
+import json
 import logging
+import re
 from datetime import datetime, timedelta
-from typing import Any
+import time
+from typing import Any, Awaitable, Callable, Iterable, Iterator, Mapping
 
 import aiohttp
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import STORAGE_DIR, Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 from homeassistant.util import dt as dt_util
 
@@ -16,7 +23,10 @@ from .const import (
     API_STOPS,
     API_STOPS_GDANSK,
     API_VEHICLES,
+    CACHE_EXTRA_STOPS,
+    DEFAULT_DEPARTURE_FORMAT,
     DOMAIN,
+    FALLBACK_DEPARTURES_TTL,
     ICON_AIR_CONDITIONING,
     ICON_BIKE,
     ICON_KNEELING,
@@ -24,12 +34,184 @@ from .const import (
     ICON_USB,
     ICON_WHEELCHAIR,
     MAX_RETRIES,
+    REQUEST_TIMEOUT,
     RETRY_DELAY,
     SCAN_INTERVAL_DEPARTURES,
+    SCAN_INTERVAL_STOPS,
+    SNAPSHOT_FILE,
+    STORAGE_KEY_STOPS,
+    STORAGE_SAVE_DELAY,
+    STORAGE_VERSION,
 )
+from .cache import TTLCache, approximate_size, get_departure_cache
+from .formatting import DepartureFormatter
+from .hedging import HedgeBudget, async_hedged, hedge_delay
+from .loop_monitor import LoopLagMonitor
+from .metrics import FetchRecorder, RefreshMetrics
+from .snapshot import (
+    STOP_COLUMNS,
+    VEHICLE_COLUMNS,
+    CompactIndex,
+    build_stop_snapshot,
+    build_vehicle_snapshot,
+    diff_indexes,
+    open_snapshot,
+)
+from .profiler import RefreshProfiler
+from .transport import HttpTransport, get_transport
 
 _LOGGER = logging.getLogger(__name__)
 
+_MARKDOWN_SPECIAL = re.compile(r"([\\`*_\[\]|<>#])")
+
+DATA_SNAPSHOT_DOWNLOADS = "snapshot_downloads"
+
+
+def escape_markdown(text: str) -> str:
+    """Escape characters that markdown would interpret."""
+    return _MARKDOWN_SPECIAL.sub(r"\\\1", text)
+
+
+def get_coordinators(hass: HomeAssistant) -> list[ZTMCoordinator]:
+    """Return all coordinators (UI entries and YAML setup)."""
+    coordinators = []
+    for key, value in hass.data.get(DOMAIN, {}).items():
+        if isinstance(value, dict) and "coordinator" in value:
+            coordinators.append(value["coordinator"])
+        elif key == "coordinator":
+            coordinators.append(value)
+    return coordinators
+
+
+async def async_download_snapshot(
+    hass: HomeAssistant, path: str, download: Callable[[], Awaitable[CompactIndex]]
+) -> CompactIndex:
+    """Download and index a stops or vehicles database once for concurrent callers.
+
+    The databases are the same for every entry, so when all coordinators
+    refresh them at once (e.g. from a service call) the first caller's
+    download is shared by the others instead of each downloading it again.
+    """
+    inflight: dict[str, asyncio.Future[CompactIndex]] = hass.data.setdefault(
+        DOMAIN, {}
+    ).setdefault(DATA_SNAPSHOT_DOWNLOADS, {})
+    task = inflight.get(path)
+    if task is None:
+        task = asyncio.ensure_future(download())
+        inflight[path] = task
+
+        def _done(done: asyncio.Future[CompactIndex]) -> None:
+            inflight.pop(path, None)
+            if not done.cancelled():
+                done.exception()
+
+        task.add_done_callback(_done)
+    return await asyncio.shield(task)
+
+
+def trip_key(dep: dict[str, Any]) -> str:
+    """Return a key identifying the trip a departure belongs to."""
+    return f"{dep.get('routeId')}:{dep.get('tripId')}:{dep.get('scheduledTripStartTime')}"
+
+
+def _tagged(stop_id: str, departures: list[dict]) -> Iterator[tuple[str, dict]]:
+    """Yield departures of a stop tagged with its ID."""
+    for dep in departures:
+        yield stop_id, dep
+
+
+def merge_departures(
+    departures: dict[str, list[dict]],
+    stop_ids: list[int | str],
+    limit: int,
+    dedupe: bool = True,
+) -> list[tuple[str, dict]]:
+    """Merge time-sorted per-stop departures into one stream of (stop ID, departure).
+
+    Uses a lazy k-way merge and stops after `limit` departures. With dedupe,
+    a trip seen at several stops of the group is only listed at its earliest
+    departure.
+    """
+    streams = [
+        _tagged(str(stop_id), departures.get(str(stop_id), []))
+        for stop_id in dict.fromkeys(stop_ids)
+    ]
+    merged: list[tuple[str, dict]] = []
+    seen: set[str] = set()
+    for stop_id, dep in heapq.merge(
+        *streams, key=lambda item: item[1].get("estimatedTime") or ""
+    ):
+        if dedupe:
+            key = trip_key(dep) if dep.get("tripId") is not None else departure_key(dep)
+            if key in seen:
+                continue
+            seen.add(key)
+        merged.append((stop_id, dep))
+        if len(merged) >= limit:
+            break
+    return merged
+
+
+def _same_departures(
+    previous: dict[str, list[dict]], departures: dict[str, list[dict]]
+) -> bool:
+    """Return True if every stop has the very same departures list as before."""
+    return previous.keys() == departures.keys() and all(
+        departures[stop_id] is previous[stop_id] for stop_id in departures
+    )
+
+
+def build_route_index(
+    departures: dict[str, list[dict]], limit: int
+) -> dict[str, list[tuple[str, dict]]]:
+    """Index departures by route: route -> time-ordered (stop ID, departure).
+
+    Each route keeps its first `limit` departures across all stops. A trip
+    passing several stops is listed at each of them.
+    """
+    per_route: dict[str, dict[str, list[dict]]] = {}
+    for stop_id, stop_departures in departures.items():
+        for dep in stop_departures:
+            route = str(dep.get("routeShortName", "?"))
+            per_route.setdefault(route, {}).setdefault(stop_id, []).append(dep)
+    return {
+        route: merge_departures(stops, list(stops), limit, dedupe=False)
+        for route, stops in per_route.items()
+    }
+
+
+def build_trip_index(
+    departures: dict[str, list[dict]],
+) -> tuple[dict[str, list[tuple[str, dict]]], dict[str, list[str]]]:
+    """Index departures by trip and vehicle across all stops.
+
+    Returns trip key -> time-ordered (stop ID, departure) and vehicle code ->
+    keys of its trips in time order. Departures without a vehicle code are
+    only indexed by trip.
+    """
+    trips: dict[str, list[tuple[str, dict]]] = {}
+    for stop_id, stop_departures in departures.items():
+        for dep in stop_departures:
+            if dep.get("tripId") is not None:
+                trips.setdefault(trip_key(dep), []).append((stop_id, dep))
+
+    vehicles: dict[str, list[str]] = {}
+    for key, stops in trips.items():
+        stops.sort(key=lambda item: item[1].get("estimatedTime") or "")
+        if vehicle_code := stops[0][1].get("vehicleCode"):
+            vehicles.setdefault(str(vehicle_code), []).append(key)
+    for keys in vehicles.values():
+        keys.sort(key=lambda key: trips[key][0][1].get("estimatedTime") or "")
+    return trips, vehicles
+
+
+def departure_key(dep: dict[str, Any]) -> str:
+    """Return a key identifying a departure across refreshes."""
+    dep_id = dep.get("id")
+    if dep_id:
+        return str(dep_id)
+    return f"{dep.get('routeId')}:{dep.get('tripId')}:{dep.get('theoreticalTime')}"
+
 
 class ZTMCoordinator(DataUpdateCoordinator[dict[str, Any]]):
     """Coordinator for fetching ZTM departure data."""
@@ -42,6 +224,11 @@ class ZTMCoordinator(DataUpdateCoordinator[dict[str, Any]]):
         max_departures: int = 5,
         custom_icons: dict[str, str] | None = None,
         departure_format: str | None = None,
+        stop_groups: dict[str, list[int]] | None = None,
+        route_filters: dict[str, dict[str, list[str]]] | None = None,
+        headsign_filters: dict[str, dict[str, list[str]]] | None = None,
+        storage_id: str | None = None,
+        transport: HttpTransport | None = None,
     ) -> None:
         """Initialize the coordinator."""
         super().__init__(
@@ -52,11 +239,51 @@ class ZTMCoordinator(DataUpdateCoordinator[dict[str, Any]]):
         )
         self.stop_ids = stop_ids
         self.max_departures = max_departures
-        self._stop_names_cache: dict[str, dict[str, Any]] = {}
+        self.stop_groups = stop_groups or {}
+        self.route_filters = route_filters or {}
+        self.headsign_filters = {
+            stop_id: {
+                mode: [headsign.casefold() for headsign in headsigns]
+                for mode, headsigns in rules.items()
+            }
+            for stop_id, rules in (headsign_filters or {}).items()
+        }
+        self._stop_names_cache: TTLCache[str, dict[str, Any]] = TTLCache(
+            len(self.stop_ids) + CACHE_EXTRA_STOPS, None, approximate_size
+        )
         self._stop_names_loaded = False
-        self._vehicles_cache: dict[str, dict[str, Any]] = {}
+        self._stop_names_fetched_at: datetime | None = None
+        self._stop_snapshots: dict[str, CompactIndex] = {}  # Whole stops DBs by source
+        self._stop_store: Store[dict[str, Any]] = Store(
+            hass, STORAGE_VERSION, STORAGE_KEY_STOPS.format(storage_id or "yaml")
+        )
+        self._vehicles_cache: Mapping[str, dict[str, Any]] = {}
         self._vehicles_loaded = False
-        self._last_valid_departures: dict[str, list[dict]] = {}  # Cache last valid data
+        # Version and change counts of the last swap of each index
+        self.index_versions: dict[str, dict[str, Any]] = {
+            "stops": {"version": 0},
+            "vehicles": {"version": 0},
+        }
+        # Last successfully fetched departures per stop, shown when a refresh fails
+        self._last_valid_departures: TTLCache[str, list[dict]] = TTLCache(
+            len(self.stop_ids), FALLBACK_DEPARTURES_TTL, approximate_size
+        )
+        # Last filter result per stop, reused while its unfiltered list is unchanged
+        self._filtered_departures: TTLCache[str, tuple[list[dict], list[dict]]] = TTLCache(
+            len(self.stop_ids), None
+        )
+        self._transport = transport or get_transport()
+        self._departure_cache = get_departure_cache(hass, self._transport)
+        self.metrics = RefreshMetrics(self.stop_ids)
+        self.profiler: RefreshProfiler | None = None
+        self.hedge_budget: HedgeBudget | None = None  # set to hedge slow requests
+        self.lag_monitor: LoopLagMonitor | None = None
+        self._board: dict[str, str] = {}
+        # Measured serialized attribute sizes of panel sensors (entity ID -> report)
+        self.attribute_sizes: dict[str, dict[str, int]] = {}
+        # Stops of each panel sensor shard, set by the sensor platform
+        self.panel_shards: list[list[int]] = []
+        self._board_data: dict[str, Any] | None = None
 
         # Store custom icons or use defaults
         self._icons = {
@@ -68,126 +295,321 @@ class ZTMCoordinator(DataUpdateCoordinator[dict[str, Any]]):
             "kneeling": (custom_icons or {}).get("kneeling", ICON_KNEELING),
         }
 
-        # Store departure format template (import needed for default)
-        from .const import DEFAULT_DEPARTURE_FORMAT
-        self._departure_format = departure_format or DEFAULT_DEPARTURE_FORMAT
+        # Compile departure format template once
+        try:
+            self._formatter = DepartureFormatter(departure_format or DEFAULT_DEPARTURE_FORMAT)
+        except ValueError as err:
+            _LOGGER.warning("%s, using default format", err)
+            self._formatter = DepartureFormatter(DEFAULT_DEPARTURE_FORMAT)
+
+    async def _async_refresh(self, *args: Any, **kwargs: Any) -> None:
+        """Refresh data, profiling the cycle when a profiler is armed."""
+        profiler = self.profiler
+        if profiler is None:
+            await super()._async_refresh(*args, **kwargs)
+            return
+
+        with profiler.capture():
+            await super()._async_refresh(*args, **kwargs)
+        if profiler.finished and self.profiler is profiler:
+            self.profiler = None
 
     async def _async_update_data(self) -> dict[str, Any]:
         """Fetch data from API."""
+        if self.lag_monitor is not None:
+            with self.lag_monitor.watch():
+                return await self._async_fetch_and_measure()
+        return await self._async_fetch_and_measure()
+
+    async def _async_fetch_and_measure(self) -> dict[str, Any]:
+        """Fetch data, recording the refresh in the metrics."""
+        self.metrics.start_refresh()
+        try:
+            return await self._async_fetch_data()
+        finally:
+            self.metrics.finish_refresh()
+
+    @callback
+    def async_update_listeners(self) -> None:
+        """Update all registered listeners, timing the state write fan-out."""
+        with self.blocking_span("state_write"):
+            super().async_update_listeners()
+
+    @contextmanager
+    def blocking_span(self, phase: str, entity_id: str | None = None) -> Iterator[None]:
+        """Time a synchronous phase for the metrics and the loop lag monitor."""
+        with self.metrics.span(phase):
+            if self.lag_monitor is None:
+                yield
+            else:
+                with self.lag_monitor.section(phase, entity_id):
+                    yield
+
+    async def _async_fetch_data(self) -> dict[str, Any]:
+        """Fetch stop names, vehicles and departures, falling back to cache."""
         try:
-            # Lazy load stop names on first run
+            # Lazy load stop names on first run (stored names older than a day are refetched)
             if not self._stop_names_loaded:
-                await self._load_stop_names()
+                with self.metrics.span("stop_names"):
+                    await self._load_stop_names(refetch=self._stop_names_fetched_at is None)
                 self._stop_names_loaded = True
 
             # Lazy load vehicles database on first run
             if not self._vehicles_loaded:
-                success = await self._load_vehicles()
+                with self.metrics.span("vehicles"):
+                    success = await self._load_vehicles()
                 if success:
                     self._vehicles_loaded = True
 
             # Fetch departures for all stops
-            departures = await self._fetch_all_departures()
+            with self.metrics.span("fetch"):
+                departures = await self._fetch_all_departures()
 
-            # Store valid departures as cache
-            self._last_valid_departures = departures
-
-            return {
-                "departures": departures,
-                "stop_names": self._stop_names_cache,
-                "last_update": datetime.now().isoformat(),
-            }
+            return self._build_data(departures)
 
         except (aiohttp.ClientError, asyncio.TimeoutError) as err:
             # If we have cached data, return it instead of failing
-            if self._last_valid_departures:
+            if (cached := self._cached_departures()) is not None:
+                self.metrics.incr("fallbacks")
                 _LOGGER.warning(
                     "API error, using cached departures: %s",
                     err
                 )
-                return {
-                    "departures": self._last_valid_departures,
-                    "stop_names": self._stop_names_cache,
-                    "last_update": datetime.now().isoformat(),
-                }
+                return self._build_data(cached)
             # No cached data available, fail
             raise UpdateFailed(f"Error communicating with API: {err}") from err
         except Exception as err:
             # For other errors, try to use cache
-            if self._last_valid_departures:
+            if (cached := self._cached_departures()) is not None:
+                self.metrics.incr("fallbacks")
                 _LOGGER.warning(
                     "Error fetching data, using cached departures: %s",
                     err
                 )
-                return {
-                    "departures": self._last_valid_departures,
-                    "stop_names": self._stop_names_cache,
-                    "last_update": datetime.now().isoformat(),
-                }
+                return self._build_data(cached)
             raise UpdateFailed(f"Error fetching data: {err}") from err
 
+    def _cached_departures(self) -> dict[str, list[dict]] | None:
+        """Return the last valid departures of all stops, or None if none are cached.
+
+        Departures cached longer than FALLBACK_DEPARTURES_TTL are not shown.
+        """
+        departures = {}
+        for stop_id in self.stop_ids:
+            departures[str(stop_id)] = self._last_valid_departures.get(str(stop_id))
+        if all(cached is None for cached in departures.values()):
+            return None
+        return {stop_id: cached or [] for stop_id, cached in departures.items()}
+
+    def _build_data(self, departures: dict[str, list[dict]]) -> dict[str, Any]:
+        """Build coordinator data from per-stop departures.
+
+        Groups and the route index are reused if no stop's departures changed.
+        """
+        previous = self.data
+        if previous is not None and _same_departures(previous["departures"], departures):
+            groups = previous["groups"]
+            routes = previous["routes"]
+            trips = previous["trips"]
+            vehicle_trips = previous["vehicle_trips"]
+        else:
+            with self.blocking_span("groups"):
+                groups = {
+                    name: merge_departures(departures, stop_ids, self.max_departures)
+                    for name, stop_ids in self.stop_groups.items()
+                }
+
+            with self.blocking_span("routes"):
+                routes = build_route_index(departures, self.max_departures)
+
+            with self.blocking_span("trips"):
+                trips, vehicle_trips = build_trip_index(departures)
+
+        return {
+            "departures": departures,
+            "groups": groups,
+            "routes": routes,
+            "trips": trips,
+            "vehicle_trips": vehicle_trips,
+            "stop_names": self._stop_names_cache,
+            "last_update": datetime.now().isoformat(),
+        }
+
     async def _fetch_all_departures(self) -> dict[str, list[dict]]:
         """Fetch departures for all configured stops."""
         departures = {}
 
-        async with aiohttp.ClientSession() as session:
-            tasks = [
-                self._fetch_stop_departures(session, stop_id)
-                for stop_id in self.stop_ids
-            ]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            for stop_id, result in zip(self.stop_ids, results):
-                stop_id_str = str(stop_id)
-                if isinstance(result, Exception):
-                    # Try to use cached data for this stop
-                    if stop_id_str in self._last_valid_departures:
-                        _LOGGER.warning(
-                            "Failed to fetch departures for stop %s: %s. Using cached data.",
-                            stop_id,
-                            result
-                        )
-                        departures[stop_id_str] = self._last_valid_departures[stop_id_str]
-                    else:
-                        _LOGGER.warning(
-                            "Failed to fetch departures for stop %s: %s. No cached data available.",
-                            stop_id,
-                            result
-                        )
-                        departures[stop_id_str] = []
+        tasks = [self._fetch_stop_departures(stop_id) for stop_id in self.stop_ids]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        for stop_id, result in zip(self.stop_ids, results):
+            stop_id_str = str(stop_id)
+            if isinstance(result, Exception):
+                # Try to use cached data for this stop
+                cached = self._last_valid_departures.get(stop_id_str)
+                if cached is not None:
+                    self.metrics.incr("fallbacks")
+                    _LOGGER.warning(
+                        "Failed to fetch departures for stop %s: %s. Using cached data.",
+                        stop_id,
+                        result
+                    )
+                    departures[stop_id_str] = cached
                 else:
-                    departures[stop_id_str] = result
+                    _LOGGER.warning(
+                        "Failed to fetch departures for stop %s: %s. No cached data available.",
+                        stop_id,
+                        result
+                    )
+                    departures[stop_id_str] = []
+            else:
+                departures[stop_id_str] = result
+                self._last_valid_departures.set(stop_id_str, result)
 
         return departures
 
-    async def _fetch_stop_departures(
-        self, session: aiohttp.ClientSession, stop_id: int
+    async def async_fetch_departures(
+        self, stop_ids: list[int]
+    ) -> dict[str, list[dict] | BaseException]:
+        """Fetch unfiltered departures for the given stops concurrently."""
+        results = await asyncio.gather(
+            *(self._request_cached_departures(stop_id, 0) for stop_id in stop_ids),
+            return_exceptions=True,
+        )
+        return {str(stop_id): result for stop_id, result in zip(stop_ids, results)}
+
+    async def async_query_departures(self, stop_id: int) -> list[dict]:
+        """Return unfiltered departures of any stop, served from the shared cache when fresh."""
+        return await self._request_cached_departures(stop_id)
+
+    async def _request_cached_departures(
+        self, stop_id: int, max_age: float | None = None
+    ) -> list[dict]:
+        """Fetch unfiltered departures through the shared cache.
+
+        max_age=0 always fetches, but still joins a request for the same stop
+        that is already in flight.
+        """
+        return await self._departure_cache.async_get(
+            stop_id,
+            lambda recorder: self._request_stop_departures(stop_id, recorder),
+            max_age,
+            self.metrics,
+        )
+
+    @callback
+    def async_update_stop_departures(
+        self, results: dict[str, list[dict] | BaseException]
+    ) -> None:
+        """Merge freshly fetched departures of some stops into the current data.
+
+        Results for stops this coordinator does not monitor are ignored and
+        failed fetches keep the previous departures. Before the first refresh
+        has finished there is nothing to merge into, so nothing is published
+        (it would drop all other stops); use a full refresh instead.
+        """
+        if self.data is None:
+            _LOGGER.debug("No data to merge stop departures into yet, skipping")
+            return
+        monitored = {str(stop_id) for stop_id in self.stop_ids}
+        departures = dict(self.data["departures"])
+        for stop_id, result in results.items():
+            if stop_id not in monitored:
+                continue
+            if isinstance(result, BaseException):
+                _LOGGER.warning(
+                    "Failed to refresh departures for stop %s: %s", stop_id, result
+                )
+                continue
+            departures[stop_id] = self._filter_departures(int(stop_id), result)
+            self._last_valid_departures.set(stop_id, departures[stop_id])
+
+        self.async_set_updated_data(self._build_data(departures))
+
+    async def _fetch_stop_departures(self, stop_id: int) -> list[dict]:
+        """Fetch departures for a single stop and apply its filters."""
+        departures = await self._request_cached_departures(stop_id, 0)
+        previous = self._filtered_departures.get(str(stop_id))
+        if previous is not None and previous[0] is departures:
+            return previous[1]
+        filtered = self._filter_departures(stop_id, departures)
+        self._filtered_departures.set(str(stop_id), (departures, filtered))
+        return filtered
+
+    async def _request_stop_departures(
+        self, stop_id: int, recorder: FetchRecorder
     ) -> list[dict]:
-        """Fetch departures for a single stop with retry logic."""
+        """Fetch unfiltered departures for a single stop with retry logic.
+
+        Requests are conditional (ETag / Last-Modified) where the server sends
+        validators. A 304 response, or a body identical to the previous one,
+        returns the previously decoded list without decoding any JSON.
+
+        With hedging enabled, a request taking longer than the stop's p95
+        latency is sent again and the first response wins.
+
+        The request may be shared by several coordinators, so it only uses
+        the shared cache's session and responses, and records its metrics
+        into recorder.
+        """
         url = f"{API_DEPARTURES}?stopId={stop_id}"
+        session = self._departure_cache.session()
+        responses = self._departure_cache.responses
         last_error = None
 
         for attempt in range(MAX_RETRIES):
+            start = time.perf_counter()
+            previous = responses.get(str(stop_id))
+            sent = previous[1] if previous else None
             try:
-                async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as response:
-                    response.raise_for_status()
-                    data = await response.json(content_type=None)
-                    departures = data.get("departures", [])
-
-                    # Log retry success
-                    if attempt > 0:
-                        _LOGGER.info(
-                            "Successfully fetched departures for stop %s on attempt %d/%d",
-                            stop_id,
-                            attempt + 1,
-                            MAX_RETRIES
-                        )
-
-                    return departures
+                delay = self._hedge_delay(stop_id)
+                if delay is None:
+                    body, validators = await self._transport.get_conditional(
+                        session, url, REQUEST_TIMEOUT, sent
+                    )
+                else:
+                    (body, validators), hedged, won = await async_hedged(
+                        lambda: self._transport.get_conditional(
+                            session, url, REQUEST_TIMEOUT, sent
+                        ),
+                        delay,
+                        self.hedge_budget,
+                    )
+                    recorder.incr("hedged", hedged)
+                    recorder.incr("hedge_wins", won)
+                recorder.record_fetch(
+                    stop_id, (time.perf_counter() - start) * 1000, True, len(body or b"")
+                )
+                if body is None:
+                    recorder.incr("not_modified")
+                    departures = previous[2]
+                else:
+                    digest = hashlib.blake2b(body, digest_size=16).digest()
+                    if previous is not None and previous[0] == digest:
+                        recorder.incr("unchanged_bodies")
+                        departures = previous[2]
+                    else:
+                        with recorder.span("json_decode"):
+                            data = json.loads(body)
+                        departures = data.get("departures", [])
+                    responses.set(str(stop_id), (digest, validators, departures))
+
+                # Log retry success
+                if attempt > 0:
+                    _LOGGER.info(
+                        "Successfully fetched departures for stop %s on attempt %d/%d",
+                        stop_id,
+                        attempt + 1,
+                        MAX_RETRIES
+                    )
+
+                return departures
 
             except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                recorder.record_fetch(stop_id, (time.perf_counter() - start) * 1000, False)
                 last_error = err
                 if attempt < MAX_RETRIES - 1:
+                    recorder.incr("retries")
                     delay = RETRY_DELAY * (2 ** attempt)  # Exponential backoff: 1s, 2s, 4s
                     _LOGGER.debug(
                         "Failed to fetch departures for stop %s (attempt %d/%d): %s. Retrying in %.1fs...",
@@ -208,14 +630,70 @@ class ZTMCoordinator(DataUpdateCoordinator[dict[str, Any]]):
         )
         raise last_error if last_error else Exception(f"Failed to fetch departures for stop {stop_id}")
 
-    async def _load_stop_names(self) -> None:
-        """Load stop names from API (lazy loading with cache)."""
+    def _hedge_delay(self, stop_id: int) -> float | None:
+        """Return seconds after which a request for the stop is hedged, or None."""
+        if self.hedge_budget is None:
+            return None
+        return hedge_delay(
+            self.metrics.latency_percentile(95, stop_id),
+            self.metrics.latency_samples(stop_id),
+            REQUEST_TIMEOUT,
+        )
+
+    def _filter_departures(self, stop_id: int, departures: list[dict]) -> list[dict]:
+        """Drop departures excluded by the stop's route and headsign filters."""
+        routes = self.route_filters.get(str(stop_id))
+        headsigns = self.headsign_filters.get(str(stop_id))
+        if not routes and not headsigns:
+            return departures
+
+        kept = []
+        for dep in departures:
+            if routes:
+                route = str(dep.get("routeShortName", ""))
+                if routes.get("include") and route not in routes["include"]:
+                    continue
+                if route in routes.get("exclude", ()):
+                    continue
+            if headsigns:
+                headsign = str(dep.get("headsign", "")).casefold()
+                if headsigns.get("include") and not any(
+                    h in headsign for h in headsigns["include"]
+                ):
+                    continue
+                if any(h in headsign for h in headsigns.get("exclude", ())):
+                    continue
+            kept.append(dep)
+
+        self.metrics.incr("filtered", len(departures) - len(kept))
+        return kept
+
+    async def _load_stop_names(
+        self, refetch: bool = False, stop_ids: list[int] | None = None
+    ) -> None:
+        """Load stop names from API (lazy loading with cache).
+
+        With refetch, names of all stops (or only stop_ids) are downloaded
+        again into a copy of the cache, which replaces it once complete;
+        stops that cannot be fetched keep their cached names.
+        """
+        stop_ids = self.stop_ids if stop_ids is None else stop_ids
+        cache = self._stop_names_cache.copy() if refetch else self._stop_names_cache
+
         # Check which stops are missing from cache
         missing_stops = [
-            stop_id for stop_id in self.stop_ids
-            if str(stop_id) not in self._stop_names_cache
+            stop_id for stop_id in stop_ids
+            if refetch or str(stop_id) not in self._stop_names_cache
         ]
-        
+        if not refetch:
+            # Stops added since the last download are usually in the snapshots
+            missing_stops = [
+                stop_id for stop_id in missing_stops
+                if not self._cache_stop_from_snapshots(str(stop_id))
+            ]
+        self.metrics.incr("cache_hits", len(stop_ids) - len(missing_stops))
+        self.metrics.incr("cache_misses", len(missing_stops))
+
         if not missing_stops:
             _LOGGER.debug("All stop names already cached")
             return
@@ -228,121 +706,146 @@ class ZTMCoordinator(DataUpdateCoordinator[dict[str, Any]]):
             (API_STOPS, "stops.json"),
         ]
         
+        still_missing = list(missing_stops)
+        downloaded = False
         for url, name in endpoints:
-            still_missing = [s for s in missing_stops if str(s) not in self._stop_names_cache]
             if not still_missing:
                 break
                 
             _LOGGER.debug("Trying endpoint %s for %d stops", name, len(still_missing))
-            await self._fetch_stops_from_url(url, still_missing)
-        
+            found = await self._fetch_stops_from_url(url, still_missing, cache)
+            if found is not None:
+                downloaded = True
+                still_missing = [s for s in still_missing if str(s) not in found]
+
+        if not downloaded:
+            # Keep the current version
+            cache = self._stop_names_cache
+
         # Add fallback for any still missing
-        still_missing = [s for s in missing_stops if str(s) not in self._stop_names_cache]
         if still_missing:
-            _LOGGER.warning("Stops not found in any API: %s", still_missing)
-            self._add_fallback_names(still_missing)
+            if downloaded:
+                _LOGGER.warning("Stops not found in any API: %s", still_missing)
+            self._add_fallback_names(still_missing, cache)
+
+        # Swap in the new version at once
+        self._stop_names_cache = cache
+
+        # Only a download makes the names fresh (and worth saving)
+        if downloaded:
+            self._stop_names_fetched_at = dt_util.utcnow()
+            self._stop_store.async_delay_save(self._stop_store_data, STORAGE_SAVE_DELAY)
+
+    async def async_load_stored_stop_names(self) -> None:
+        """Seed the stop names cache with metadata saved by a previous run."""
+        for source in ("stopsingdansk", "stops"):
+            snapshot = await self.hass.async_add_executor_job(
+                open_snapshot, self._snapshot_path(source), STOP_COLUMNS
+            )
+            if snapshot is not None:
+                self._stop_snapshots[source] = snapshot
+
+        stored = await self._stop_store.async_load()
+        if not stored:
+            return
+
+        for stop_id, info in stored.get("stops", {}).items():
+            if stop_id not in self._stop_names_cache:
+                self._stop_names_cache.set(stop_id, info)
+
+        fetched_at = dt_util.parse_datetime(stored.get("fetched_at") or "")
+        if fetched_at and dt_util.utcnow() - fetched_at < SCAN_INTERVAL_STOPS:
+            self._stop_names_fetched_at = fetched_at
+        _LOGGER.debug(
+            "Restored %d stop names from storage (fetched at %s)",
+            len(stored.get("stops", {})),
+            fetched_at,
+        )
+
+    @callback
+    def _stop_store_data(self) -> dict[str, Any]:
+        """Return stop metadata to persist (fetched names only)."""
+        return {
+            "fetched_at": (
+                self._stop_names_fetched_at.isoformat()
+                if self._stop_names_fetched_at
+                else None
+            ),
+            "stops": {
+                stop_id: info
+                for stop_id, info in self._stop_names_cache.items()
+                if not info.get("is_fallback")
+            },
+        }
+
+    async def _fetch_stops_from_url(
+        self, url: str, missing_stops: list[int], cache: TTLCache[str, dict[str, Any]]
+    ) -> set[str] | None:
+        """Fetch stop names from a specific URL into cache.
+
+        Returns IDs of found stops, or None if the download failed.
+        """
+        source = url.split('/')[-1].removesuffix(".json")
+        path = self._snapshot_path(source)
+
+        async def download() -> CompactIndex:
+            async with self._transport.session() as session:
+                body = await self._transport.get(session, url, 60)
+            _LOGGER.debug("API %s returned %d bytes", url.split('/')[-1], len(body))
+
+            # Decode and index the whole database off the event loop
+            with self.metrics.span("stops_decode"):
+                return await self.hass.async_add_executor_job(
+                    build_stop_snapshot, body, path
+                )
 
-    async def _fetch_stops_from_url(self, url: str, missing_stops: list[int]) -> int:
-        """Fetch stop names from a specific URL. Returns count of found stops."""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    url, timeout=aiohttp.ClientTimeout(total=60)
-                ) as response:
-                    _LOGGER.debug("API %s response status: %s", url.split('/')[-1], response.status)
-                    response.raise_for_status()
-                    data = await response.json(content_type=None)
-
-            _LOGGER.debug("API response keys: %s", list(data.keys())[:5])
-
-            # Find the latest date key (format: "YYYY-MM-DD" or similar)
-            date_keys = [k for k in data.keys() if k not in ("lastUpdate", "stops")]
-            if date_keys:
-                dates = sorted(date_keys, reverse=True)
-                stops_data = data[dates[0]].get("stops", [])
-                _LOGGER.debug("Using date key: %s, found %d stops", dates[0], len(stops_data))
-            elif "stops" in data:
-                # Direct stops array
-                stops_data = data["stops"]
-                _LOGGER.debug("Using direct 'stops' key, found %d stops", len(stops_data))
-            else:
-                _LOGGER.warning("Unknown API structure. Keys: %s", list(data.keys()))
-                return 0
-
-            if not stops_data:
-                _LOGGER.warning("Empty stops data from API")
-                return 0
-
-            # Log first stop structure for debugging
-            if stops_data:
-                _LOGGER.debug("Sample stop keys: %s", list(stops_data[0].keys()))
-                _LOGGER.debug("Sample stop data: %s", {k: stops_data[0].get(k) for k in ['stopId', 'stopDesc', 'stopName', 'subName']})
-
-            # Build lookup and cache missing stops
-            found_count = 0
-            missing_stops_set = set(missing_stops)
-            
-            for stop in stops_data:
-                stop_id_raw = stop.get("stopId")
-                if stop_id_raw is None:
-                    continue
-                    
-                stop_id = int(stop_id_raw)
-                
-                if stop_id in missing_stops_set and str(stop_id) not in self._stop_names_cache:
-                    # Try different name fields - stopDesc is from TRISTAR, stopName from schedule system
-                    name = (
-                        stop.get("stopDesc") or 
-                        stop.get("stopName") or 
-                        stop.get("stopShortName") or 
-                        stop.get("name") or
-                        ""
-                    )
-                    
-                    if not name:
-                        _LOGGER.debug("Stop %s has no name fields", stop_id)
-                        continue
-                    
-                    sub_name = stop.get("subName", "") or stop.get("platform", "")
-                    # subName is often the platform number like "01", "02"
-                    if sub_name:
-                        sub_name = str(sub_name).zfill(2) if str(sub_name).isdigit() else sub_name
-                    
-                    full_name = f"{name} {sub_name}".strip() if sub_name else name
-                    
-                    self._stop_names_cache[str(stop_id)] = {
-                        "name": full_name,
-                        "short_name": name,
-                        "platform": sub_name,
-                        "zone": stop.get("zoneName", "") or stop.get("zone", ""),
-                        "lat": stop.get("stopLat"),
-                        "lon": stop.get("stopLon"),
-                        "type": stop.get("type", "BUS"),  # API returns "BUS" or "TRAM" as string
-                        "wheelchair_accessible": bool(stop.get("wheelchairBoarding", 0)),
-                        "on_demand": bool(stop.get("onDemand", 0)),
-                        "zone_border": bool(stop.get("ticketZoneBorder", 0)),
-                    }
-                    found_count += 1
-                    _LOGGER.debug("Cached stop %s: %s", stop_id, full_name)
+            snapshot = await async_download_snapshot(self.hass, path, download)
+            self._stop_snapshots[source] = snapshot
+
+            # Cache requested stops
+            found = set()
+            for stop_id in missing_stops:
+                if str(stop_id) in snapshot:
+                    cache.set(str(stop_id), dict(snapshot[str(stop_id)]))
+                    found.add(str(stop_id))
+
+            if not found:
+                _LOGGER.warning("No requested stops found in %s", url.split('/')[-1])
+                return set()
 
             _LOGGER.info(
                 "Fetched %d/%d stop names from %s. Cache size: %d", 
-                found_count, len(missing_stops), url.split('/')[-1], len(self._stop_names_cache)
+                len(found), len(missing_stops), url.split('/')[-1], len(cache)
             )
-            return found_count
+            return found
 
         except aiohttp.ClientError as err:
             _LOGGER.error("Network error from %s: %s", url.split('/')[-1], err)
-            return 0
+            return None
         except Exception as err:
             _LOGGER.error("Error fetching from %s: %s", url.split('/')[-1], err, exc_info=True)
-            return 0
+            return None
 
-    def _add_fallback_names(self, stop_ids: list[int]) -> None:
+    def _snapshot_path(self, source: str) -> str:
+        """Return the path of a stops or vehicles snapshot (shared by all entries)."""
+        return self.hass.config.path(STORAGE_DIR, SNAPSHOT_FILE.format(source))
+
+    def _cache_stop_from_snapshots(self, stop_id: str) -> bool:
+        """Copy a stop's info from the snapshots into the cache. Returns True if found."""
+        for snapshot in self._stop_snapshots.values():
+            if stop_id in snapshot:
+                self._stop_names_cache.set(stop_id, dict(snapshot[stop_id]))
+                return True
+        return False
+
+    def _add_fallback_names(
+        self, stop_ids: list[int], cache: TTLCache[str, dict[str, Any]]
+    ) -> None:
         """Add fallback names for stops that couldn't be fetched."""
         for stop_id in stop_ids:
-            if str(stop_id) not in self._stop_names_cache:
-                self._stop_names_cache[str(stop_id)] = {
+            if str(stop_id) not in cache:
+                cache.set(str(stop_id), {
                     "name": f"Przystanek {stop_id}",
                     "short_name": f"Przystanek {stop_id}",
                     "platform": "",
@@ -352,16 +855,37 @@ class ZTMCoordinator(DataUpdateCoordinator[dict[str, Any]]):
                     "on_demand": False,
                     "zone_border": False,
                     "is_fallback": True,
-                }
+                })
+
+    def cache_stats(self) -> dict[str, dict[str, Any]]:
+        """Return entries, approximate bytes and eviction counters of each cache."""
+        stats = {
+            "stop_names": self._stop_names_cache.stats(),
+            "fallback_departures": self._last_valid_departures.stats(),
+            "departure_responses": self._departure_cache.responses.stats(),
+            "filtered_departures": self._filtered_departures.stats(),
+        }
+        for source, snapshot in (
+            *self._stop_snapshots.items(),
+            ("vehicles", self._vehicles_cache),
+        ):
+            if isinstance(snapshot, CompactIndex):
+                stats[f"{source}_records"] = snapshot.cache_stats()
+        return stats
 
     def get_stop_name(self, stop_id: int | str) -> str:
         """Get cached stop name."""
-        stop_data = self._stop_names_cache.get(str(stop_id), {})
-        return stop_data.get("name", f"Przystanek {stop_id}")
+        return self.get_stop_info(stop_id).get("name", f"Przystanek {stop_id}")
 
     def get_stop_info(self, stop_id: int | str) -> dict[str, Any]:
-        """Get cached stop info."""
-        return self._stop_names_cache.get(str(stop_id), {})
+        """Get cached stop info, looking up unmonitored stops in the snapshots."""
+        info = self._stop_names_cache.get(str(stop_id))
+        if info is not None:
+            return info
+        for snapshot in self._stop_snapshots.values():
+            if str(stop_id) in snapshot:
+                return snapshot[str(stop_id)]
+        return {}
 
     def get_departures(self, stop_id: int | str) -> list[dict]:
         """Get departures for a stop."""
@@ -369,58 +893,175 @@ class ZTMCoordinator(DataUpdateCoordinator[dict[str, Any]]):
             return []
         return self.data.get("departures", {}).get(str(stop_id), [])
 
-    async def async_refresh_stop_names(self) -> None:
-        """Force refresh of stop names cache."""
-        self._stop_names_loaded = False
-        self._stop_names_cache.clear()
-        await self._load_stop_names()
-        self._stop_names_loaded = True
+    def get_group_departures(self, group: str) -> list[tuple[str, dict]]:
+        """Get merged (stop ID, departure) pairs for a stop group."""
+        if self.data is None:
+            return []
+        return self.data.get("groups", {}).get(group, [])
 
-    async def async_refresh_vehicles(self) -> None:
-        """Force refresh of vehicles cache."""
-        self._vehicles_loaded = False
-        self._vehicles_cache.clear()
-        success = await self._load_vehicles()
-        if success:
+    def get_route_departures(self, route: str) -> list[tuple[str, dict]]:
+        """Get time-ordered (stop ID, departure) pairs of a route across all stops."""
+        if self.data is None:
+            return []
+        return self.data.get("routes", {}).get(route, [])
+
+    def get_trip_departures(self, trip: str) -> list[tuple[str, dict]]:
+        """Get time-ordered (stop ID, departure) pairs of one trip (see trip_key)."""
+        if self.data is None:
+            return []
+        return self.data.get("trips", {}).get(trip, [])
+
+    def get_vehicle_departures(self, vehicle_code: int | str) -> list[tuple[str, dict]]:
+        """Get time-ordered (stop ID, departure) pairs of a vehicle at the monitored stops.
+
+        A vehicle serving several trips is listed trip after trip.
+        """
+        if self.data is None:
+            return []
+        return [
+            item
+            for trip in self.data.get("vehicle_trips", {}).get(str(vehicle_code), [])
+            for item in self.data["trips"][trip]
+        ]
+
+    async def async_refresh_stop_names(
+        self, stop_ids: list[int] | None = None
+    ) -> dict[str, Any]:
+        """Refresh stop metadata (all stops or only the given ones).
+
+        The current names stay in use until the new version is complete, and
+        are kept if the download fails. Returns the new version with the IDs
+        of stops added, removed and renamed in the stops databases.
+        """
+        previous_cache = self._stop_names_cache
+        previous_snapshots = dict(self._stop_snapshots)
+        await self._load_stop_names(refetch=True, stop_ids=stop_ids)
+        if self._stop_names_cache is previous_cache:
+            return self._report_changes("stops", None)
+
+        diff: dict[str, set[str]] = {"added": set(), "removed": set(), "changed": set()}
+        for source, snapshot in self._stop_snapshots.items():
+            old = previous_snapshots.get(source)
+            if old is not None and old is not snapshot:
+                source_diff = await self.hass.async_add_executor_job(
+                    diff_indexes, old, snapshot, "name"
+                )
+                for kind, keys in source_diff.items():
+                    diff[kind].update(keys)
+        diff["changed"].update(
+            stop_id for stop_id, info in self._stop_names_cache.items()
+            if (old := previous_cache.get(stop_id)) is not None
+            and old.get("name") != info.get("name")
+        )
+        return self._report_changes("stops", {
+            "added": diff["added"],
+            "removed": diff["removed"],
+            "renamed": diff["changed"],
+        })
+
+    async def async_refresh_vehicles(self) -> dict[str, Any]:
+        """Refresh the vehicles database.
+
+        The current database stays in use until the new one is indexed, and
+        is kept if the download fails. Returns the new version with the codes
+        of vehicles added, removed and changed.
+        """
+        previous = self._vehicles_cache
+        if await self._load_vehicles(refetch=True):
             self._vehicles_loaded = True
+        if self._vehicles_cache is previous:
+            return self._report_changes("vehicles", None)
+
+        diff = await self.hass.async_add_executor_job(
+            diff_indexes, previous, self._vehicles_cache
+        )
+        return self._report_changes("vehicles", diff)
+
+    def _report_changes(
+        self, index: str, diff: Mapping[str, Iterable[str]] | None
+    ) -> dict[str, Any]:
+        """Record and log the changes of a new index version (None if none was swapped in)."""
+        if diff is None:
+            _LOGGER.warning(
+                "Refresh failed, keeping %s version %d",
+                index,
+                self.index_versions[index]["version"],
+            )
+            return {"version": self.index_versions[index]["version"], "updated": False}
+
+        changes = {
+            kind: sorted(int(key) for key in keys if key.isdigit())
+            for kind, keys in diff.items()
+        }
+        self.index_versions[index] = {
+            "version": self.index_versions[index]["version"] + 1,
+            "updated_at": dt_util.utcnow().isoformat(),
+            **{kind: len(keys) for kind, keys in changes.items()},
+        }
+        _LOGGER.info(
+            "Swapped in %s version %d: %s",
+            index,
+            self.index_versions[index]["version"],
+            ", ".join(f"{len(keys)} {kind}" for kind, keys in changes.items()),
+        )
+        return {"version": self.index_versions[index]["version"], "updated": True, **changes}
+
+    async def _load_vehicles(self, refetch: bool = False) -> bool:
+        """Load vehicle database from API. Returns True on success.
+
+        Unless refetch is set, a snapshot younger than a day is used instead
+        of downloading; an older one is still used if the download fails.
+        """
+        path = self._snapshot_path("vehicles")
+        if not refetch:
+            snapshot = await self.hass.async_add_executor_job(
+                open_snapshot, path, VEHICLE_COLUMNS, SCAN_INTERVAL_STOPS.total_seconds()
+            )
+            if snapshot is not None:
+                self._vehicles_cache = snapshot
+                _LOGGER.debug("Using vehicles snapshot with %d vehicles", len(snapshot))
+                return True
+
+        async def download() -> CompactIndex:
+            async with self._transport.session() as session:
+                body = await self._transport.get(session, API_VEHICLES, 60)
+
+            # Decode and index off the event loop
+            with self.metrics.span("vehicles_decode"):
+                return await self.hass.async_add_executor_job(
+                    build_vehicle_snapshot, body, path
+                )
 
-    async def _load_vehicles(self) -> bool:
-        """Load vehicle database from API. Returns True on success."""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    API_VEHICLES, timeout=aiohttp.ClientTimeout(total=60)
-                ) as response:
-                    response.raise_for_status()
-                    data = await response.json(content_type=None)
-
-            vehicles = data.get("results", [])
-            for vehicle in vehicles:
-                vehicle_code = str(vehicle.get("vehicleCode", ""))
-                if vehicle_code:
-                    self._vehicles_cache[vehicle_code] = {
-                        "wheelchair_accessible": vehicle.get("wheelchairsRamp", False),
-                        "low_floor": "niskopodłogowy" in vehicle.get("floorHeight", "").lower(),
-                        "air_conditioning": vehicle.get("airConditioning", False),
-                        "usb": vehicle.get("usb", False),
-                        "bike_holders": vehicle.get("bikeHolders", 0),
-                        "kneeling_mechanism": vehicle.get("kneelingMechanism", False),
-                        "brand": vehicle.get("brand", ""),
-                        "model": vehicle.get("model", ""),
-                    }
+            # Swap in the result once it is complete
+            self._vehicles_cache = await async_download_snapshot(self.hass, path, download)
 
             _LOGGER.info("Loaded %d vehicles into cache", len(self._vehicles_cache))
             return True
 
         except Exception as err:
             _LOGGER.warning("Could not load vehicles database: %s", err)
+            if self._vehicles_cache:
+                # Keep the version in use
+                return False
+            snapshot = await self.hass.async_add_executor_job(
+                open_snapshot, path, VEHICLE_COLUMNS
+            )
+            if snapshot is not None:
+                _LOGGER.info("Using outdated vehicles snapshot until the next refresh")
+                self._vehicles_cache = snapshot
             return False
 
     def get_vehicle_info(self, vehicle_code: int | str | None) -> dict[str, Any]:
         """Get cached vehicle info."""
         if vehicle_code is None:
             return {}
-        return self._vehicles_cache.get(str(vehicle_code), {})
+        vehicle_info = self._vehicles_cache.get(str(vehicle_code))
+        if vehicle_info is None:
+            self.metrics.incr("cache_misses")
+            return {}
+        self.metrics.incr("cache_hits")
+        return vehicle_info
 
     def get_vehicle_icons(self, vehicle_info: dict[str, Any]) -> str:
         """Generate icon string for vehicle properties."""
@@ -545,25 +1186,58 @@ class ZTMCoordinator(DataUpdateCoordinator[dict[str, Any]]):
 
         return result
 
+    def get_board(self) -> dict[str, str]:
+        """Return the departure board as plain text and markdown.
+
+        The board is rendered once per data update and shared by all readers.
+        """
+        if self._board_data is not self.data or not self._board:
+            with self.blocking_span("board"):
+                self._board = self._render_board()
+            self._board_data = self.data
+        return self._board
+
+    def _render_board(self) -> dict[str, str]:
+        """Render departures of all stops with the departure format and icons."""
+        # Icons are appended unless the template already shows them
+        append_icons = "vehicle_properties_icons" not in self._formatter.fields
+        text_blocks = []
+        markdown_blocks = []
+        for stop_id in self.stop_ids:
+            lines = []
+            for dep in self.get_departures(stop_id)[:self.max_departures]:
+                formatted = self.format_departure(dep)
+                line = formatted["departure_string"]
+                if append_icons and formatted["vehicle_properties_icons"]:
+                    line = f"{line} {formatted['vehicle_properties_icons']}"
+                lines.append(line)
+
+            name = self.get_stop_name(stop_id)
+            if not lines:
+                lines = ["Brak odjazdów"]
+            text_blocks.append("\n".join([name, *(f"  {line}" for line in lines)]))
+            markdown_blocks.append(
+                "\n".join(
+                    [
+                        f"**{escape_markdown(name)}**",
+                        *(f"- {escape_markdown(line)}" for line in lines),
+                    ]
+                )
+            )
+
+        return {
+            "text": "\n\n".join(text_blocks),
+            "markdown": "\n\n".join(markdown_blocks),
+        }
+
     def format_departure_string(self, departure_data: dict[str, Any]) -> str:
-        """Format departure data into a custom string using template."""
+        """Format departure data into a custom string using the compiled template."""
         try:
-            # Prepare data for formatting
-            format_data = {
-                "route": departure_data.get("route", "?"),
-                "headsign": departure_data.get("headsign", "?"),
-                "time": departure_data.get("time", "?"),
-                "scheduled_time": departure_data.get("scheduled_time") or "?",
-                "minutes": departure_data.get("minutes", 0),
-                "delay": departure_data.get("delay", 0),
-                "vehicle_code": departure_data.get("vehicle_code") or "",
-                "vehicle_properties_icons": departure_data.get("vehicle_properties_icons", ""),
-                "realtime": departure_data.get("realtime", departure_data.get("is_realtime", False)),
-            }
-
-            # Format using template
-            return self._departure_format.format(**format_data)
-        except (KeyError, ValueError) as err:
-            _LOGGER.warning("Error formatting departure string: %s", err)
-            # Fallback to simple format
-            return f"{format_data['route']} → {format_data['headsign']} | {format_data['time']}"
+            return self._formatter.format(departure_data)
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError) as err:
+            # Template was validated, but values of unexpected type can still fail
+            _LOGGER.debug("Error formatting departure string: %s", err)
+            return (
+                f"{departure_data.get('route', '?')} → "
+                f"{departure_data.get('headsign', '?')} | {departure_data.get('time', '?')}"
+            )
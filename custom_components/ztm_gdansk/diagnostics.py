@@ -0,0 +1,56 @@
+"""Diagnostics support for ZTM Gdańsk."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .cache import get_departure_cache
+from .const import DOMAIN
+from .snapshot import CompactIndex
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry."""
+    coordinator = hass.data[DOMAIN][entry.entry_id]["coordinator"]
+    departure_cache = get_departure_cache(hass)
+
+    return {
+        "entry": {
+            "data": dict(entry.data),
+            "options": dict(entry.options),
+        },
+        "coordinator": {
+            "stop_ids": coordinator.stop_ids,
+            "last_update_success": coordinator.last_update_success,
+            "update_interval_s": coordinator.update_interval.total_seconds(),
+            "stop_names_cached": len(coordinator._stop_names_cache),
+            "vehicles_cached": len(coordinator._vehicles_cache),
+            "index_versions": coordinator.index_versions,
+            "attribute_sizes": coordinator.attribute_sizes,
+            "snapshots": {
+                source: {"rows": len(snapshot), "decoded": snapshot.decoded}
+                for source, snapshot in (
+                    *coordinator._stop_snapshots.items(),
+                    ("vehicles", coordinator._vehicles_cache),
+                )
+                if isinstance(snapshot, CompactIndex)
+            },
+            "departures_cached": {
+                stop_id: len(departures)
+                for stop_id, departures in coordinator._last_valid_departures.items()
+            },
+            "caches": coordinator.cache_stats(),
+        },
+        "shared_departure_cache": departure_cache.stats(),
+        "metrics": coordinator.metrics.as_dict(),
+        "hedging": (
+            coordinator.hedge_budget.as_dict() if coordinator.hedge_budget else None
+        ),
+        "loop_lag": (
+            coordinator.lag_monitor.as_dict() if coordinator.lag_monitor else None
+        ),
+    }
@@ -0,0 +1,90 @@
+"""Compiled departure format templates for ZTM Gdańsk."""
+from __future__ import annotations
+
+from string import Formatter
+from typing import Any, Callable
+
+# Placeholder -> how to read it from a formatted departure dict
+FIELD_GETTERS: dict[str, Callable[[dict[str, Any]], Any]] = {
+    "route": lambda d: d.get("route", "?"),
+    "headsign": lambda d: d.get("headsign", "?"),
+    "time": lambda d: d.get("time", "?"),
+    "scheduled_time": lambda d: d.get("scheduled_time") or "?",
+    "minutes": lambda d: d.get("minutes", 0),
+    "delay": lambda d: d.get("delay", 0),
+    "vehicle_code": lambda d: d.get("vehicle_code") or "",
+    "vehicle_properties_icons": lambda d: d.get("vehicle_properties_icons", ""),
+    "realtime": lambda d: d.get("realtime", d.get("is_realtime", False)),
+}
+
+# Values used to check that a template formats cleanly
+SAMPLE_VALUES: dict[str, Any] = {
+    "route": "158",
+    "headsign": "Wrzeszcz PKP",
+    "time": "14:35",
+    "scheduled_time": "14:33",
+    "minutes": 3,
+    "delay": 1.5,
+    "vehicle_code": 3013,
+    "vehicle_properties_icons": "♿ 🚴",
+    "realtime": True,
+}
+
+
+class DepartureFormatter:
+    """Departure format template parsed once, formatting only the fields it uses."""
+
+    def __init__(self, template: str) -> None:
+        """Parse and validate the template. Raises ValueError if it is invalid."""
+        fields = []
+        try:
+            for _, field_name, _, _ in Formatter().parse(template):
+                if field_name is None:
+                    continue
+                # "{route.upper}" or "{route[0]}" depend on the "route" field
+                root = field_name.split(".", 1)[0].split("[", 1)[0]
+                if root not in FIELD_GETTERS:
+                    raise ValueError(f"Unknown placeholder {{{field_name}}}")
+                fields.append(root)
+        except ValueError as err:
+            raise ValueError(f"Invalid departure format {template!r}: {err}") from err
+
+        self.template = template
+        self.fields = frozenset(fields)
+        self._getters = [(field, FIELD_GETTERS[field]) for field in self.fields]
+
+        try:
+            template.format_map(SAMPLE_VALUES)
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError) as err:
+            raise ValueError(f"Invalid departure format {template!r}: {err}") from err
+
+    def format(self, departure_data: dict[str, Any]) -> str:
+        """Format a departure dict using only the fields the template needs."""
+        return self.template.format_map(
+            {field: getter(departure_data) for field, getter in self._getters}
+        )
+
+
+def validate_departure_format(template: str) -> bool:
+    """Return True if the template can be compiled."""
+    try:
+        DepartureFormatter(template)
+    except ValueError:
+        return False
+    return True
+
+
+def to_columns(records: list[dict[str, Any]]) -> dict[str, Any]:
+    """Return records as a schema (field names) and one array of values per field.
+
+    Key names are written once instead of once per record, which makes the
+    serialized attributes several times smaller. A field missing from a
+    record is None.
+    """
+    schema: dict[str, None] = {}
+    for record in records:
+        schema.update(dict.fromkeys(record))
+    return {
+        "schema": list(schema),
+        "columns": [[record.get(field) for record in records] for field in schema],
+    }
@@ -0,0 +1,117 @@
+"""Opt-in hedged departure requests for ZTM Gdańsk."""
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, TypeVar
+
+from homeassistant.core import HomeAssistant
+
+from .const import (
+    DOMAIN,
+    HEDGE_BUDGET_BURST,
+    HEDGE_BUDGET_RATIO,
+    HEDGE_MIN_DELAY,
+    HEDGE_MIN_SAMPLES,
+)
+
+_T = TypeVar("_T")
+
+DATA_HEDGE_BUDGET = "hedge_budget"
+
+
+class HedgeBudget:
+    """Token bucket limiting hedged requests to a fraction of all requests.
+
+    Every request adds HEDGE_BUDGET_RATIO tokens (up to HEDGE_BUDGET_BURST)
+    and every hedge takes one, so even when the API is slow everywhere at
+    most that fraction of extra load is sent.
+    """
+
+    def __init__(
+        self, ratio: float = HEDGE_BUDGET_RATIO, burst: float = HEDGE_BUDGET_BURST
+    ) -> None:
+        """Initialize the budget."""
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.hedged = 0
+        self.won = 0
+        self.denied = 0
+
+    def record_request(self) -> None:
+        """Earn tokens for a request."""
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """Take a token for a hedge. Returns False if the budget is spent."""
+        if self.tokens < 1:
+            self.denied += 1
+            return False
+        self.tokens -= 1
+        self.hedged += 1
+        return True
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return hedge counters for diagnostics."""
+        return {
+            "tokens": round(self.tokens, 2),
+            "hedged": self.hedged,
+            "won": self.won,
+            "denied": self.denied,
+        }
+
+
+def get_hedge_budget(hass: HomeAssistant) -> HedgeBudget:
+    """Return the hedge budget shared by all coordinators."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if DATA_HEDGE_BUDGET not in domain_data:
+        domain_data[DATA_HEDGE_BUDGET] = HedgeBudget()
+    return domain_data[DATA_HEDGE_BUDGET]
+
+
+async def async_hedged(
+    request: Callable[[], Awaitable[_T]],
+    delay: float,
+    budget: HedgeBudget,
+) -> tuple[_T, bool, bool]:
+    """Run request; if it takes longer than delay, run it again and take the first result.
+
+    A hedge is sent only if the budget allows it. A failure of one request
+    waits for the other; if both fail, the first request's error is raised.
+    Returns the result, whether a hedge was sent and whether it won.
+    """
+    budget.record_request()
+    first = asyncio.ensure_future(request())
+    tasks = {first}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not budget.try_acquire():
+            return await first, False, False
+
+        hedge = asyncio.ensure_future(request())
+        tasks.add(hedge)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Prefer the original if both finished in the same iteration
+            for task in sorted(done, key=lambda task: task is hedge):
+                if task.exception() is None:
+                    if task is hedge:
+                        budget.won += 1
+                    return task.result(), True, task is hedge
+        return first.result(), True, False
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                # The loser's error is not interesting
+                task.exception()
+
+
+def hedge_delay(p95_ms: float | None, samples: int, timeout: float) -> float | None:
+    """Return seconds to wait before hedging, or None if latency is not known yet."""
+    if p95_ms is None or samples < HEDGE_MIN_SAMPLES:
+        return None
+    delay = max(p95_ms / 1000, HEDGE_MIN_DELAY)
+    return delay if delay < timeout else None
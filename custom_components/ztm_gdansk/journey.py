@@ -0,0 +1,259 @@
+"""Transfer-aware journey planner over live departures for ZTM Gdańsk.
+
+A trip (see trip_key) seen at several monitored stops yields connections
+between consecutive stops, with the estimated times of the live departures.
+Connections are kept in arrays sorted by departure time, and queries run the
+Connection Scan Algorithm: one pass over the connections from the requested
+time, which takes milliseconds even for thousands of connections.
+
+Only monitored stops are known, so journeys can only use trips that pass two
+or more of them. Stops of one stop group are treated as one interchange.
+"""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+import math
+from typing import Any, Iterable
+
+from homeassistant.core import HomeAssistant
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN
+from .coordinator import ZTMCoordinator, get_coordinators, trip_key
+
+
+@dataclass
+class Leg:
+    """A ride on one trip between two stops."""
+
+    route: str
+    headsign: str
+    from_stop: str
+    to_stop: str
+    departs_at: float
+    arrives_at: float
+    vehicle_code: Any
+
+
+@dataclass
+class Journey:
+    """Legs of a journey in travel order."""
+
+    legs: list[Leg]
+
+    @property
+    def departs_at(self) -> float:
+        """Return the departure time of the first leg."""
+        return self.legs[0].departs_at
+
+    @property
+    def arrives_at(self) -> float:
+        """Return the arrival time of the last leg."""
+        return self.legs[-1].arrives_at
+
+
+class ConnectionIndex:
+    """Time-sorted connections between monitored stops."""
+
+    def __init__(
+        self,
+        departures: Iterable[tuple[str, dict[str, Any]]],
+        interchanges: Iterable[Iterable[str]] = (),
+    ) -> None:
+        """Build connections from (stop ID, departure) pairs."""
+        trips: dict[str, list[tuple[float, str, dict[str, Any]]]] = defaultdict(list)
+        for stop_id, dep in departures:
+            when = dt_util.parse_datetime(dep.get("estimatedTime") or "")
+            if when is not None:
+                trips[trip_key(dep)].append((when.timestamp(), stop_id, dep))
+
+        connections = []
+        for trip, events in trips.items():
+            events.sort(key=lambda event: event[0])
+            for (dep_time, from_stop, dep), (arr_time, to_stop, _) in zip(events, events[1:]):
+                if from_stop != to_stop:
+                    connections.append((dep_time, arr_time, from_stop, to_stop, trip, dep))
+        connections.sort(key=lambda connection: (connection[0], connection[1]))
+
+        self.departs = array("d", (c[0] for c in connections))
+        self.arrives = array("d", (c[1] for c in connections))
+        self.from_stops = [c[2] for c in connections]
+        self.to_stops = [c[3] for c in connections]
+        self.trips = [c[4] for c in connections]
+        self.departures = [c[5] for c in connections]
+
+        self.interchanges: dict[str, set[str]] = defaultdict(set)
+        for stops in interchanges:
+            stops = {str(stop_id) for stop_id in stops}
+            for stop_id in stops:
+                self.interchanges[stop_id] |= stops - {stop_id}
+
+    def __len__(self) -> int:
+        """Return the number of connections."""
+        return len(self.departs)
+
+    def earliest_arrival(
+        self, origin: str, target: str, start: float, min_transfer: float
+    ) -> Journey | None:
+        """Return the journey arriving first at target, leaving origin at start or later.
+
+        Changing vehicles (at the same stop or within an interchange) takes
+        at least min_transfer seconds. If the target is part of an interchange,
+        the journey may end at another stop of it.
+        """
+        ready: dict[str, float] = {origin: start}  # earliest boarding time per stop
+        arrival = math.inf
+        boarded: dict[str, int] = {}  # trip -> connection where it was boarded
+        reached_by: dict[str, tuple[int, int]] = {}  # stop -> (boarding, alighting connection)
+
+        for index in range(bisect_left(self.departs, start), len(self.departs)):
+            if self.departs[index] >= arrival:
+                break
+            trip = self.trips[index]
+            if trip not in boarded:
+                if ready.get(self.from_stops[index], math.inf) > self.departs[index]:
+                    continue
+                boarded[trip] = index
+
+            to_stop = self.to_stops[index]
+            arrives = self.arrives[index]
+            if to_stop == target or target in self.interchanges.get(to_stop, ()):
+                # A stop of the target's interchange is as good as the target
+                if arrives < arrival:
+                    arrival = arrives
+                    reached_by[target] = (boarded[trip], index)
+                continue
+            transfer_ready = arrives + min_transfer
+            for stop_id in (to_stop, *self.interchanges.get(to_stop, ())):
+                if stop_id != origin and transfer_ready < ready.get(stop_id, math.inf):
+                    ready[stop_id] = transfer_ready
+                    reached_by[stop_id] = (boarded[trip], index)
+
+        if target not in reached_by:
+            return None
+
+        legs = []
+        stop_id = target
+        while stop_id != origin:
+            if len(legs) > len(reached_by):
+                # Zero-length connections with no transfer time can form a loop
+                return None
+            board, alight = reached_by[stop_id]
+            dep = self.departures[board]
+            legs.append(
+                Leg(
+                    route=str(dep.get("routeShortName", "?")),
+                    headsign=dep.get("headsign", "?"),
+                    from_stop=self.from_stops[board],
+                    to_stop=self.to_stops[alight],
+                    departs_at=self.departs[board],
+                    arrives_at=self.arrives[alight],
+                    vehicle_code=dep.get("vehicleCode"),
+                )
+            )
+            stop_id = self.from_stops[board]
+        legs.reverse()
+        return Journey(legs)
+
+    def plan(
+        self,
+        origin: str,
+        target: str,
+        start: float,
+        min_transfer: float,
+        max_options: int,
+    ) -> list[Journey]:
+        """Return up to max_options journeys, each leaving later than the previous one."""
+        journeys: list[Journey] = []
+        while len(journeys) < max_options:
+            journey = self.earliest_arrival(origin, target, start, min_transfer)
+            # No legs when origin and target are the same stop
+            if journey is None or not journey.legs:
+                break
+            journeys.append(journey)
+            start = journey.departs_at + 1
+        return journeys
+
+
+def get_connection_index(hass: HomeAssistant) -> ConnectionIndex:
+    """Return the connection index over all coordinators' current departures.
+
+    The index is rebuilt only when a coordinator has new data.
+    """
+    coordinators = get_coordinators(hass)
+    key = tuple(coordinator.data for coordinator in coordinators)
+    cached = hass.data[DOMAIN].get("connection_index")
+    if cached is not None and len(cached[0]) == len(key) and all(
+        a is b for a, b in zip(cached[0], key)
+    ):
+        return cached[1]
+
+    index = ConnectionIndex(
+        (
+            (stop_id, dep)
+            for coordinator in coordinators
+            for stop_id, departures in (coordinator.data or {}).get("departures", {}).items()
+            for dep in departures
+        ),
+        (
+            stop_ids
+            for coordinator in coordinators
+            for stop_ids in coordinator.stop_groups.values()
+        ),
+    )
+    hass.data[DOMAIN]["connection_index"] = (key, index)
+    return index
+
+
+def stop_name(coordinators: list[ZTMCoordinator], stop_id: int | str) -> str:
+    """Return the stop name known to the coordinator monitoring the stop."""
+    coordinator = next(
+        (c for c in coordinators if int(stop_id) in c.stop_ids), coordinators[0]
+    )
+    return coordinator.get_stop_name(stop_id)
+
+
+def journey_as_dict(coordinators: list[ZTMCoordinator], journey: Journey) -> dict[str, Any]:
+    """Return a journey with stop names and local times for a service response."""
+
+    def local(timestamp: float) -> str:
+        return dt_util.as_local(dt_util.utc_from_timestamp(timestamp)).isoformat()
+
+    legs = []
+    previous_arrival: float | None = None
+    for leg in journey.legs:
+        legs.append({
+            "route": leg.route,
+            "headsign": leg.headsign,
+            "from_stop_id": int(leg.from_stop),
+            "from_stop_name": stop_name(coordinators, leg.from_stop),
+            "to_stop_id": int(leg.to_stop),
+            "to_stop_name": stop_name(coordinators, leg.to_stop),
+            "departure_time": local(leg.departs_at),
+            "arrival_time": local(leg.arrives_at),
+            "vehicle_code": leg.vehicle_code,
+            "transfer_minutes": (
+                None if previous_arrival is None
+                else round((leg.departs_at - previous_arrival) / 60, 1)
+            ),
+        })
+        previous_arrival = leg.arrives_at
+
+    return {
+        "departure_time": local(journey.departs_at),
+        "arrival_time": local(journey.arrives_at),
+        "duration_minutes": round((journey.arrives_at - journey.departs_at) / 60, 1),
+        "transfers": len(journey.legs) - 1,
+        "legs": legs,
+    }
+
+
+def parse_start(value: datetime | None) -> float:
+    """Return the search start as a timestamp (now if not given)."""
+    if value is None:
+        return dt_util.utcnow().timestamp()
+    return dt_util.as_utc(value).timestamp()
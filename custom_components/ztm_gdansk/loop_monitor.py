@@ -0,0 +1,162 @@
+"""Opt-in event loop lag monitor for ZTM Gdańsk."""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from contextlib import contextmanager
+import logging
+import math
+import time
+from typing import Any, Iterator
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.util import dt as dt_util
+
+from .const import DOMAIN, LOOP_MONITOR_INTERVAL, LOOP_MONITOR_STALLS
+
+_LOGGER = logging.getLogger(__name__)
+
+DATA_LOOP_MONITOR = "loop_monitor"
+
+
+class LoopLagMonitor:
+    """Detect event loop stalls and attribute them to integration code.
+
+    While a refresh or a state write is in flight (see watch() and
+    section()), a ticker is scheduled every LOOP_MONITOR_INTERVAL seconds;
+    the time it fires late is the loop lag. Synchronous integration code (JSON
+    decoding, group merging, attribute formatting, entity state writes) runs
+    inside section(), so a stall over the threshold is blamed on the longest
+    phase and the longest entity section that ran since the previous tick.
+    Stalls with no section in that window are reported with phase "other".
+
+    One monitor is shared by all entries that enable it; the lowest of their
+    thresholds applies.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Initialize the monitor."""
+        self.ticks = 0
+        self.max_lag_ms = 0.0
+        self.stalls: deque[dict[str, Any]] = deque(maxlen=LOOP_MONITOR_STALLS)
+        self._thresholds: list[float] = []
+        self._sections: list[tuple[str, str | None, float]] = []
+        self._watching = 0
+        self._expected = 0.0
+        self._handle: asyncio.TimerHandle | None = None
+        self._loop = loop
+
+    @property
+    def threshold_ms(self) -> float:
+        """Return the stall threshold (the lowest of all entries)."""
+        return min(self._thresholds, default=math.inf)
+
+    @callback
+    def async_add_entry(self, threshold_ms: float) -> CALLBACK_TYPE:
+        """Add an entry's threshold. Returns a function that removes it."""
+        self._thresholds.append(threshold_ms)
+
+        @callback
+        def remove() -> None:
+            self._thresholds.remove(threshold_ms)
+            if not self._thresholds:
+                self._stop()
+
+        return remove
+
+    def _stop(self) -> None:
+        """Stop the ticker."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def _schedule(self) -> None:
+        self._expected = time.perf_counter() + LOOP_MONITOR_INTERVAL
+        self._handle = self._loop.call_later(LOOP_MONITOR_INTERVAL, self._tick)
+
+    def _tick(self) -> None:
+        """Measure how late the ticker fired and record stalls."""
+        lag_ms = max(0.0, (time.perf_counter() - self._expected) * 1000)
+        self.ticks += 1
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        if lag_ms >= self.threshold_ms:
+            self._record_stall(lag_ms)
+        self._sections.clear()
+        # This tick covered the last section; sample again with the next one
+        if self._watching:
+            self._schedule()
+        else:
+            self._handle = None
+
+    @contextmanager
+    def watch(self) -> Iterator[None]:
+        """Sample the loop while the wrapped code (e.g. a refresh) is in flight."""
+        self._watching += 1
+        if self._handle is None and self._thresholds:
+            self._schedule()
+        try:
+            yield
+        finally:
+            self._watching -= 1
+
+    def _record_stall(self, lag_ms: float) -> None:
+        phase, entity = "other", None
+        phase_ms = entity_ms = 0.0
+        for name, entity_id, duration in self._sections:
+            if duration > phase_ms:
+                phase, phase_ms = name, duration
+            if entity_id is not None and duration > entity_ms:
+                entity, entity_ms = entity_id, duration
+
+        stall = {
+            "at": dt_util.utcnow().isoformat(),
+            "lag_ms": round(lag_ms, 1),
+            "phase": phase,
+            "phase_ms": round(phase_ms, 1),
+            "entity_id": entity,
+            "entity_ms": round(entity_ms, 1),
+        }
+        self.stalls.append(stall)
+        if phase == "other":
+            # Stalls caused by other integrations are not ours to warn about
+            _LOGGER.debug(
+                "Event loop stalled for %.0f ms outside ZTM Gdańsk code", lag_ms
+            )
+        else:
+            _LOGGER.warning(
+                "Event loop stalled for %.0f ms during %s (%.0f ms), slowest entity %s (%.0f ms)",
+                lag_ms,
+                phase,
+                phase_ms,
+                entity,
+                entity_ms,
+            )
+
+    @contextmanager
+    def section(self, phase: str, entity_id: str | None = None) -> Iterator[None]:
+        """Time a synchronous section of code for stall attribution."""
+        with self.watch():
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self._sections.append(
+                    (phase, entity_id, (time.perf_counter() - start) * 1000)
+                )
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return monitor state for diagnostics."""
+        return {
+            "threshold_ms": self.threshold_ms if self._thresholds else None,
+            "ticks": self.ticks,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "stalls": list(self.stalls),
+        }
+
+
+def get_loop_monitor(hass: HomeAssistant) -> LoopLagMonitor:
+    """Return the loop lag monitor shared by all coordinators."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    if DATA_LOOP_MONITOR not in domain_data:
+        domain_data[DATA_LOOP_MONITOR] = LoopLagMonitor(hass.loop)
+    return domain_data[DATA_LOOP_MONITOR]
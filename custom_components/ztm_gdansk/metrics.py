@@ -0,0 +1,210 @@
+"""Refresh instrumentation for ZTM Gdańsk."""
+from __future__ import annotations
+
+from collections import defaultdict, deque
+from contextlib import contextmanager
+import math
+import time
+from typing import Any, Iterable, Iterator
+
+from homeassistant.util import dt as dt_util
+
+# Number of recent fetches kept for latency percentiles and error rate
+METRICS_WINDOW = 200
+
+COUNTER_NAMES = (
+    "refreshes",
+    "requests",
+    "request_errors",
+    "retries",
+    "bytes",
+    "cache_hits",
+    "cache_misses",
+    "not_modified",
+    "unchanged_bodies",
+    "hedged",
+    "hedge_wins",
+    "fallbacks",
+    "filtered",
+)
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """Return the q-th percentile (0-100) of values using nearest rank."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class RefreshMetrics:
+    """Timing spans and counters collected during coordinator refreshes.
+
+    Per-stop latencies and data age are only kept for the monitored stops;
+    fetches of other stops (e.g. get_departures lookups) only count towards
+    the totals.
+    """
+
+    def __init__(
+        self, stop_ids: Iterable[int | str], window: int = METRICS_WINDOW
+    ) -> None:
+        """Initialize metrics."""
+        self.counters: dict[str, int] = dict.fromkeys(COUNTER_NAMES, 0)
+        self.last_refresh_duration: float | None = None
+        self.startup_duration: float | None = None
+        self._phases: dict[str, float] = defaultdict(float)
+        self._refresh_start: float | None = None
+        self._latencies: deque[float] = deque(maxlen=window)
+        self._stop_latencies: dict[str, deque[float]] = {
+            str(stop_id): deque(maxlen=window) for stop_id in stop_ids
+        }
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._stop_last_success: dict[str, Any] = {}
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        """Increment a counter."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def span(self, phase: str) -> Iterator[None]:
+        """Accumulate wall time spent in a phase of the current refresh."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(phase, (time.perf_counter() - start) * 1000)
+
+    def add_phase(self, phase: str, duration: float) -> None:
+        """Add time in ms to a phase of the current refresh."""
+        self._phases[phase] += duration
+
+    def start_refresh(self) -> None:
+        """Mark the beginning of a refresh cycle."""
+        self._phases = defaultdict(float)
+        self._refresh_start = time.perf_counter()
+        self.incr("refreshes")
+
+    def finish_refresh(self) -> None:
+        """Mark the end of the fetch part of a refresh cycle."""
+        if self._refresh_start is not None:
+            self.last_refresh_duration = (time.perf_counter() - self._refresh_start) * 1000
+            self._refresh_start = None
+
+    @property
+    def last_refresh_phases(self) -> dict[str, float]:
+        """Return time in ms spent per phase of the latest refresh cycle.
+
+        Phases recorded after the fetch (formatting, state writes) are
+        attributed to the same cycle until the next refresh starts.
+        """
+        return {phase: round(value, 2) for phase, value in self._phases.items()}
+
+    def record_fetch(
+        self, stop_id: int | str, latency: float, success: bool, nbytes: int = 0
+    ) -> None:
+        """Record the outcome of a single departures request (latency in ms)."""
+        stop_key = str(stop_id)
+        self.incr("requests")
+        self._outcomes.append(success)
+        if success:
+            self.incr("bytes", nbytes)
+            self._latencies.append(latency)
+            if (stop_latencies := self._stop_latencies.get(stop_key)) is not None:
+                stop_latencies.append(latency)
+                self._stop_last_success[stop_key] = dt_util.utcnow()
+        else:
+            self.incr("request_errors")
+
+    def latency_percentile(self, q: float, stop_id: int | str | None = None) -> float | None:
+        """Return a fetch latency percentile in ms, globally or for one stop."""
+        if stop_id is None:
+            values = list(self._latencies)
+        else:
+            values = list(self._stop_latencies.get(str(stop_id), ()))
+        result = percentile(values, q)
+        return round(result, 1) if result is not None else None
+
+    def latency_samples(self, stop_id: int | str) -> int:
+        """Return the number of recent successful fetches of a stop."""
+        return len(self._stop_latencies.get(str(stop_id), ()))
+
+    def error_rate(self) -> float | None:
+        """Return the fraction of failed requests in the recent window."""
+        if not self._outcomes:
+            return None
+        return round(self._outcomes.count(False) / len(self._outcomes), 3)
+
+    def data_age(self, stop_id: int | str) -> float | None:
+        """Return seconds since departures for a stop were last fetched successfully."""
+        last = self._stop_last_success.get(str(stop_id))
+        if last is None:
+            return None
+        return round((dt_util.utcnow() - last).total_seconds(), 1)
+
+    def as_dict(self) -> dict[str, Any]:
+        """Return a JSON-serializable snapshot for diagnostics."""
+        return {
+            "counters": dict(self.counters),
+            "last_refresh_ms": (
+                round(self.last_refresh_duration, 2)
+                if self.last_refresh_duration is not None
+                else None
+            ),
+            "last_refresh_phases_ms": self.last_refresh_phases,
+            "startup_ms": (
+                round(self.startup_duration, 2)
+                if self.startup_duration is not None
+                else None
+            ),
+            "fetch_latency_ms": {
+                "p50": self.latency_percentile(50),
+                "p95": self.latency_percentile(95),
+            },
+            "error_rate": self.error_rate(),
+            "stops": {
+                stop_id: {
+                    "p50_ms": self.latency_percentile(50, stop_id),
+                    "p95_ms": self.latency_percentile(95, stop_id),
+                    "data_age_s": self.data_age(stop_id),
+                }
+                for stop_id in self._stop_latencies
+            },
+        }
+
+
+class FetchRecorder:
+    """Metrics of one departures fetch shared by several coordinators.
+
+    The fetch runs once, so its counters, request outcomes and phase times
+    are recorded here and applied to the metrics of every coordinator that
+    waited for it.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the recorder."""
+        self._calls: list[tuple[str, tuple[Any, ...]]] = []
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        """Record a counter increment."""
+        self._calls.append(("incr", (name, amount)))
+
+    def record_fetch(
+        self, stop_id: int | str, latency: float, success: bool, nbytes: int = 0
+    ) -> None:
+        """Record the outcome of a single departures request (latency in ms)."""
+        self._calls.append(("record_fetch", (stop_id, latency, success, nbytes)))
+
+    @contextmanager
+    def span(self, phase: str) -> Iterator[None]:
+        """Record wall time spent in a phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._calls.append(("add_phase", (phase, (time.perf_counter() - start) * 1000)))
+
+    def apply(self, metrics: RefreshMetrics) -> None:
+        """Apply everything recorded so far to a coordinator's metrics."""
+        for method, args in self._calls:
+            getattr(metrics, method)(*args)
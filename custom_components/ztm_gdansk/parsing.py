@@ -0,0 +1,116 @@
+"""Decoding and index building for the ZTM stops and vehicles databases.
+
+These functions are CPU-bound on large payloads and are meant to run in an
+executor (hass.async_add_executor_job), never on the event loop.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from types import MappingProxyType
+from typing import Any, Mapping
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def parse_stops_payload(body: bytes) -> list[dict[str, Any]]:
+    """Decode a stops JSON payload and return the latest list of stops."""
+    data = json.loads(body)
+    _LOGGER.debug("API response keys: %s", list(data.keys())[:5])
+
+    # Find the latest date key (format: "YYYY-MM-DD" or similar)
+    date_keys = [k for k in data.keys() if k not in ("lastUpdate", "stops")]
+    if date_keys:
+        latest = sorted(date_keys, reverse=True)[0]
+        day = data[latest]
+        stops_data = day.get("stops", []) if isinstance(day, dict) else day
+        _LOGGER.debug("Using date key: %s, found %d stops", latest, len(stops_data))
+        return stops_data
+    if "stops" in data:
+        # Direct stops array
+        _LOGGER.debug("Using direct 'stops' key, found %d stops", len(data["stops"]))
+        return data["stops"]
+
+    _LOGGER.warning("Unknown API structure. Keys: %s", list(data.keys()))
+    return []
+
+
+def build_stop_info(stop: dict[str, Any]) -> dict[str, Any] | None:
+    """Build cached stop info from a raw stop record, or None if it has no name."""
+    # Try different name fields - stopDesc is from TRISTAR, stopName from schedule system
+    name = (
+        stop.get("stopDesc") or
+        stop.get("stopName") or
+        stop.get("stopShortName") or
+        stop.get("name") or
+        ""
+    )
+    if not name:
+        return None
+
+    sub_name = stop.get("subName", "") or stop.get("platform", "")
+    # subName is often the platform number like "01", "02"
+    if sub_name:
+        sub_name = str(sub_name).zfill(2) if str(sub_name).isdigit() else sub_name
+
+    full_name = f"{name} {sub_name}".strip() if sub_name else name
+
+    return {
+        "name": full_name,
+        "short_name": name,
+        "platform": sub_name,
+        "zone": stop.get("zoneName", "") or stop.get("zone", ""),
+        "lat": stop.get("stopLat"),
+        "lon": stop.get("stopLon"),
+        "type": stop.get("type", "BUS"),  # API returns "BUS" or "TRAM" as string
+        "wheelchair_accessible": bool(stop.get("wheelchairBoarding", 0)),
+        "on_demand": bool(stop.get("onDemand", 0)),
+        "zone_border": bool(stop.get("ticketZoneBorder", 0)),
+    }
+
+
+def build_stop_index(
+    body: bytes, stop_ids: set[int] | None = None
+) -> Mapping[str, dict[str, Any]]:
+    """Decode a stops payload into a read-only index of stop ID -> stop info.
+
+    When stop_ids is given, only those stops are indexed.
+    """
+    index: dict[str, dict[str, Any]] = {}
+    for stop in parse_stops_payload(body):
+        stop_id_raw = stop.get("stopId")
+        if stop_id_raw is None:
+            continue
+
+        stop_id = int(stop_id_raw)
+        if stop_ids is not None and stop_id not in stop_ids:
+            continue
+
+        info = build_stop_info(stop)
+        if info is None:
+            _LOGGER.debug("Stop %s has no name fields", stop_id)
+            continue
+        index[str(stop_id)] = info
+
+    return MappingProxyType(index)
+
+
+def build_vehicle_index(body: bytes) -> Mapping[str, dict[str, Any]]:
+    """Decode the vehicles payload into a read-only index of vehicle code -> info."""
+    data = json.loads(body)
+    index: dict[str, dict[str, Any]] = {}
+    for vehicle in data.get("results", []):
+        vehicle_code = str(vehicle.get("vehicleCode", ""))
+        if vehicle_code:
+            index[vehicle_code] = {
+                "wheelchair_accessible": vehicle.get("wheelchairsRamp", False),
+                "low_floor": "niskopodłogowy" in (vehicle.get("floorHeight") or "").lower(),
+                "air_conditioning": vehicle.get("airConditioning", False),
+                "usb": vehicle.get("usb", False),
+                "bike_holders": vehicle.get("bikeHolders", 0),
+                "kneeling_mechanism": vehicle.get("kneelingMechanism", False),
+                "brand": vehicle.get("brand", ""),
+                "model": vehicle.get("model", ""),
+            }
+
+    return MappingProxyType(index)
@@ -0,0 +1,64 @@
+"""On-demand profiling of coordinator refresh cycles."""
+from __future__ import annotations
+
+import cProfile
+from contextlib import contextmanager
+import os
+import pstats
+from typing import Any, Iterator
+
+
+class RefreshProfiler:
+    """Collect cProfile data for a fixed number of refresh cycles.
+
+    cProfile hooks the whole thread, so anything else running on the event
+    loop while a refresh awaits I/O is captured as well.
+    """
+
+    def __init__(self, refreshes: int) -> None:
+        """Initialize the profiler."""
+        self.remaining = refreshes
+        self.captured = 0
+        self._profile = cProfile.Profile()
+        self._depth = 0
+
+    @property
+    def finished(self) -> bool:
+        """Return True when all requested refreshes have been captured."""
+        return self.remaining <= 0
+
+    @contextmanager
+    def capture(self) -> Iterator[None]:
+        """Profile one refresh cycle (overlapping cycles share one session)."""
+        if self._depth == 0:
+            self._profile.enable()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self._profile.disable()
+            self.remaining -= 1
+            self.captured += 1
+
+    def dump(self, path: str) -> None:
+        """Write collected stats to a file (blocking, run in executor)."""
+        self._profile.dump_stats(path)
+
+    def summary(self, top: int = 20) -> list[dict[str, Any]]:
+        """Return the top call sites by cumulative time (none if nothing was profiled)."""
+        if not self.captured:
+            return []
+        stats = pstats.Stats(self._profile)
+        rows = []
+        for (filename, line, func), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": func,
+                "location": f"{os.path.basename(filename)}:{line}",
+                "calls": calls,
+                "tottime_ms": round(tottime * 1000, 3),
+                "cumtime_ms": round(cumtime * 1000, 3),
+            })
+        rows.sort(key=lambda row: row["cumtime_ms"], reverse=True)
+        return rows[:top]
@@ -1,21 +1,33 @@
 """Sensor platform for ZTM Gdańsk."""
 from __future__ import annotations
 
+from abc import abstractmethod
 from datetime import datetime
 import logging
 from typing import Any
 
 from homeassistant.components.sensor import (
+    RestoreSensor,
     SensorDeviceClass,
     SensorEntity,
     SensorStateClass,
 )
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import (
+    ATTR_DEVICE_CLASS,
+    ATTR_FRIENDLY_NAME,
+    ATTR_ICON,
+    ATTR_UNIT_OF_MEASUREMENT,
+    PERCENTAGE,
+    EntityCategory,
+    UnitOfTime,
+)
 from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.json import json_bytes
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
-from homeassistant.util import dt as dt_util
+from homeassistant.util import dt as dt_util, slugify
 
 from .const import (
     ATTR_DELAY,
@@ -28,12 +40,42 @@ from .const import (
     ATTR_STOP_ID,
     ATTR_STOP_NAME,
     ATTR_ZONE,
+    ATTRIBUTE_FORMAT_COLUMNAR,
+    DEFAULT_ATTRIBUTE_FORMAT,
+    DEFAULT_PANEL_ATTRIBUTE_BUDGET,
     DOMAIN,
+    PANEL_BASE_BYTES,
+    PANEL_DEPARTURE_BYTES,
+    PANEL_DEPARTURE_BYTES_COLUMNAR,
+    PANEL_STOP_BYTES,
 )
-from .coordinator import ZTMCoordinator
+from .coordinator import ZTMCoordinator, build_route_index
+from .formatting import to_columns
 
 _LOGGER = logging.getLogger(__name__)
 
+# Attributes written by HA itself, not restored as extra attributes
+STATE_ONLY_ATTRIBUTES = {
+    ATTR_DEVICE_CLASS,
+    ATTR_FRIENDLY_NAME,
+    ATTR_ICON,
+    ATTR_UNIT_OF_MEASUREMENT,
+    "state_class",
+}
+
+# Metric key -> (name, unit, icon)
+METRIC_SENSORS: dict[str, tuple[str, str | None, str]] = {
+    "fetch_latency_p50": ("ZTM fetch latency p50", UnitOfTime.MILLISECONDS, "mdi:timer-outline"),
+    "fetch_latency_p95": ("ZTM fetch latency p95", UnitOfTime.MILLISECONDS, "mdi:timer-alert-outline"),
+    "error_rate": ("ZTM API error rate", PERCENTAGE, "mdi:alert-circle-outline"),
+    "refresh_duration": ("ZTM refresh duration", UnitOfTime.MILLISECONDS, "mdi:timer-sync-outline"),
+}
+
+
+def scoped_unique_id(entry_id: str | None, key: str) -> str:
+    """Return the unique ID of a per-entry entity (YAML setups have no entry)."""
+    return f"{entry_id}_{key}" if entry_id else key
+
 
 async def async_setup_platform(
     hass: HomeAssistant,
@@ -57,9 +99,19 @@ async def async_setup_platform(
     for stop_id in stop_ids:
         entities.append(ZTMStopSensor(coordinator, stop_id))
         entities.append(ZTMNextDepartureSensor(coordinator, stop_id))
+        entities.append(ZTMDataAgeSensor(coordinator, stop_id))
 
-    # Add panel sensor (aggregate)
-    entities.append(ZTMPanelSensor(coordinator, stop_ids))
+    # Add panel sensors (aggregate, sharded to stay under the attribute budget)
+    entities.extend(panel_sensors(coordinator, stop_ids, DEFAULT_PANEL_ATTRIBUTE_BUDGET))
+    entities.append(ZTMBoardSensor(coordinator))
+
+    # Merged departure timelines for stop groups
+    for group in coordinator.stop_groups:
+        entities.append(ZTMGroupSensor(coordinator, group))
+
+    # Diagnostic metrics sensors (disabled by default)
+    for metric in METRIC_SENSORS:
+        entities.append(ZTMMetricSensor(coordinator, metric))
 
     async_add_entities(entities)
 
@@ -73,28 +125,142 @@ async def async_setup_entry(
     data = hass.data[DOMAIN][entry.entry_id]
     coordinator = data["coordinator"]
     stop_ids = data["stop_ids"]
+    attribute_format = data.get("attribute_format", DEFAULT_ATTRIBUTE_FORMAT)
 
     entities = []
     
     for stop_id in stop_ids:
-        entities.append(ZTMStopSensor(coordinator, stop_id))
+        entities.append(ZTMStopSensor(coordinator, stop_id, attribute_format))
         entities.append(ZTMNextDepartureSensor(coordinator, stop_id))
+        entities.append(ZTMDataAgeSensor(coordinator, stop_id))
+
+    entities.extend(
+        panel_sensors(
+            coordinator,
+            stop_ids,
+            data.get("panel_attribute_budget", DEFAULT_PANEL_ATTRIBUTE_BUDGET),
+            attribute_format,
+            entry.entry_id,
+        )
+    )
+    entities.append(ZTMBoardSensor(coordinator, entry.entry_id))
+
+    # Merged departure timelines for stop groups
+    for group in coordinator.stop_groups:
+        entities.append(ZTMGroupSensor(coordinator, group, entry.entry_id))
 
-    entities.append(ZTMPanelSensor(coordinator, stop_ids))
+    # Next departure sensors for tracked lines
+    for route in data.get("tracked_routes", []):
+        entities.append(ZTMRouteSensor(coordinator, route, entry.entry_id))
+
+    # Diagnostic metrics sensors (disabled by default)
+    for metric in METRIC_SENSORS:
+        entities.append(ZTMMetricSensor(coordinator, metric, entry.entry_id))
 
     async_add_entities(entities)
 
 
-class ZTMStopSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
+def shard_stops(
+    stop_ids: list[int],
+    max_departures: int,
+    budget: int,
+    departure_bytes: int = PANEL_DEPARTURE_BYTES,
+) -> list[list[int]]:
+    """Split stops into panel shards whose estimated attribute size fits the budget.
+
+    A budget of 0 keeps all stops in one panel.
+    """
+    if budget <= 0:
+        return [stop_ids]
+    stop_bytes = PANEL_STOP_BYTES + max_departures * departure_bytes
+    per_shard = max(1, (budget - PANEL_BASE_BYTES) // stop_bytes)
+    return [
+        stop_ids[start:start + per_shard]
+        for start in range(0, len(stop_ids), per_shard)
+    ] or [[]]
+
+
+def panel_sensors(
+    coordinator: ZTMCoordinator,
+    stop_ids: list[int],
+    budget: int,
+    attribute_format: str = DEFAULT_ATTRIBUTE_FORMAT,
+    entry_id: str | None = None,
+) -> list[ZTMPanelSensor]:
+    """Return the panel sensors of all stops, sharded by the attribute budget."""
+    shards = shard_stops(
+        stop_ids,
+        coordinator.max_departures,
+        budget,
+        PANEL_DEPARTURE_BYTES_COLUMNAR
+        if attribute_format == ATTRIBUTE_FORMAT_COLUMNAR
+        else PANEL_DEPARTURE_BYTES,
+    )
+    coordinator.panel_shards = shards
+    return [
+        ZTMPanelSensor(
+            coordinator,
+            shard_stop_ids,
+            index,
+            len(shards),
+            budget,
+            attribute_format,
+            entry_id,
+        )
+        for index, shard_stop_ids in enumerate(shards, start=1)
+    ]
+
+
+class ZTMRestoreSensor(CoordinatorEntity[ZTMCoordinator], RestoreSensor):
+    """Coordinator sensor showing its last known state until the first fetch."""
+
+    _restored_value: Any = None
+    _restored_attributes: dict[str, Any] = {}
+
+    async def async_added_to_hass(self) -> None:
+        """Restore the last state while the first refresh runs in the background."""
+        await super().async_added_to_hass()
+
+        if (last_data := await self.async_get_last_sensor_data()) is not None:
+            self._restored_value = last_data.native_value
+        if (last_state := await self.async_get_last_state()) is not None:
+            self._restored_attributes = {
+                key: value
+                for key, value in last_state.attributes.items()
+                if key not in STATE_ONLY_ATTRIBUTES
+            }
+
+    @property
+    def _restoring(self) -> bool:
+        """Return True while no data has been fetched yet."""
+        return self.coordinator.data is None
+
+    @callback
+    def async_write_ha_state(self) -> None:
+        """Write the state, attributing loop stalls to this entity when monitored."""
+        if (monitor := self.coordinator.lag_monitor) is None:
+            super().async_write_ha_state()
+            return
+        with monitor.section("state_write", self.entity_id):
+            super().async_write_ha_state()
+
+
+class ZTMStopSensor(ZTMRestoreSensor):
     """Sensor representing a ZTM stop with departures."""
 
     _attr_has_entity_name = True
     _attr_state_class = SensorStateClass.MEASUREMENT
 
-    def __init__(self, coordinator: ZTMCoordinator, stop_id: int) -> None:
+    def __init__(
+        self,
+        coordinator: ZTMCoordinator,
+        stop_id: int,
+        attribute_format: str = DEFAULT_ATTRIBUTE_FORMAT,
+    ) -> None:
         """Initialize the sensor."""
         super().__init__(coordinator)
         self._stop_id = stop_id
+        self._columnar = attribute_format == ATTRIBUTE_FORMAT_COLUMNAR
         self._attr_unique_id = f"ztm_stop_{stop_id}"
 
     @property
@@ -105,6 +271,8 @@ class ZTMStopSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
     @property
     def native_value(self) -> int:
         """Return the number of upcoming departures."""
+        if self._restoring:
+            return self._restored_value
         return len(self.coordinator.get_departures(self._stop_id))
 
     @property
@@ -122,16 +290,19 @@ class ZTMStopSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
     @property
     def extra_state_attributes(self) -> dict[str, Any]:
         """Return extra state attributes."""
+        if self._restoring:
+            return self._restored_attributes
         departures = self.coordinator.get_departures(self._stop_id)
         stop_info = self.coordinator.get_stop_info(self._stop_id)
         
         # Format departures for attributes
         formatted_departures = []
         max_deps = self.coordinator.max_departures
-        for dep in departures[:max_deps]:
-            formatted_departures.append(self.coordinator.format_departure(dep, include_is_realtime=True))
+        with self.coordinator.blocking_span("format", self.entity_id):
+            for dep in departures[:max_deps]:
+                formatted_departures.append(self.coordinator.format_departure(dep, include_is_realtime=True))
 
-        return {
+        attributes = {
             ATTR_STOP_ID: self._stop_id,
             ATTR_STOP_NAME: stop_info.get("name", f"Przystanek {self._stop_id}"),
             ATTR_PLATFORM: stop_info.get("platform", ""),
@@ -142,6 +313,12 @@ class ZTMStopSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
             ATTR_DEPARTURES: formatted_departures,
             "departures_raw": departures,
         }
+        if self._columnar:
+            with self.coordinator.blocking_span("format", self.entity_id):
+                attributes[ATTR_DEPARTURES] = to_columns(formatted_departures)
+                attributes["departures_raw"] = to_columns(departures)
+            attributes["attribute_format"] = ATTRIBUTE_FORMAT_COLUMNAR
+        return attributes
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -154,7 +331,7 @@ class ZTMStopSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
         )
 
 
-class ZTMNextDepartureSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
+class ZTMNextDepartureSensor(ZTMRestoreSensor):
     """Sensor showing next departure from a stop."""
 
     _attr_has_entity_name = True
@@ -176,6 +353,8 @@ class ZTMNextDepartureSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
     @property
     def native_value(self) -> int | None:
         """Return minutes to next departure."""
+        if self._restoring:
+            return self._restored_value
         departures = self.coordinator.get_departures(self._stop_id)
         if not departures:
             return None
@@ -196,6 +375,8 @@ class ZTMNextDepartureSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
     @property
     def extra_state_attributes(self) -> dict[str, Any]:
         """Return extra attributes."""
+        if self._restoring:
+            return self._restored_attributes
         departures = self.coordinator.get_departures(self._stop_id)
         if not departures:
             return {}
@@ -219,31 +400,125 @@ class ZTMNextDepartureSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
         )
 
 
-class ZTMPanelSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
-    """Aggregate sensor for all stops."""
+class ZTMPanelSensor(ZTMRestoreSensor):
+    """Aggregate sensor for all stops, or for one shard of them."""
 
     _attr_has_entity_name = True
-    _attr_name = "ZTM Panel"
-    _attr_unique_id = "ztm_panel"
     _attr_icon = "mdi:bus-clock"
 
-    def __init__(self, coordinator: ZTMCoordinator, stop_ids: list[int]) -> None:
+    def __init__(
+        self,
+        coordinator: ZTMCoordinator,
+        stop_ids: list[int],
+        shard: int = 1,
+        shards: int = 1,
+        budget: int = DEFAULT_PANEL_ATTRIBUTE_BUDGET,
+        attribute_format: str = DEFAULT_ATTRIBUTE_FORMAT,
+        entry_id: str | None = None,
+    ) -> None:
         """Initialize the sensor."""
         super().__init__(coordinator)
         self._stop_ids = stop_ids
+        self._shard = shard
+        self._shards = shards
+        self._budget = budget
+        self._columnar = attribute_format == ATTRIBUTE_FORMAT_COLUMNAR
+        # The first shard keeps the entity of an unsharded panel
+        if shard == 1:
+            self._attr_name = "ZTM Panel"
+            self._attr_unique_id = scoped_unique_id(entry_id, "ztm_panel")
+        else:
+            self._attr_name = f"ZTM Panel {shard}"
+            self._attr_unique_id = scoped_unique_id(entry_id, f"ztm_panel_{shard}")
+        self._truncated = False
+        # Attributes of the latest coordinator data (built once per update)
+        self._attributes_for: dict[str, Any] | None = None
+        self._attributes: dict[str, Any] = {}
 
     @property
     def native_value(self) -> str:
         """Return last update time."""
+        if self._restoring and self._restored_value is not None:
+            return self._restored_value
         if self.coordinator.data:
             return self.coordinator.data.get("last_update", "")[:19]
         return "Brak danych"
 
     @property
     def extra_state_attributes(self) -> dict[str, Any]:
-        """Return all stops data for Lovelace."""
+        """Return all stops data for Lovelace, within the attribute budget.
+
+        If the serialized attributes exceed the budget (if any), fewer departures per
+        stop are listed: the limit is scaled down by the measured size, then
+        lowered further only if they still do not fit. The result is kept
+        until the coordinator has new data.
+        """
+        if self._restoring:
+            return self._restored_attributes
+        if self._attributes_for is self.coordinator.data:
+            return self._attributes
+
+        limit = self.coordinator.max_departures
+        routes = self._route_index()
+        attributes = self._build_attributes(limit, routes)
+        with self.coordinator.blocking_span("measure", self.entity_id):
+            size = len(json_bytes(attributes))
+        if self._budget and size > self._budget and limit > 0:
+            limit = min(limit - 1, limit * self._budget // size)
+            while True:
+                attributes = self._build_attributes(limit, routes)
+                with self.coordinator.blocking_span("measure", self.entity_id):
+                    size = len(json_bytes(attributes))
+                if size <= self._budget or limit == 0:
+                    break
+                limit -= 1
+
+        truncated = limit < self.coordinator.max_departures
+        if truncated and not self._truncated:
+            _LOGGER.warning(
+                "%s attributes exceed the %d byte budget, listing %d departures per stop",
+                self.entity_id or self.unique_id,
+                self._budget,
+                limit,
+            )
+        self._truncated = truncated
+        self.coordinator.attribute_sizes[self.entity_id or self.unique_id] = {
+            "stops": len(self._stop_ids),
+            "bytes": size,
+            "budget": self._budget,
+            "departures_per_stop": limit,
+        }
+        attributes["attributes_bytes"] = size
+        attributes["truncated"] = truncated
+        self._attributes_for = self.coordinator.data
+        self._attributes = attributes
+        return attributes
+
+    def _route_index(self) -> dict[str, list[tuple[str, dict]]]:
+        """Return the route index of the panel's own stops.
+
+        An unsharded panel uses the coordinator's index. A shard indexes its
+        stops' departures itself, so lines serving them are not crowded out
+        by departures at other shards' stops.
+        """
+        if self._shards == 1:
+            return (self.coordinator.data or {}).get("routes", {})
+        with self.coordinator.blocking_span("routes", self.entity_id):
+            return build_route_index(
+                {
+                    str(stop_id): self.coordinator.get_departures(stop_id)
+                    for stop_id in self._stop_ids
+                },
+                self.coordinator.max_departures,
+            )
+
+    def _build_attributes(
+        self, limit: int, routes: dict[str, list[tuple[str, dict]]]
+    ) -> dict[str, Any]:
+        """Return attributes listing up to limit departures per stop."""
         stops_data = []
         total_departures = 0
+        formatted_by_dep: dict[int, dict[str, Any]] = {}
 
         for stop_id in self._stop_ids:
             departures = self.coordinator.get_departures(stop_id)
@@ -260,9 +535,11 @@ class ZTMPanelSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
 
             # Format departures
             formatted = []
-            max_deps = self.coordinator.max_departures
-            for dep in departures[:max_deps]:
-                formatted.append(self.coordinator.format_departure(dep, include_is_realtime=False))
+            with self.coordinator.blocking_span("format", self.entity_id):
+                for dep in departures[:limit]:
+                    formatted_dep = self.coordinator.format_departure(dep, include_is_realtime=False)
+                    formatted_by_dep[id(dep)] = formatted_dep
+                    formatted.append(formatted_dep)
 
             stops_data.append({
                 "stop_id": stop_id,
@@ -272,15 +549,53 @@ class ZTMPanelSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
                 "on_demand": on_demand,
                 "zone_border": zone_border,
                 "departures_count": len(departures),
-                "departures": formatted,
+                "departures": to_columns(formatted) if self._columnar else formatted,
             })
 
-        return {
+        attributes = {
             "stops": stops_data,
             "total_stops": len(self._stop_ids),
             "total_departures": total_departures,
-            "icons_legend": self.coordinator.get_icons_legend(),
+            "by_route": self._by_route(routes, formatted_by_dep, limit),
         }
+        if self._shards > 1:
+            attributes["shard"] = self._shard
+            attributes["shards"] = self._shards
+        if self._shard == 1:
+            attributes["icons_legend"] = self.coordinator.get_icons_legend()
+        if self._columnar:
+            attributes["attribute_format"] = ATTRIBUTE_FORMAT_COLUMNAR
+        return attributes
+
+    def _by_route(
+        self,
+        routes: dict[str, list[tuple[str, dict]]],
+        formatted_by_dep: dict[int, dict[str, Any]],
+        limit: int,
+    ) -> dict[str, list]:
+        """Return the next departures of every line at the panel's stops.
+
+        Departures already formatted for the stops list are reused.
+        """
+        by_route = {}
+        with self.coordinator.blocking_span("format", self.entity_id):
+            for route, departures in sorted(routes.items()):
+                entries = []
+                for stop_id, dep in departures[:limit]:
+                    formatted_dep = formatted_by_dep.get(id(dep))
+                    if formatted_dep is None:
+                        formatted_dep = self.coordinator.format_departure(
+                            dep, include_is_realtime=False
+                        )
+                    entries.append({
+                        ATTR_STOP_ID: int(stop_id),
+                        ATTR_HEADSIGN: formatted_dep["headsign"],
+                        "time": formatted_dep["time"],
+                        "minutes": formatted_dep["minutes"],
+                    })
+                if entries:
+                    by_route[route] = to_columns(entries) if self._columnar else entries
+        return by_route
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -291,3 +606,243 @@ class ZTMPanelSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
             manufacturer="ZTM Gdańsk",
             model="Panel odjazdów",
         )
+
+
+class ZTMBoardSensor(ZTMRestoreSensor):
+    """Departure board of all stops pre-rendered as text and markdown."""
+
+    _attr_has_entity_name = True
+    _attr_name = "ZTM Board"
+    _attr_icon = "mdi:message-text-clock"
+
+    def __init__(self, coordinator: ZTMCoordinator, entry_id: str | None = None) -> None:
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+        self._attr_unique_id = scoped_unique_id(entry_id, "ztm_board")
+
+    @property
+    def native_value(self) -> str:
+        """Return last update time."""
+        if self._restoring and self._restored_value is not None:
+            return self._restored_value
+        if self.coordinator.data:
+            return self.coordinator.data.get("last_update", "")[:19]
+        return "Brak danych"
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Return the board rendered once per update by the coordinator."""
+        if self._restoring:
+            return self._restored_attributes
+        return dict(self.coordinator.get_board())
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return device info."""
+        return DeviceInfo(
+            identifiers={(DOMAIN, "panel")},
+        )
+
+
+class ZTMMergedDeparturesSensor(ZTMRestoreSensor):
+    """Sensor with one time-ordered departure list across several stops."""
+
+    _attr_has_entity_name = True
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = "min"
+
+    @abstractmethod
+    def _merged_departures(self) -> list[tuple[str, dict]]:
+        """Return the (stop ID, departure) pairs shown by the sensor."""
+
+    def _extra_attributes(self) -> dict[str, Any]:
+        """Return attributes added next to the departures."""
+        return {}
+
+    @property
+    def native_value(self) -> int | None:
+        """Return minutes to the next departure."""
+        if self._restoring:
+            return self._restored_value
+        departures = self._merged_departures()
+        if not departures:
+            return None
+
+        try:
+            est_time = departures[0][1].get("estimatedTime", "")
+            est_dt = datetime.fromisoformat(est_time.replace("Z", "+00:00"))
+            minutes = int((est_dt - datetime.now(est_dt.tzinfo)).total_seconds() / 60)
+            return max(0, minutes)
+        except (ValueError, TypeError):
+            return None
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Return the merged departures with their stop."""
+        if self._restoring:
+            return self._restored_attributes
+        formatted = []
+        with self.coordinator.blocking_span("format", self.entity_id):
+            for stop_id, dep in self._merged_departures():
+                stop_info = self.coordinator.get_stop_info(stop_id)
+                formatted.append({
+                    ATTR_STOP_ID: int(stop_id),
+                    ATTR_STOP_NAME: stop_info.get("name", f"Przystanek {stop_id}"),
+                    ATTR_PLATFORM: stop_info.get("platform", ""),
+                    **self.coordinator.format_departure(dep, include_is_realtime=True),
+                })
+
+        return {
+            **self._extra_attributes(),
+            ATTR_DEPARTURES: formatted,
+        }
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return device info."""
+        return DeviceInfo(
+            identifiers={(DOMAIN, "panel")},
+        )
+
+
+class ZTMGroupSensor(ZTMMergedDeparturesSensor):
+    """Sensor with one time-ordered departure list for a group of stops."""
+
+    _attr_icon = "mdi:bus-multiple"
+
+    def __init__(
+        self, coordinator: ZTMCoordinator, group: str, entry_id: str | None = None
+    ) -> None:
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+        self._group = group
+        self._attr_name = group
+        self._attr_unique_id = scoped_unique_id(entry_id, f"ztm_group_{slugify(group)}")
+
+    def _merged_departures(self) -> list[tuple[str, dict]]:
+        """Return the group's merged departures."""
+        return self.coordinator.get_group_departures(self._group)
+
+    def _extra_attributes(self) -> dict[str, Any]:
+        """Return the group's stops."""
+        return {"stop_ids": self.coordinator.stop_groups.get(self._group, [])}
+
+
+class ZTMRouteSensor(ZTMMergedDeparturesSensor):
+    """Sensor with the next departures of one line from any monitored stop."""
+
+    _attr_icon = "mdi:bus-marker"
+
+    def __init__(
+        self, coordinator: ZTMCoordinator, route: str, entry_id: str | None = None
+    ) -> None:
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+        self._route = route
+        self._attr_name = f"ZTM {route}"
+        self._attr_unique_id = scoped_unique_id(entry_id, f"ztm_route_{slugify(route)}")
+
+    def _merged_departures(self) -> list[tuple[str, dict]]:
+        """Return the line's departures across all stops."""
+        return self.coordinator.get_route_departures(self._route)
+
+    def _extra_attributes(self) -> dict[str, Any]:
+        """Return the line name."""
+        return {ATTR_ROUTE: self._route}
+
+
+class ZTMMetricSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
+    """Diagnostic sensor exposing refresh metrics."""
+
+    _attr_has_entity_name = True
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_state_class = SensorStateClass.MEASUREMENT
+
+    def __init__(
+        self, coordinator: ZTMCoordinator, metric: str, entry_id: str | None = None
+    ) -> None:
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+        self._metric = metric
+        name, unit, icon = METRIC_SENSORS[metric]
+        self._attr_name = name
+        self._attr_native_unit_of_measurement = unit
+        self._attr_icon = icon
+        self._attr_unique_id = scoped_unique_id(entry_id, f"ztm_metric_{metric}")
+
+    @property
+    def native_value(self) -> float | None:
+        """Return the current metric value."""
+        metrics = self.coordinator.metrics
+        if self._metric == "fetch_latency_p50":
+            return metrics.latency_percentile(50)
+        if self._metric == "fetch_latency_p95":
+            return metrics.latency_percentile(95)
+        if self._metric == "error_rate":
+            rate = metrics.error_rate()
+            return round(rate * 100, 1) if rate is not None else None
+        if self._metric == "refresh_duration":
+            duration = metrics.last_refresh_duration
+            return round(duration, 1) if duration is not None else None
+        return None
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Return counters and phase timings of the latest refresh."""
+        if self._metric != "refresh_duration":
+            return {}
+        return {
+            "phases_ms": self.coordinator.metrics.last_refresh_phases,
+            **self.coordinator.metrics.counters,
+        }
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return device info."""
+        return DeviceInfo(
+            identifiers={(DOMAIN, "panel")},
+        )
+
+
+class ZTMDataAgeSensor(CoordinatorEntity[ZTMCoordinator], SensorEntity):
+    """Diagnostic sensor showing how old the departures of a stop are."""
+
+    _attr_has_entity_name = True
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.SECONDS
+    _attr_icon = "mdi:clock-alert-outline"
+
+    def __init__(self, coordinator: ZTMCoordinator, stop_id: int) -> None:
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+        self._stop_id = stop_id
+        self._attr_unique_id = f"ztm_data_age_{stop_id}"
+
+    @property
+    def name(self) -> str:
+        """Return the name."""
+        stop_name = self.coordinator.get_stop_name(self._stop_id)
+        return f"{stop_name} - wiek danych"
+
+    @property
+    def native_value(self) -> float | None:
+        """Return seconds since the last successful fetch for this stop."""
+        return self.coordinator.metrics.data_age(self._stop_id)
+
+    @property
+    def extra_state_attributes(self) -> dict[str, Any]:
+        """Return per-stop fetch latency percentiles."""
+        return {
+            "fetch_latency_p50": self.coordinator.metrics.latency_percentile(50, self._stop_id),
+            "fetch_latency_p95": self.coordinator.metrics.latency_percentile(95, self._stop_id),
+        }
+
+    @property
+    def device_info(self) -> DeviceInfo:
+        """Return device info."""
+        return DeviceInfo(
+            identifiers={(DOMAIN, str(self._stop_id))},
+        )
@@ -0,0 +1,333 @@
+"""Compact, memory-mappable snapshots of the stops and vehicles indexes.
+
+A snapshot stores an index (ID -> info dict) as columns instead of one dict
+per record: a sorted array of integer IDs, one fixed-width array per field and
+a deduplicated string table. It is opened with mmap, so startup does not
+decode anything and only records that are actually looked up become dicts
+(the most recently used of them are kept).
+
+File layout (preamble little-endian, arrays in native byte order):
+
+    b"ZTMS" | u16 version | u32 header length | header (JSON) | sections
+
+The header lists the kind, creation time, row count and the byte offset of
+every section. Sections are 8-byte aligned arrays ("I" u32, "i" i32,
+"d" float64, "B" u8) plus the UTF-8 string blob.
+
+Reading and writing files is blocking; run them in an executor.
+"""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import time
+from typing import Any, Iterator, Mapping
+
+from .cache import TTLCache, approximate_size
+from .const import SNAPSHOT_DECODED_RECORDS
+from .parsing import build_stop_index, build_vehicle_index
+
+_LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"ZTMS"
+SNAPSHOT_VERSION = 1
+_PREAMBLE = struct.Struct("<4sHI")
+
+# Field name -> column kind ("str", "float", "int" or "bool")
+STOP_COLUMNS: dict[str, str] = {
+    "name": "str",
+    "short_name": "str",
+    "platform": "str",
+    "zone": "str",
+    "lat": "float",
+    "lon": "float",
+    "type": "str",
+    "wheelchair_accessible": "bool",
+    "on_demand": "bool",
+    "zone_border": "bool",
+}
+
+VEHICLE_COLUMNS: dict[str, str] = {
+    "wheelchair_accessible": "bool",
+    "low_floor": "bool",
+    "air_conditioning": "bool",
+    "usb": "bool",
+    "bike_holders": "int",
+    "kneeling_mechanism": "bool",
+    "brand": "str",
+    "model": "str",
+}
+
+_TYPECODES = {"str": "I", "float": "d", "int": "i", "bool": "B"}
+
+
+def build_snapshot(
+    kind: str, index: Mapping[str, dict[str, Any]], columns: dict[str, str]
+) -> bytes:
+    """Encode an index as snapshot bytes. Records with non-numeric IDs are skipped."""
+    rows = sorted(
+        (int(key), info) for key, info in index.items() if str(key).isdigit()
+    )
+    if len(rows) != len(index):
+        _LOGGER.debug("Skipped %d non-numeric IDs in %s snapshot", len(index) - len(rows), kind)
+
+    strings: dict[str, int] = {"": 0}
+
+    def string_id(value: Any) -> int:
+        text = "" if value is None else str(value)
+        return strings.setdefault(text, len(strings))
+
+    sections: list[tuple[str, bytes]] = [("keys", array("I", (key for key, _ in rows)).tobytes())]
+    for field, column_kind in columns.items():
+        values = (info.get(field) for _, info in rows)
+        if column_kind == "str":
+            data = array("I", (string_id(v) for v in values))
+        elif column_kind == "float":
+            data = array("d", (math.nan if v is None else float(v) for v in values))
+        elif column_kind == "int":
+            data = array("i", (int(v or 0) for v in values))
+        else:
+            data = array("B", (1 if v else 0 for v in values))
+        sections.append((field, data.tobytes()))
+
+    blob = bytearray()
+    offsets = array("I", [0])
+    for text in strings:
+        blob += text.encode()
+        offsets.append(len(blob))
+    sections.append(("string_offsets", offsets.tobytes()))
+    sections.append(("string_blob", bytes(blob)))
+
+    # Section offsets are relative to the end of the header
+    layout: dict[str, list[int]] = {}
+    position = 0
+    for name, data in sections:
+        layout[name] = [position, len(data)]
+        position += len(data) + (-len(data) % 8)
+    header = json.dumps(
+        {
+            "kind": kind,
+            "created": time.time(),
+            "rows": len(rows),
+            "columns": columns,
+            "sections": layout,
+        }
+    ).encode()
+    header += b" " * (-(_PREAMBLE.size + len(header)) % 8)
+
+    out = bytearray(_PREAMBLE.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header)))
+    out += header
+    for _, data in sections:
+        out += data
+        out += b"\0" * (-len(data) % 8)
+    return bytes(out)
+
+
+def write_snapshot(
+    path: str, kind: str, index: Mapping[str, dict[str, Any]], columns: dict[str, str]
+) -> CompactIndex:
+    """Write an index snapshot atomically and return it opened from disk."""
+    data = build_snapshot(kind, index, columns)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".ztm_snapshot_")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        os.unlink(tmp_path)
+        raise
+    return CompactIndex.open(path)
+
+
+def open_snapshot(
+    path: str, columns: dict[str, str], max_age: float | None = None
+) -> CompactIndex | None:
+    """Open a snapshot, or return None if it is missing, stale or incompatible."""
+    try:
+        snapshot = CompactIndex.open(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as err:
+        _LOGGER.warning("Ignoring unreadable snapshot %s: %s", path, err)
+        return None
+    if snapshot.columns != columns:
+        _LOGGER.debug("Snapshot %s has other columns, ignoring it", path)
+        return None
+    if max_age is not None and time.time() - snapshot.created > max_age:
+        _LOGGER.debug("Snapshot %s is older than %ds", path, max_age)
+        return None
+    return snapshot
+
+
+class CompactIndex(Mapping[str, dict[str, Any]]):
+    """Read-only ID -> info mapping backed by snapshot bytes.
+
+    Records are decoded on first access and the least recently used are
+    dropped beyond max_decoded, so memory depends on the records in use
+    rather than on the size of the database.
+    """
+
+    def __init__(
+        self, buffer: bytes | mmap.mmap, max_decoded: int = SNAPSHOT_DECODED_RECORDS
+    ) -> None:
+        """Parse the snapshot header. Raises ValueError if it is invalid."""
+        view = memoryview(buffer)
+        if len(view) < _PREAMBLE.size:
+            raise ValueError("Snapshot is truncated")
+        magic, version, header_len = _PREAMBLE.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {magic!r} v{version}")
+        header = json.loads(bytes(view[_PREAMBLE.size:_PREAMBLE.size + header_len]))
+        base = _PREAMBLE.size + header_len
+
+        def section(name: str) -> memoryview:
+            offset, length = header["sections"][name]
+            return view[base + offset:base + offset + length]
+
+        self._buffer = buffer
+        self.kind: str = header["kind"]
+        self.created: float = header["created"]
+        self.columns: dict[str, str] = header["columns"]
+        self._keys = section("keys").cast("I")
+        self._columns = [
+            (field, column_kind, section(field).cast(_TYPECODES[column_kind]))
+            for field, column_kind in self.columns.items()
+        ]
+        self._string_offsets = section("string_offsets").cast("I")
+        self._string_blob = section("string_blob")
+        self._rows: TTLCache[int, dict[str, Any]] = TTLCache(
+            max_decoded, None, approximate_size
+        )
+
+    @classmethod
+    def open(cls, path: str) -> CompactIndex:
+        """Memory-map a snapshot file."""
+        with open(path, "rb") as file:
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _string(self, string_id: int) -> str:
+        start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1]
+        return str(self._string_blob[start:end], "utf-8")
+
+    def _row(self, key: Any) -> int | None:
+        try:
+            wanted = int(key)
+        except (TypeError, ValueError):
+            return None
+        row = bisect_left(self._keys, wanted)
+        if row < len(self._keys) and self._keys[row] == wanted:
+            return row
+        return None
+
+    def _decode(self, row: int) -> dict[str, Any]:
+        info = {}
+        for field, column_kind, values in self._columns:
+            value = values[row]
+            if column_kind == "str":
+                value = self._string(value)
+            elif column_kind == "float":
+                value = None if math.isnan(value) else value
+            elif column_kind == "bool":
+                value = bool(value)
+            info[field] = value
+        return info
+
+    def __getitem__(self, key: Any) -> dict[str, Any]:
+        """Return the info of an ID, decoding it on first access."""
+        row = self._row(key)
+        if row is None:
+            raise KeyError(key)
+        info = self._rows.get(row)
+        if info is None:
+            info = self._decode(row)
+            self._rows.set(row, info)
+        return info
+
+    def record(self, key: Any) -> dict[str, Any]:
+        """Return the info of an ID without keeping the decoded record."""
+        row = self._row(key)
+        if row is None:
+            raise KeyError(key)
+        return self._rows.get(row) if row in self._rows else self._decode(row)
+
+    def __contains__(self, key: object) -> bool:
+        """Return True if the ID is in the snapshot (without decoding it)."""
+        return self._row(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over IDs as strings."""
+        return (str(key) for key in self._keys)
+
+    def __len__(self) -> int:
+        """Return the number of records."""
+        return len(self._keys)
+
+    @property
+    def decoded(self) -> int:
+        """Return the number of records kept decoded."""
+        return len(self._rows)
+
+    def cache_stats(self) -> dict[str, Any]:
+        """Return the decoded records cache statistics and the snapshot size."""
+        return {**self._rows.stats(), "snapshot_bytes": len(self._buffer)}
+
+
+def diff_indexes(
+    old: Mapping[str, dict[str, Any]],
+    new: Mapping[str, dict[str, Any]],
+    field: str | None = None,
+) -> dict[str, list[str]]:
+    """Return IDs added, removed and changed from one index version to the next.
+
+    With field, only a change of that field (e.g. a stop's name) counts.
+    Snapshot records are compared without being kept decoded.
+    """
+
+    def peek(index: Mapping[str, dict[str, Any]], key: str) -> dict[str, Any]:
+        return index.record(key) if isinstance(index, CompactIndex) else index[key]
+
+    old_keys, new_keys = set(old), set(new)
+    changed = []
+    for key in old_keys & new_keys:
+        before, after = peek(old, key), peek(new, key)
+        if (before.get(field) != after.get(field)) if field else before != after:
+            changed.append(key)
+
+    def ordered(keys: set[str] | list[str]) -> list[str]:
+        return sorted(keys, key=lambda key: (len(key), key))
+
+    return {
+        "added": ordered(new_keys - old_keys),
+        "removed": ordered(old_keys - new_keys),
+        "changed": ordered(changed),
+    }
+
+
+def _write_or_keep(
+    path: str, kind: str, index: Mapping[str, dict[str, Any]], columns: dict[str, str]
+) -> CompactIndex:
+    """Write a snapshot, falling back to an in-memory one if the file cannot be written."""
+    try:
+        return write_snapshot(path, kind, index, columns)
+    except OSError as err:
+        _LOGGER.warning("Could not write snapshot %s: %s", path, err)
+        return CompactIndex(build_snapshot(kind, index, columns))
+
+
+def build_stop_snapshot(body: bytes, path: str) -> CompactIndex:
+    """Index every stop of a stops payload into a snapshot file."""
+    return _write_or_keep(path, "stops", build_stop_index(body), STOP_COLUMNS)
+
+
+def build_vehicle_snapshot(body: bytes, path: str) -> CompactIndex:
+    """Index the vehicles payload into a snapshot file."""
+    return _write_or_keep(path, "vehicles", build_vehicle_index(body), VEHICLE_COLUMNS)
@@ -0,0 +1,270 @@
+"""HTTP transports for the ZTM API: live, recording and replay.
+
+A capture is a gzip-compressed JSONL file with one line per response:
+
+    {"t": 12.031, "url": "...", "elapsed_ms": 84.2, "status": 200, "body": "..."}
+
+Failed requests are recorded with their HTTP status or an "error" type and
+no body. ReplayTransport serves a capture back without any network access.
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import gzip
+import json
+import logging
+import time
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+import aiohttp
+from aiohttp import hdrs
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+from .const import API_RECORD_PATH
+
+_LOGGER = logging.getLogger(__name__)
+
+_recorders: dict[str, RecordingTransport] = {}
+
+
+@dataclass(frozen=True)
+class Validators:
+    """Cache validators of a response, sent back to make the next request conditional."""
+
+    etag: str | None = None
+    last_modified: str | None = None
+
+    def headers(self) -> dict[str, str]:
+        """Return the conditional request headers."""
+        headers = {}
+        if self.etag:
+            headers[hdrs.IF_NONE_MATCH] = self.etag
+        if self.last_modified:
+            headers[hdrs.IF_MODIFIED_SINCE] = self.last_modified
+        return headers
+
+
+class HttpTransport:
+    """Fetch API responses over HTTP."""
+
+    def session(self) -> aiohttp.ClientSession:
+        """Return a new client session."""
+        return aiohttp.ClientSession()
+
+    async def get(
+        self, session: aiohttp.ClientSession, url: str, timeout: float
+    ) -> bytes:
+        """Return the body of a GET request. Raises aiohttp.ClientError on failure."""
+        async with session.get(
+            url, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    async def get_conditional(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        timeout: float,
+        validators: Validators | None,
+    ) -> tuple[bytes | None, Validators | None]:
+        """Return the body and validators of a conditional GET request.
+
+        The body is None if the server answered 304 Not Modified, in which
+        case the previous validators stay valid.
+        """
+        async with session.get(
+            url,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            headers=validators.headers() if validators else None,
+        ) as response:
+            if response.status == 304:
+                return None, validators
+            response.raise_for_status()
+            etag = response.headers.get(hdrs.ETAG)
+            last_modified = response.headers.get(hdrs.LAST_MODIFIED)
+            return await response.read(), (
+                Validators(etag, last_modified) if etag or last_modified else None
+            )
+
+
+class RecordingTransport(HttpTransport):
+    """HTTP transport appending every response with its timing to a capture file."""
+
+    def __init__(self, path: str) -> None:
+        """Initialize the recorder (the file is opened on the first write)."""
+        self.path = path
+        self._start = time.monotonic()
+        self._file: gzip.GzipFile | None = None
+        self._closed = False
+        # A single writer thread keeps lines in order and off the event loop
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ztm_record")
+
+    async def get(
+        self, session: aiohttp.ClientSession, url: str, timeout: float
+    ) -> bytes:
+        """Fetch a response and record it.
+
+        Cancelled requests (e.g. hedge losers, shutdown) are not recorded.
+        """
+        offset = time.monotonic() - self._start
+        start = time.perf_counter()
+        record: dict[str, Any] = {"t": round(offset, 3), "url": url}
+        try:
+            body = await super().get(session, url, timeout)
+        except aiohttp.ClientResponseError as err:
+            record["status"] = err.status
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            record["error"] = type(err).__name__
+            raise
+        else:
+            record["status"] = 200
+            record["body"] = body.decode("utf-8", errors="replace")
+            return body
+        finally:
+            record["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if not self._closed and ("status" in record or "error" in record):
+                self._writer.submit(self._write, json.dumps(record, ensure_ascii=False))
+
+    async def get_conditional(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        timeout: float,
+        validators: Validators | None,
+    ) -> tuple[bytes | None, Validators | None]:
+        """Fetch a full response, so the capture always holds complete bodies."""
+        return await self.get(session, url, timeout), None
+
+    def _write(self, line: str) -> None:
+        """Append a line to the capture (runs in the writer thread)."""
+        if self._file is None:
+            # Appending adds a gzip member; gzip.open reads them as one stream
+            self._file = gzip.open(self.path, "ab")
+        self._file.write(line.encode() + b"\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        """Flush and close the capture file."""
+        self._closed = True
+        self._writer.submit(self._close)
+        self._writer.shutdown(wait=True)
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ReplayTransport(HttpTransport):
+    """Serve responses from a capture file instead of the network.
+
+    URLs are matched on their file name and stop ID only, so a capture made
+    against another API host still replays. Responses are returned per URL in
+    recorded order; once a URL's responses
+    are used up, its last one is repeated. With speed=1.0 every response takes
+    as long as it did when recorded, speed=10.0 is ten times faster and
+    speed=0 returns immediately.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0) -> None:
+        """Load a capture file (blocking; run in an executor inside HA)."""
+        self.path = path
+        self.speed = speed
+        self._responses: dict[str, deque[dict[str, Any]]] = defaultdict(deque)
+        with gzip.open(path, "rt", encoding="utf-8") as capture:
+            try:
+                for line in capture:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._responses[_replay_key(record["url"])].append(record)
+            except (EOFError, json.JSONDecodeError):
+                # Capture of a process that did not shut down cleanly
+                _LOGGER.warning("Capture %s is truncated, replaying what was read", path)
+        _LOGGER.debug(
+            "Loaded %d recorded responses for %d URLs from %s",
+            sum(len(r) for r in self._responses.values()),
+            len(self._responses),
+            path,
+        )
+
+    @property
+    def stop_ids(self) -> list[int]:
+        """Return IDs of the stops whose departures are in the capture."""
+        return sorted(
+            int(key.rsplit("=", 1)[1]) for key in self._responses if "?stopId=" in key
+        )
+
+    async def get(
+        self, session: aiohttp.ClientSession, url: str, timeout: float
+    ) -> bytes:
+        """Return the next recorded response for a URL."""
+        responses = self._responses.get(_replay_key(url))
+        if not responses:
+            raise aiohttp.ClientConnectionError(f"No recorded response for {url}")
+        record = responses.popleft() if len(responses) > 1 else responses[0]
+
+        if self.speed > 0:
+            delay = record.get("elapsed_ms", 0) / 1000 / self.speed
+            if delay > timeout:
+                await asyncio.sleep(timeout)
+                raise asyncio.TimeoutError
+            await asyncio.sleep(delay)
+
+        if "error" in record:
+            if record["error"] == "TimeoutError":
+                raise asyncio.TimeoutError
+            raise aiohttp.ClientConnectionError(f"Recorded {record['error']} for {url}")
+        if record.get("status", 200) >= 400:
+            raise aiohttp.ClientResponseError(
+                aiohttp.RequestInfo(URL(url), "GET", CIMultiDictProxy(CIMultiDict()), URL(url)),
+                (),
+                status=record["status"],
+                message="Recorded error response",
+            )
+        if "body" not in record:
+            raise aiohttp.ClientConnectionError(f"Recorded response for {url} has no body")
+        return record["body"].encode()
+
+    async def get_conditional(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        timeout: float,
+        validators: Validators | None,
+    ) -> tuple[bytes | None, Validators | None]:
+        """Return the next recorded response (captures hold no validators)."""
+        return await self.get(session, url, timeout), None
+
+
+def _replay_key(url: str) -> str:
+    """Return the host-independent key of an API URL."""
+    parts = urlsplit(url)
+    name = parts.path.rsplit("/", 1)[-1]
+    stop_id = parse_qs(parts.query).get("stopId")
+    return f"{name}?stopId={stop_id[0]}" if stop_id else name
+
+
+def close_recorders() -> None:
+    """Close all capture files (blocking)."""
+    while _recorders:
+        _recorders.popitem()[1].close()
+
+
+def get_transport() -> HttpTransport:
+    """Return the default transport (recording when ZTM_GDANSK_RECORD is set).
+
+    All coordinators share one recorder per capture file.
+    """
+    if not API_RECORD_PATH:
+        return HttpTransport()
+    if API_RECORD_PATH not in _recorders:
+        _LOGGER.warning("Recording ZTM API traffic to %s", API_RECORD_PATH)
+        _recorders[API_RECORD_PATH] = RecordingTransport(API_RECORD_PATH)
+    return _recorders[API_RECORD_PATH]
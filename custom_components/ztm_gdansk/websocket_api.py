@@ -0,0 +1,167 @@
+"""Websocket API for ZTM Gdańsk dashboard cards."""
+from __future__ import annotations
+
+from typing import Any
+
+import voluptuous as vol
+
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant, callback
+import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.dispatcher import async_dispatcher_connect
+
+from .const import DOMAIN, SIGNAL_COORDINATORS_CHANGED
+from .coordinator import ZTMCoordinator, departure_key, get_coordinators
+
+# Stop ID -> departure key -> formatted departure
+Snapshot = dict[str, dict[str, dict[str, Any]]]
+
+
+@callback
+def async_register_websocket_commands(hass: HomeAssistant) -> None:
+    """Register websocket commands."""
+    websocket_api.async_register_command(hass, ws_subscribe)
+
+
+def build_snapshot(
+    coordinators: list[ZTMCoordinator], stop_ids: set[str] | None
+) -> Snapshot:
+    """Format the current departures of the selected stops."""
+    snapshot: Snapshot = {}
+    for coordinator in coordinators:
+        for stop_id in coordinator.stop_ids:
+            stop_key = str(stop_id)
+            if stop_ids is not None and stop_key not in stop_ids:
+                continue
+            departures = coordinator.get_departures(stop_id)[:coordinator.max_departures]
+            snapshot[stop_key] = {
+                departure_key(dep): coordinator.format_departure(dep)
+                for dep in departures
+            }
+    return snapshot
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> dict[str, dict[str, Any]]:
+    """Return per-stop changes between two snapshots (only stops that changed)."""
+    delta: dict[str, dict[str, Any]] = {}
+    for stop_id, departures in new.items():
+        previous = old.get(stop_id, {})
+        added = [
+            {"key": key, **dep} for key, dep in departures.items() if key not in previous
+        ]
+        removed = [key for key in previous if key not in departures]
+        changed = {}
+        for key, dep in departures.items():
+            old_dep = previous.get(key)
+            if old_dep is None or old_dep == dep:
+                continue
+            changed[key] = {
+                field: value
+                for field, value in dep.items()
+                if old_dep.get(field) != value
+            }
+
+        stop_delta: dict[str, Any] = {}
+        if added:
+            stop_delta["added"] = added
+        if removed:
+            stop_delta["removed"] = removed
+        if changed:
+            stop_delta["changed"] = changed
+        if list(departures) != list(previous):
+            stop_delta["order"] = list(departures)
+        if stop_delta:
+            delta[stop_id] = stop_delta
+
+    for stop_id in old:
+        if stop_id not in new:
+            delta[stop_id] = {"removed": list(old[stop_id]), "order": []}
+    return delta
+
+
+@websocket_api.websocket_command(
+    {
+        vol.Required("type"): "ztm_gdansk/subscribe",
+        vol.Optional("entry_id"): str,
+        vol.Optional("stop_ids"): vol.All(cv.ensure_list, [cv.positive_int]),
+    }
+)
+@callback
+def ws_subscribe(
+    hass: HomeAssistant,
+    connection: websocket_api.ActiveConnection,
+    msg: dict[str, Any],
+) -> None:
+    """Send a departures snapshot, then per-stop deltas on every update.
+
+    When a config entry is reloaded or unloaded, the subscription follows
+    the current coordinators (stops of an unloaded entry come as removed).
+    """
+
+    def resolve_coordinators() -> list[ZTMCoordinator]:
+        if "entry_id" not in msg:
+            return get_coordinators(hass)
+        entry_data = hass.data.get(DOMAIN, {}).get(msg["entry_id"])
+        if not isinstance(entry_data, dict) or "coordinator" not in entry_data:
+            return []
+        return [entry_data["coordinator"]]
+
+    coordinators = resolve_coordinators()
+    if "entry_id" in msg and not coordinators:
+        connection.send_error(msg["id"], "not_found", "Config entry not found")
+        return
+
+    stop_ids = {str(stop_id) for stop_id in msg["stop_ids"]} if "stop_ids" in msg else None
+    last_snapshot = build_snapshot(coordinators, stop_ids)
+
+    @callback
+    def async_send_delta() -> None:
+        """Send changes since the last message to the client."""
+        nonlocal last_snapshot
+        snapshot = build_snapshot(coordinators, stop_ids)
+        delta = diff_snapshots(last_snapshot, snapshot)
+        last_snapshot = snapshot
+        if delta:
+            connection.send_message(
+                websocket_api.event_message(msg["id"], {"type": "delta", "stops": delta})
+            )
+
+    unsubs = [coordinator.async_add_listener(async_send_delta) for coordinator in coordinators]
+
+    @callback
+    def async_coordinators_changed() -> None:
+        """Move the listeners to the current coordinators and send the changes."""
+        nonlocal coordinators, unsubs
+        for unsub in unsubs:
+            unsub()
+        coordinators = resolve_coordinators()
+        unsubs = [
+            coordinator.async_add_listener(async_send_delta) for coordinator in coordinators
+        ]
+        async_send_delta()
+
+    unsub_changed = async_dispatcher_connect(
+        hass, SIGNAL_COORDINATORS_CHANGED, async_coordinators_changed
+    )
+
+    @callback
+    def async_unsubscribe() -> None:
+        """Remove coordinator listeners."""
+        unsub_changed()
+        for unsub in unsubs:
+            unsub()
+
+    connection.subscriptions[msg["id"]] = async_unsubscribe
+    connection.send_result(msg["id"])
+    connection.send_message(
+        websocket_api.event_message(
+            msg["id"],
+            {
+                "type": "snapshot",
+                "stops": {
+                    stop_id: [{"key": key, **dep} for key, dep in departures.items()]
+                    for stop_id, departures in last_snapshot.items()
+                },
+            },
+        )
+    )
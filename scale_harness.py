@@ -0,0 +1,401 @@
+"""Scale harness: drive ZTMCoordinator against a local fake ZTM API server.
+
+Starts an aiohttp server mimicking /departures, the stops JSONs and
+baza-pojazdow.json, points the integration at it via ZTM_GDANSK_API_BASE and
+runs coordinator refreshes for N entries x M stops.
+
+With --record, all API responses are written to a gzip JSONL capture; with
+--replay, a capture (e.g. recorded in Home Assistant with ZTM_GDANSK_RECORD
+set) is fed back to the coordinators instead of the fake server. With
+--payload, the serialized size of stop and panel sensor attributes is compared
+between the records and columnar attribute formats.
+
+Usage:
+    python scale_harness.py --entries 3 --stops 20 --refreshes 5 --latency 50
+    python scale_harness.py --stops 20 --static-departures
+    python scale_harness.py --stops 20 --refreshes 20 --slow-rate 0.05 --hedge
+    python scale_harness.py --stops 20 --max-departures 10 --payload
+    python scale_harness.py --replay capture.jsonl.gz --replay-speed 10
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+
+class FakeZTMServer:
+    """Local server serving synthetic ZTM API payloads."""
+
+    def __init__(self, args: argparse.Namespace, stop_ids: list[int]) -> None:
+        self.args = args
+        self.stop_ids = stop_ids
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.not_modified = 0
+        self.slow = 0
+        self._static_departures: dict[int, bytes] = {}
+        self._stops_body = self._build_stops()
+        self._vehicles_body = self._build_vehicles()
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    def _build_stops(self) -> bytes:
+        stops = [
+            {
+                "stopId": stop_id,
+                "stopDesc": f"Przystanek testowy {stop_id}",
+                "subName": f"{stop_id % 10:02d}",
+                "zoneName": "Gdańsk",
+                "stopLat": 54.35,
+                "stopLon": 18.64,
+                "type": "BUS",
+                "wheelchairBoarding": 1,
+                "onDemand": 0,
+                "ticketZoneBorder": 0,
+            }
+            for stop_id in self.stop_ids
+        ]
+        # Padding stops to emulate the size of the real stops database
+        stops.extend(
+            {"stopId": 900000 + i, "stopDesc": f"Inny przystanek {i}", "subName": "01"}
+            for i in range(self.args.stops_db)
+        )
+        date_key = datetime.now().strftime("%Y-%m-%d")
+        return json.dumps(
+            {date_key: {"lastUpdate": date_key, "stops": stops}}
+        ).encode()
+
+    def _build_vehicles(self) -> bytes:
+        vehicles = [
+            {
+                "vehicleCode": 1000 + i,
+                "wheelchairsRamp": True,
+                "floorHeight": "Niskopodłogowy",
+                "airConditioning": i % 2 == 0,
+                "usb": i % 3 == 0,
+                "bikeHolders": i % 4,
+                "kneelingMechanism": True,
+                "brand": "Solaris",
+                "model": "Urbino 12",
+            }
+            for i in range(self.args.vehicles)
+        ]
+        return json.dumps({"count": len(vehicles), "results": vehicles}).encode()
+
+    def _build_departures(self, stop_id: int) -> bytes:
+        now = datetime.now(timezone.utc)
+        departures = []
+        for i in range(self.args.departures):
+            est = now + timedelta(minutes=2 * i + 1)
+            departures.append({
+                "id": f"T{stop_id}R{i}",
+                "delayInSeconds": random.randint(-30, 300),
+                "estimatedTime": est.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "headsign": f"Kierunek {i % 7}",
+                "routeId": 100 + i % 15,
+                "routeShortName": str(100 + i % 15),
+                "scheduledTripStartTime": now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "status": "REALTIME" if i % 3 else "SCHEDULED",
+                "theoreticalTime": est.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "timestamp": now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "trip": 1000 + i,
+                "tripId": 10 + i,
+                "vehicleCode": 1000 + random.randrange(max(self.args.vehicles, 1)),
+                "vehicleId": 5000 + i,
+                "vehicleService": f"{100 + i % 15}-01",
+            })
+        return json.dumps(
+            {"lastUpdate": now.isoformat(), "departures": departures}
+        ).encode()
+
+    async def _respond(self, body: bytes, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.args.latency:
+            await asyncio.sleep(self.args.latency / 1000)
+        if random.random() < self.args.error_rate:
+            self.errors += 1
+            return web.Response(status=503)
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.not_modified += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        self.bytes_sent += len(body)
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+    async def _handle_departures(self, request: web.Request) -> web.Response:
+        stop_id = int(request.query.get("stopId", "0"))
+        if random.random() < self.args.slow_rate:
+            self.slow += 1
+            await asyncio.sleep(self.args.slow_latency / 1000)
+        if not self.args.static_departures:
+            return await self._respond(self._build_departures(stop_id), request)
+        if stop_id not in self._static_departures:
+            self._static_departures[stop_id] = self._build_departures(stop_id)
+        return await self._respond(self._static_departures[stop_id], request)
+
+    async def _handle_stops(self, request: web.Request) -> web.Response:
+        return await self._respond(self._stops_body, request)
+
+    async def _handle_vehicles(self, request: web.Request) -> web.Response:
+        return await self._respond(self._vehicles_body, request)
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/departures", self._handle_departures)
+        app.router.add_get("/stops.json", self._handle_stops)
+        app.router.add_get("/stopsingdansk.json", self._handle_stops)
+        app.router.add_get("/baza-pojazdow.json", self._handle_vehicles)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class LoopBlockMonitor:
+    """Measure how late the event loop wakes up a periodic ticker."""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - start - self.interval
+            if lag > 0:
+                self.total_lag += lag
+                self.max_lag = max(self.max_lag, lag)
+
+    def start(self) -> None:
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def payload_report(coordinator) -> None:
+    """Print the attribute payload of the entry's sensors in both attribute formats."""
+    from homeassistant.helpers.json import json_bytes
+
+    from custom_components.ztm_gdansk.const import ATTRIBUTE_FORMATS
+    from custom_components.ztm_gdansk.sensor import ZTMPanelSensor, ZTMStopSensor
+
+    results = {}
+    for attribute_format in ATTRIBUTE_FORMATS:
+        sensors = {
+            "stop": [
+                ZTMStopSensor(coordinator, stop_id, attribute_format)
+                for stop_id in coordinator.stop_ids
+            ],
+            # Unlimited budget: compare the same departures in both formats
+            "panel": [
+                ZTMPanelSensor(coordinator, coordinator.stop_ids, 1, 1, 1 << 30, attribute_format)
+            ],
+        }
+        for kind, entities in sensors.items():
+            start = time.perf_counter()
+            payloads = [json_bytes(entity.extra_state_attributes) for entity in entities]
+            elapsed = time.perf_counter() - start
+            results[kind, attribute_format] = (
+                sum(len(payload) for payload in payloads),
+                sum(len(zlib.compress(payload)) for payload in payloads),
+                elapsed,
+            )
+
+    records, columnar = ATTRIBUTE_FORMATS
+    print()
+    print(f"Attribute payload:     {records:>12} {columnar:>12}   ratio")
+    for kind, label in (("stop", "stop sensors"), ("panel", "panel")):
+        before, after = results[kind, records], results[kind, columnar]
+        print(
+            f"  {label + ' (bytes)':<20}{before[0]:>12} {after[0]:>12}   "
+            f"{before[0] / after[0]:.2f}x"
+        )
+        print(
+            f"  {label + ' (deflate)':<20}{before[1]:>12} {after[1]:>12}   "
+            f"{before[1] / after[1]:.2f}x"
+        )
+        print(
+            f"  {label + ' (ms)':<20}{before[2] * 1000:>12.2f} {after[2] * 1000:>12.2f}"
+        )
+
+
+async def create_hass(config_dir: str):
+    """Create a minimal HomeAssistant instance for driving coordinators."""
+    from homeassistant.core import HomeAssistant
+
+    try:
+        hass = HomeAssistant(config_dir)
+    except TypeError:
+        # Older HA versions take no arguments
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+    return hass
+
+
+async def main(args: argparse.Namespace) -> int:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    if args.replay:
+        from custom_components.ztm_gdansk.transport import ReplayTransport
+
+        transport = ReplayTransport(args.replay, args.replay_speed)
+        stop_ids = transport.stop_ids
+        args.entries = 1
+        args.stops = len(stop_ids)
+        server = None
+        print(f"Replaying {args.replay} ({len(stop_ids)} stops) at speed {args.replay_speed}")
+    else:
+        stop_ids = [10000 + i for i in range(args.entries * args.stops)]
+        server = FakeZTMServer(args, stop_ids)
+        await server.start()
+        print(f"Fake ZTM API listening on {server.base_url}")
+        # Must be set before the integration is imported
+        os.environ["ZTM_GDANSK_API_BASE"] = server.base_url
+
+        from custom_components.ztm_gdansk.transport import HttpTransport, RecordingTransport
+
+        transport = RecordingTransport(args.record) if args.record else HttpTransport()
+
+    from custom_components.ztm_gdansk.coordinator import ZTMCoordinator
+    from custom_components.ztm_gdansk.hedging import HedgeBudget
+
+    config_dir = tempfile.mkdtemp(prefix="ztm_harness_")
+    hass = await create_hass(config_dir)
+
+    coordinators = [
+        ZTMCoordinator(
+            hass,
+            stop_ids[i * args.stops:(i + 1) * args.stops],
+            max_departures=args.max_departures,
+            transport=transport,
+        )
+        for i in range(args.entries)
+    ]
+    if args.hedge:
+        budget = HedgeBudget()
+        for coordinator in coordinators:
+            coordinator.hedge_budget = budget
+
+    # Create a session once so one-time imports and SSL context setup are
+    # not counted as event loop stalls of the first refresh
+    async with transport.session():
+        pass
+
+    monitor = LoopBlockMonitor()
+    monitor.start()
+    # tracemalloc slows down every allocation and would inflate the stalls
+    trace_memory = args.max_stall is None
+    if trace_memory:
+        tracemalloc.start()
+
+    wall_times = []
+    failures = 0
+    for refresh in range(args.refreshes):
+        start = time.perf_counter()
+        await asyncio.gather(*(c.async_refresh() for c in coordinators))
+        wall_times.append(time.perf_counter() - start)
+        failures += sum(1 for c in coordinators if not c.last_update_success)
+
+        # Format attributes the way the sensors do, to include render cost
+        for coordinator in coordinators:
+            for stop_id in coordinator.stop_ids:
+                for dep in coordinator.get_departures(stop_id)[:coordinator.max_departures]:
+                    coordinator.format_departure(dep)
+
+    if trace_memory:
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    await monitor.stop()
+    if server:
+        await server.stop()
+    if args.record and not args.replay:
+        transport.close()
+        print(f"Capture written to {args.record}")
+
+    first, rest = wall_times[0], wall_times[1:]
+    print()
+    print(f"Entries x stops:       {args.entries} x {args.stops}")
+    print(f"Refreshes:             {args.refreshes} ({failures} failed coordinator updates)")
+    print(f"First refresh:         {first * 1000:.1f} ms (includes stops/vehicles DB)")
+    if rest:
+        print(f"Steady refresh avg:    {sum(rest) / len(rest) * 1000:.1f} ms")
+        print(f"Steady refresh max:    {max(rest) * 1000:.1f} ms")
+        print(f"Steady refresh p95:    {sorted(rest)[max(0, math.ceil(len(rest) * 0.95) - 1)] * 1000:.1f} ms")
+    if server:
+        print(f"Requests issued:       {server.requests} ({server.errors} injected errors)")
+        print(f"Bytes transferred:     {server.bytes_sent / 1024:.1f} KiB")
+        print(f"304 Not Modified:      {server.not_modified}")
+        print(f"Slow responses:        {server.slow}")
+    if args.hedge:
+        hedged = sum(c.metrics.counters["hedged"] for c in coordinators)
+        won = sum(c.metrics.counters["hedge_wins"] for c in coordinators)
+        print(f"Hedged requests:       {hedged} ({won} won, {budget.denied} over budget)")
+    if args.payload:
+        payload_report(coordinators[0])
+    counters = coordinators[0].metrics.counters
+    print(f"Unchanged bodies:      {counters['unchanged_bodies']} (first entry)")
+    if trace_memory:
+        print(f"Peak memory (traced):  {peak_memory / 1024 / 1024:.2f} MiB")
+    print(f"Event loop max stall:  {monitor.max_lag * 1000:.1f} ms")
+    print(f"Event loop total lag:  {monitor.total_lag * 1000:.1f} ms")
+
+    await hass.async_stop(force=True)
+
+    if args.max_stall is not None and monitor.max_lag * 1000 > args.max_stall:
+        print(f"FAIL: event loop stall exceeded {args.max_stall:.0f} ms budget")
+        return 1
+    return 0
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1, help="number of config entries (coordinators)")
+    parser.add_argument("--stops", type=int, default=10, help="stops per entry")
+    parser.add_argument("--refreshes", type=int, default=5, help="refresh cycles to run")
+    parser.add_argument("--departures", type=int, default=20, help="departures per stop payload")
+    parser.add_argument("--max-departures", type=int, default=5, help="max_departures per coordinator")
+    parser.add_argument("--vehicles", type=int, default=500, help="vehicles in baza-pojazdow.json")
+    parser.add_argument("--stops-db", type=int, default=2000, help="extra stops in stops JSON")
+    parser.add_argument("--latency", type=float, default=0, help="server latency in ms")
+    parser.add_argument("--static-departures", action="store_true", help="serve the same departures body every time (night traffic)")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of departures requests delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=5000, help="latency of slow departures requests in ms")
+    parser.add_argument("--hedge", action="store_true", help="hedge departures requests slower than the stop's p95")
+    parser.add_argument("--payload", action="store_true", help="compare the attribute payload of the records and columnar formats")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--max-stall", type=float, default=None, help="fail if the event loop stalls longer than this (ms); disables memory tracing")
+    parser.add_argument("--record", metavar="PATH", help="write all API responses to a gzip JSONL capture")
+    parser.add_argument("--replay", metavar="PATH", help="serve API responses from a capture instead of the fake server")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="replay speed factor (0 = no delays)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,5 @@
+"""Shared test setup: make the integration and the harness importable."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
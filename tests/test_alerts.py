@@ -0,0 +1,151 @@
+"""Leave-now alert scheduling on the deadline heap."""
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.ztm_gdansk import alerts
+from custom_components.ztm_gdansk.alerts import DepartureAlertScheduler
+from homeassistant.util import dt as dt_util
+
+
+class FakeCoordinator:
+    """Coordinator serving fixed departures per stop."""
+
+    def __init__(self):
+        self.departures = {}
+        self.data = None
+        self._listeners = []
+
+    def get_departures(self, stop_id):
+        return self.departures.get(stop_id, [])
+
+    def get_stop_name(self, stop_id):
+        return f"Stop {stop_id}"
+
+    def async_add_listener(self, update):
+        self._listeners.append(update)
+        return lambda: self._listeners.remove(update)
+
+    def publish(self, departures):
+        self.departures = departures
+        self.data = {}
+        for update in list(self._listeners):
+            update()
+
+
+@pytest.fixture
+def timers(monkeypatch):
+    """Record armed timers instead of scheduling them."""
+    armed = []
+
+    def track(hass, action, when):
+        armed.append(when)
+        return lambda: armed.remove(when)
+
+    monkeypatch.setattr(alerts, "async_track_point_in_utc_time", track)
+    return armed
+
+
+def _fire(scheduler, timers):
+    """Run the armed timer, which is gone once it has fired."""
+    when = timers.pop(0)
+    scheduler._async_timer_fired(when)
+    return when
+
+
+def _departure(dep_id, departs_at, route="158"):
+    return {
+        "id": dep_id,
+        "routeShortName": route,
+        "headsign": "Wrzeszcz PKP",
+        "estimatedTime": departs_at.isoformat(),
+    }
+
+
+def _scheduler(walking_minutes=5):
+    events = []
+    hass = SimpleNamespace(
+        bus=SimpleNamespace(async_fire=lambda event, data: events.append(data))
+    )
+    coordinator = FakeCoordinator()
+    scheduler = DepartureAlertScheduler(hass, coordinator, {"1": walking_minutes})
+    scheduler.async_start()
+    return scheduler, coordinator, events
+
+
+def test_timer_is_armed_for_the_walking_deadline(timers):
+    scheduler, coordinator, events = _scheduler()
+    departs_at = dt_util.utcnow() + timedelta(minutes=20)
+    coordinator.publish({"1": [_departure("a", departs_at)]})
+
+    assert timers == [departs_at - timedelta(minutes=5)]
+    assert scheduler.next_alert("1").key == "a"
+    assert events == []
+
+
+def test_alert_fires_at_the_deadline(timers):
+    scheduler, coordinator, events = _scheduler()
+    departs_at = dt_util.utcnow() + timedelta(minutes=20)
+    coordinator.publish({"1": [_departure("a", departs_at)]})
+    changes = []
+    scheduler.async_add_listener("1", lambda: changes.append(True))
+
+    _fire(scheduler, timers)
+
+    assert [alert.key for alert in scheduler.active_alerts("1")] == ["a"]
+    assert events[0]["route"] == "158"
+    assert events[0]["walking_time"] == 5
+    assert changes == [True]
+    assert timers == [departs_at]
+
+    assert _fire(scheduler, timers) == departs_at
+    assert scheduler.active_alerts("1") == []
+    assert timers == []
+
+
+def test_later_eta_moves_the_deadline(timers):
+    scheduler, coordinator, events = _scheduler()
+    departs_at = dt_util.utcnow() + timedelta(minutes=20)
+    coordinator.publish({"1": [_departure("a", departs_at)]})
+    delayed = departs_at + timedelta(minutes=3)
+    coordinator.publish({"1": [_departure("a", delayed)]})
+
+    # The superseded deadline comes up first and is skipped
+    assert _fire(scheduler, timers) == departs_at - timedelta(minutes=5)
+    assert events == []
+    assert timers == [delayed - timedelta(minutes=5)]
+
+    _fire(scheduler, timers)
+    assert len(events) == 1
+
+
+def test_earlier_eta_fires_right_away(timers):
+    scheduler, coordinator, events = _scheduler()
+    now = dt_util.utcnow()
+    coordinator.publish({"1": [_departure("a", now + timedelta(minutes=20))]})
+    coordinator.publish({"1": [_departure("a", now + timedelta(minutes=4))]})
+
+    assert len(events) == 1
+    assert [alert.key for alert in scheduler.active_alerts("1")] == ["a"]
+
+
+def test_deadline_passed_on_first_sight_does_not_alert(timers):
+    scheduler, coordinator, events = _scheduler()
+    coordinator.publish({"1": [_departure("a", dt_util.utcnow() + timedelta(minutes=2))]})
+
+    assert events == []
+    assert scheduler.next_alert("1") is None
+
+
+def test_gone_departures_are_forgotten(timers):
+    scheduler, coordinator, _ = _scheduler()
+    departs_at = dt_util.utcnow() + timedelta(minutes=20)
+    coordinator.publish({"1": [_departure("a", departs_at)]})
+    coordinator.publish({"1": []})
+
+    assert scheduler.next_alert("1") is None
+    # Heap entries of the gone departure come up and are skipped
+    _fire(scheduler, timers)
+    _fire(scheduler, timers)
+    assert timers == []
@@ -0,0 +1,94 @@
+"""TTL/LRU cache and size accounting."""
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.ztm_gdansk import cache
+from custom_components.ztm_gdansk.cache import TTLCache, approximate_size
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the monotonic clock of the cache module with a settable one."""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    lru = TTLCache(2, None)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+
+    assert "b" not in lru
+    assert [key for key, _ in lru.items()] == ["a", "c"]
+    assert lru.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    ttl = TTLCache(10, 30)
+    ttl.set("a", 1)
+    clock.value += 29
+    assert ttl.get("a") == 1
+
+    clock.value += 2
+    assert "a" not in ttl
+    assert ttl.get("a") is None
+    assert len(ttl) == 0
+    assert ttl.stats()["expirations"] == 1
+
+
+def test_max_age_is_stricter_than_ttl_without_dropping(clock):
+    ttl = TTLCache(10, 30)
+    ttl.set("a", 1)
+    clock.value += 10
+
+    assert ttl.get("a", max_age=5) is None
+    assert ttl.get("a") == 1
+
+
+def test_expire_drops_only_old_entries(clock):
+    ttl = TTLCache(10, 30)
+    ttl.set("old", 1)
+    clock.value += 20
+    ttl.set("new", 2)
+    clock.value += 15
+
+    assert ttl.expire() == 1
+    assert [key for key, _ in ttl.items()] == ["new"]
+
+
+def test_bytes_follow_stored_values(clock):
+    sized = TTLCache(2, None, len)
+    sized.set("a", "xx")
+    sized.set("b", "yyy")
+    assert sized.bytes == 5
+
+    sized.set("a", "z")
+    assert sized.bytes == 4
+    sized.set("c", "wwww")
+    assert sized.bytes == 5
+    sized.pop("a")
+    assert sized.bytes == 4
+    assert sized.stats()["bytes"] == 4
+
+
+def test_copy_is_independent(clock):
+    original = TTLCache(10, None, len)
+    original.set("a", "xx")
+    other = original.copy()
+    other.set("b", "yyy")
+
+    assert "b" not in original
+    assert original.bytes == 2
+    assert other.bytes == 5
+
+
+def test_approximate_size_counts_nested_values():
+    flat = approximate_size({"route": "158"})
+    nested = approximate_size({"route": "158", "stops": [{"route": "158"}]})
+
+    assert nested > flat + approximate_size([])
+    assert approximate_size([]) < approximate_size(["x" * 100])
@@ -0,0 +1,49 @@
+"""Merging departures of several stops and indexing them by route."""
+from custom_components.ztm_gdansk.coordinator import build_route_index, merge_departures
+
+
+def _departure(route, trip, time):
+    return {
+        "id": f"{route}-{trip}-{time}",
+        "routeShortName": route,
+        "routeId": route,
+        "tripId": trip,
+        "scheduledTripStartTime": "07:00",
+        "estimatedTime": f"2026-01-12T08:{time:02d}:00Z",
+    }
+
+
+DEPARTURES = {
+    "1": [_departure("158", 1, 5), _departure("3", 2, 9)],
+    "2": [_departure("158", 1, 7), _departure("130", 3, 8)],
+}
+
+
+def test_merge_is_time_ordered_and_deduplicated():
+    merged = merge_departures(DEPARTURES, [1, 2], 10)
+
+    assert [(stop_id, dep["estimatedTime"][14:16]) for stop_id, dep in merged] == [
+        ("1", "05"),
+        ("2", "08"),
+        ("1", "09"),
+    ]
+
+
+def test_merge_without_dedupe_keeps_every_stop():
+    merged = merge_departures(DEPARTURES, [2, 1, 2], 10, dedupe=False)
+
+    assert [stop_id for stop_id, _ in merged] == ["1", "2", "2", "1"]
+
+
+def test_merge_stops_at_limit_and_skips_unknown_stops():
+    merged = merge_departures(DEPARTURES, [1, 2, 99], 2)
+
+    assert len(merged) == 2
+
+
+def test_route_index_lists_each_stop_of_a_trip():
+    routes = build_route_index(DEPARTURES, 10)
+
+    assert set(routes) == {"158", "3", "130"}
+    assert [stop_id for stop_id, _ in routes["158"]] == ["1", "2"]
+    assert len(build_route_index(DEPARTURES, 1)["158"]) == 1
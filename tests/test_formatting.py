@@ -0,0 +1,44 @@
+"""Departure format templates and columnar attributes."""
+import pytest
+
+from custom_components.ztm_gdansk.formatting import (
+    DepartureFormatter,
+    to_columns,
+    validate_departure_format,
+)
+
+
+def test_formats_only_used_fields():
+    formatter = DepartureFormatter("{route} → {headsign} {minutes} min")
+
+    assert formatter.fields == {"route", "headsign", "minutes"}
+    assert formatter.format({"route": "158", "headsign": "Oliwa", "minutes": 3}) == (
+        "158 → Oliwa 3 min"
+    )
+    assert formatter.format({}) == "? → ? 0 min"
+
+
+def test_attribute_and_index_access_depend_on_the_root_field():
+    formatter = DepartureFormatter("{route[0]}{headsign.upper}")
+
+    assert formatter.fields == {"route", "headsign"}
+
+
+@pytest.mark.parametrize(
+    "template",
+    ["{unknown}", "{route", "{minutes:d}x{delay:d}", "{route.missing}"],
+)
+def test_invalid_templates_are_rejected(template):
+    with pytest.raises(ValueError):
+        DepartureFormatter(template)
+    assert not validate_departure_format(template)
+
+
+def test_columns_hold_one_array_per_field():
+    records = [{"route": "158", "minutes": 3}, {"route": "3", "delay": 1}]
+
+    assert to_columns(records) == {
+        "schema": ["route", "minutes", "delay"],
+        "columns": [["158", "3"], [3, None], [None, 1]],
+    }
+    assert to_columns([]) == {"schema": [], "columns": []}
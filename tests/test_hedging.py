@@ -0,0 +1,90 @@
+"""Hedged departure requests and their budget."""
+import asyncio
+
+import pytest
+
+from custom_components.ztm_gdansk.const import HEDGE_MIN_DELAY, HEDGE_MIN_SAMPLES
+from custom_components.ztm_gdansk.hedging import HedgeBudget, async_hedged, hedge_delay
+
+
+def _request(*delays, error=None):
+    """Return a request whose n-th call takes delays[n] seconds."""
+    calls = []
+
+    async def request():
+        attempt = len(calls)
+        calls.append(attempt)
+        await asyncio.sleep(delays[attempt])
+        if error is not None and attempt == 0:
+            raise error
+        return attempt
+
+    return request, calls
+
+
+def test_budget_limits_hedges_to_earned_tokens():
+    budget = HedgeBudget(ratio=0.5, burst=1)
+
+    assert budget.try_acquire()
+    assert not budget.try_acquire()
+    budget.record_request()
+    budget.record_request()
+    assert budget.try_acquire()
+    assert budget.as_dict() == {"tokens": 0, "hedged": 2, "won": 0, "denied": 1}
+
+
+def test_tokens_do_not_exceed_burst():
+    budget = HedgeBudget(ratio=1, burst=2)
+    for _ in range(5):
+        budget.record_request()
+
+    assert budget.tokens == 2
+
+
+def test_fast_request_is_not_hedged():
+    request, calls = _request(0)
+    budget = HedgeBudget()
+
+    assert asyncio.run(async_hedged(request, 0.05, budget)) == (0, False, False)
+    assert calls == [0]
+
+
+def test_slow_request_is_hedged_and_hedge_wins():
+    request, calls = _request(0.5, 0)
+    budget = HedgeBudget()
+
+    assert asyncio.run(async_hedged(request, 0.01, budget)) == (1, True, True)
+    assert calls == [0, 1]
+    assert budget.won == 1
+
+
+def test_no_hedge_without_budget():
+    request, calls = _request(0.05, 0)
+    budget = HedgeBudget(ratio=0, burst=0)
+
+    assert asyncio.run(async_hedged(request, 0.01, budget)) == (0, False, False)
+    assert calls == [0]
+    assert budget.denied == 1
+
+
+def test_failed_original_waits_for_hedge():
+    request, _ = _request(0.05, 0.1, error=OSError("reset"))
+
+    assert asyncio.run(async_hedged(request, 0.01, HedgeBudget())) == (1, True, True)
+
+
+def test_original_error_is_raised_when_both_fail():
+    async def request():
+        await asyncio.sleep(0.02)
+        raise OSError("down")
+
+    with pytest.raises(OSError):
+        asyncio.run(async_hedged(request, 0.01, HedgeBudget()))
+
+
+def test_hedge_delay_needs_samples_and_stays_under_timeout():
+    assert hedge_delay(None, 100, 10) is None
+    assert hedge_delay(500, HEDGE_MIN_SAMPLES - 1, 10) is None
+    assert hedge_delay(500, HEDGE_MIN_SAMPLES, 10) == 0.5
+    assert hedge_delay(1, HEDGE_MIN_SAMPLES, 10) == HEDGE_MIN_DELAY
+    assert hedge_delay(20000, HEDGE_MIN_SAMPLES, 10) is None
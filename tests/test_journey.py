@@ -0,0 +1,113 @@
+"""Connection scan journey planner."""
+from datetime import datetime, timedelta, timezone
+
+from custom_components.ztm_gdansk.journey import ConnectionIndex
+
+START = datetime(2026, 1, 12, 8, 0, tzinfo=timezone.utc)
+
+
+def _departure(route, trip, minute):
+    return {
+        "routeShortName": route,
+        "routeId": route,
+        "tripId": trip,
+        "scheduledTripStartTime": "2026-01-12T07:50:00Z",
+        "headsign": f"Kierunek {route}",
+        "estimatedTime": (START + timedelta(minutes=minute)).isoformat(),
+        "vehicleCode": trip * 100,
+    }
+
+
+def _at(minute):
+    return (START + timedelta(minutes=minute)).timestamp()
+
+
+def test_direct_trip():
+    index = ConnectionIndex([
+        ("1", _departure("158", 1, 5)),
+        ("2", _departure("158", 1, 10)),
+        ("3", _departure("158", 1, 15)),
+    ])
+
+    journey = index.earliest_arrival("1", "3", _at(0), 120)
+
+    assert len(index) == 2
+    assert [(leg.route, leg.from_stop, leg.to_stop) for leg in journey.legs] == [
+        ("158", "1", "3")
+    ]
+    assert journey.departs_at == _at(5)
+    assert journey.arrives_at == _at(15)
+
+
+def test_transfer_respects_min_transfer():
+    departures = [
+        ("1", _departure("158", 1, 0)),
+        ("2", _departure("158", 1, 10)),
+        # Leaves 1 minute after arrival: too tight for a 2 minute transfer
+        ("2", _departure("3", 2, 11)),
+        ("3", _departure("3", 2, 20)),
+        ("2", _departure("3", 3, 15)),
+        ("3", _departure("3", 3, 25)),
+    ]
+    journey = ConnectionIndex(departures).earliest_arrival("1", "3", _at(0), 120)
+
+    assert [(leg.route, leg.from_stop, leg.to_stop) for leg in journey.legs] == [
+        ("158", "1", "2"),
+        ("3", "2", "3"),
+    ]
+    assert journey.arrives_at == _at(25)
+
+
+def test_interchange_between_group_stops():
+    departures = [
+        ("1", _departure("158", 1, 0)),
+        ("2", _departure("158", 1, 10)),
+        ("4", _departure("3", 2, 15)),
+        ("3", _departure("3", 2, 20)),
+    ]
+    index = ConnectionIndex(departures, [["2", "4"]])
+
+    journey = index.earliest_arrival("1", "3", _at(0), 120)
+
+    assert [(leg.from_stop, leg.to_stop) for leg in journey.legs] == [
+        ("1", "2"),
+        ("4", "3"),
+    ]
+
+
+def test_journey_may_end_at_another_stop_of_the_target_interchange():
+    departures = [
+        ("1", _departure("158", 1, 0)),
+        ("4", _departure("158", 1, 10)),
+        ("1", _departure("3", 2, 1)),
+        ("3", _departure("3", 2, 20)),
+    ]
+    index = ConnectionIndex(departures, [["3", "4"]])
+
+    journey = index.earliest_arrival("1", "3", _at(0), 120)
+
+    assert [(leg.route, leg.from_stop, leg.to_stop) for leg in journey.legs] == [
+        ("158", "1", "4")
+    ]
+    assert journey.arrives_at == _at(10)
+
+
+def test_unreachable_target():
+    index = ConnectionIndex([
+        ("1", _departure("158", 1, 5)),
+        ("2", _departure("158", 1, 10)),
+    ])
+
+    assert index.earliest_arrival("2", "1", _at(0), 120) is None
+    assert index.earliest_arrival("1", "2", _at(6), 120) is None
+
+
+def test_plan_lists_later_departures():
+    departures = [
+        (stop_id, _departure("158", trip, minute + offset))
+        for trip, minute in ((1, 0), (2, 10), (3, 20))
+        for stop_id, offset in (("1", 0), ("2", 5))
+    ]
+    journeys = ConnectionIndex(departures).plan("1", "2", _at(0), 120, 2)
+
+    assert [journey.departs_at for journey in journeys] == [_at(0), _at(10)]
@@ -0,0 +1,66 @@
+"""Event loop lag monitor sampling and stall attribution."""
+import asyncio
+import time
+
+from custom_components.ztm_gdansk.const import LOOP_MONITOR_INTERVAL
+from custom_components.ztm_gdansk.loop_monitor import LoopLagMonitor
+
+
+def _block(seconds):
+    """Busy-wait (Home Assistant rejects time.sleep in the event loop)."""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_ticker_runs_only_while_watching():
+    async def run():
+        monitor = LoopLagMonitor(asyncio.get_running_loop())
+        monitor.async_add_entry(50)
+        await asyncio.sleep(LOOP_MONITOR_INTERVAL * 3)
+        idle_ticks = monitor.ticks
+
+        with monitor.watch():
+            await asyncio.sleep(LOOP_MONITOR_INTERVAL * 3.5)
+        await asyncio.sleep(LOOP_MONITOR_INTERVAL * 3)
+        return idle_ticks, monitor.ticks
+
+    idle_ticks, ticks = asyncio.run(run())
+
+    assert idle_ticks == 0
+    assert 3 <= ticks <= 5
+
+
+def test_stall_is_attributed_to_the_slowest_section():
+    async def run():
+        monitor = LoopLagMonitor(asyncio.get_running_loop())
+        monitor.async_add_entry(200)
+        monitor.async_add_entry(50)
+        with monitor.section("format", "sensor.ztm_panel"):
+            _block(0.15)
+        await asyncio.sleep(LOOP_MONITOR_INTERVAL * 2)
+        return monitor
+
+    monitor = asyncio.run(run())
+
+    assert monitor.threshold_ms == 50
+    assert [(stall["phase"], stall["entity_id"]) for stall in monitor.stalls] == [
+        ("format", "sensor.ztm_panel")
+    ]
+    assert monitor.ticks == 1
+
+
+def test_removing_the_last_entry_stops_sampling():
+    async def run():
+        monitor = LoopLagMonitor(asyncio.get_running_loop())
+        remove = monitor.async_add_entry(50)
+        with monitor.watch():
+            await asyncio.sleep(LOOP_MONITOR_INTERVAL * 1.5)
+            remove()
+            await asyncio.sleep(LOOP_MONITOR_INTERVAL * 2)
+        return monitor
+
+    monitor = asyncio.run(run())
+
+    assert monitor.ticks == 1
+    assert monitor.as_dict()["threshold_ms"] is None
@@ -0,0 +1,47 @@
+"""Refresh metrics and fetch recording."""
+from custom_components.ztm_gdansk.metrics import FetchRecorder, RefreshMetrics, percentile
+
+
+def test_percentile_uses_nearest_rank():
+    assert percentile([], 95) is None
+    assert percentile([30, 10, 20], 50) == 20
+    assert percentile(list(range(1, 101)), 95) == 95
+
+
+def test_only_monitored_stops_get_per_stop_metrics():
+    metrics = RefreshMetrics([1, 2])
+    metrics.record_fetch(1, 100, True, 500)
+    metrics.record_fetch("2", 300, True, 500)
+    for stop_id in range(1000, 1100):
+        metrics.record_fetch(stop_id, 50, True, 10)
+
+    assert metrics.counters["requests"] == 102
+    assert metrics.latency_percentile(95, 1) == 100
+    assert metrics.latency_samples(1000) == 0
+    assert metrics.data_age(1000) is None
+    assert metrics.data_age(2) is not None
+    assert set(metrics.as_dict()["stops"]) == {"1", "2"}
+
+
+def test_failures_count_towards_the_error_rate():
+    metrics = RefreshMetrics([1])
+    metrics.record_fetch(1, 100, True)
+    metrics.record_fetch(1, 0, False)
+
+    assert metrics.error_rate() == 0.5
+    assert metrics.counters["request_errors"] == 1
+    assert metrics.latency_samples(1) == 1
+
+
+def test_recorded_fetch_is_applied_to_every_waiter():
+    recorder = FetchRecorder()
+    recorder.incr("not_modified")
+    recorder.record_fetch(1, 80, True, 100)
+    first, second = RefreshMetrics([1]), RefreshMetrics([])
+    recorder.apply(first)
+    recorder.apply(second)
+
+    assert first.counters["not_modified"] == second.counters["not_modified"] == 1
+    assert first.latency_samples(1) == 1
+    assert second.latency_samples(1) == 0
+    assert second.counters["bytes"] == 100
@@ -0,0 +1,44 @@
+"""Migration of shared unique IDs to entry-scoped ones."""
+import asyncio
+from types import SimpleNamespace
+
+from custom_components.ztm_gdansk import _async_migrate_unique_ids, er
+
+
+def _migrate(monkeypatch, unique_ids):
+    """Run the migration over registry entries with the given unique IDs."""
+    migrated = {}
+
+    async def migrate_entries(hass, entry_id, callback):
+        for unique_id in unique_ids:
+            update = callback(SimpleNamespace(unique_id=unique_id))
+            migrated[unique_id] = update and update["new_unique_id"]
+
+    monkeypatch.setattr(er, "async_migrate_entries", migrate_entries)
+    asyncio.run(_async_migrate_unique_ids(None, SimpleNamespace(entry_id="abc")))
+    return migrated
+
+
+def test_shared_unique_ids_get_the_entry_prefix(monkeypatch):
+    migrated = _migrate(monkeypatch, [
+        "ztm_board",
+        "ztm_panel",
+        "ztm_panel_2",
+        "ztm_group_peron_3",
+        "ztm_metric_error_rate",
+        "ztm_route_n1",
+        "ztm_leave_now_14001",
+    ])
+
+    assert all(new == f"abc_{old}" for old, new in migrated.items())
+
+
+def test_stop_and_migrated_unique_ids_are_kept(monkeypatch):
+    migrated = _migrate(monkeypatch, [
+        "ztm_stop_14001",
+        "ztm_next_14001",
+        "ztm_data_age_14001",
+        "abc_ztm_panel",
+    ])
+
+    assert set(migrated.values()) == {None}
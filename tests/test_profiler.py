@@ -0,0 +1,27 @@
+"""Refresh cycle profiling."""
+from custom_components.ztm_gdansk.profiler import RefreshProfiler
+
+
+def _refresh():
+    return sorted(range(1000), key=lambda value: -value)
+
+
+def test_summary_lists_profiled_calls():
+    profiler = RefreshProfiler(2)
+    for _ in range(2):
+        with profiler.capture():
+            _refresh()
+
+    rows = profiler.summary(50)
+
+    assert profiler.finished
+    assert profiler.captured == 2
+    assert any(row["function"] == "_refresh" for row in rows)
+    assert len(profiler.summary(1)) == 1
+
+
+def test_summary_is_empty_when_nothing_was_profiled():
+    profiler = RefreshProfiler(0)
+
+    assert profiler.finished
+    assert profiler.summary() == []
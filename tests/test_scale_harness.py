@@ -0,0 +1,36 @@
+"""Event loop stall budget of a coordinator refresh, run through scale_harness.py."""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Decoding the stops and vehicles databases below on the event loop stalls it
+# for about 200 ms; in the executor the longest stall is about 40 ms
+MAX_STALL_MS = 100
+
+
+def test_refresh_stays_within_stall_budget():
+    """A first refresh with large stops and vehicles databases does not block the loop."""
+    # The harness points the integration at its fake server through
+    # ZTM_GDANSK_API_BASE, which const.py reads on import, so it runs in its
+    # own process to keep the environment and the imported module clean
+    env = {k: v for k, v in os.environ.items() if k != "ZTM_GDANSK_API_BASE"}
+    result = subprocess.run(
+        [
+            sys.executable,
+            os.path.join(ROOT, "scale_harness.py"),
+            "--stops", "10",
+            "--refreshes", "3",
+            "--stops-db", "20000",
+            "--vehicles", "5000",
+            "--max-stall", str(MAX_STALL_MS),
+        ],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,103 @@
+"""Compact snapshots of the stops and vehicles indexes."""
+import os
+
+import pytest
+
+from custom_components.ztm_gdansk.snapshot import (
+    STOP_COLUMNS,
+    CompactIndex,
+    build_snapshot,
+    diff_indexes,
+    open_snapshot,
+    write_snapshot,
+)
+
+STOPS = {
+    "14001": {
+        "name": "Brama Wyżynna",
+        "short_name": "Brama",
+        "platform": "01",
+        "zone": "Gdańsk",
+        "lat": 54.35,
+        "lon": 18.64,
+        "type": "BUS",
+        "wheelchair_accessible": True,
+        "on_demand": False,
+        "zone_border": False,
+    },
+    "2": {"name": "Oliwa", "lat": None, "wheelchair_accessible": False},
+}
+
+
+def test_records_round_trip():
+    index = CompactIndex(build_snapshot("stops", STOPS, STOP_COLUMNS))
+
+    assert index.kind == "stops"
+    assert list(index) == ["2", "14001"]
+    assert index["14001"] == STOPS["14001"]
+    assert index[2] == {
+        "name": "Oliwa",
+        "short_name": "",
+        "platform": "",
+        "zone": "",
+        "lat": None,
+        "lon": None,
+        "type": "",
+        "wheelchair_accessible": False,
+        "on_demand": False,
+        "zone_border": False,
+    }
+
+
+def test_lookups_of_unknown_ids():
+    index = CompactIndex(build_snapshot("stops", {**STOPS, "abc": {}}, STOP_COLUMNS))
+
+    assert len(index) == 2
+    assert "abc" not in index
+    assert "3" not in index
+    with pytest.raises(KeyError):
+        index["3"]
+
+
+def test_decoded_records_are_bounded():
+    stops = {str(stop_id): {"name": f"Stop {stop_id}"} for stop_id in range(10)}
+    index = CompactIndex(build_snapshot("stops", stops, STOP_COLUMNS), max_decoded=3)
+    for stop_id in stops:
+        assert index[stop_id]["name"] == f"Stop {stop_id}"
+
+    assert index.decoded == 3
+    index.record("0")
+    assert index.decoded == 3
+
+
+def test_rejects_other_formats():
+    with pytest.raises(ValueError):
+        CompactIndex(b"JSON{}" + bytes(16))
+    with pytest.raises(ValueError):
+        CompactIndex(b"ZT")
+
+
+def test_written_snapshot_is_reopened(tmp_path):
+    path = os.path.join(tmp_path, ".storage", "stops.snapshot")
+    written = write_snapshot(path, "stops", STOPS, STOP_COLUMNS)
+
+    assert written["14001"]["name"] == "Brama Wyżynna"
+    assert open_snapshot(path, STOP_COLUMNS)["2"]["name"] == "Oliwa"
+    assert open_snapshot(path, {"name": "str"}) is None
+    assert open_snapshot(path, STOP_COLUMNS, max_age=-1) is None
+    assert open_snapshot(os.path.join(tmp_path, "missing"), STOP_COLUMNS) is None
+
+
+def test_diff_between_snapshot_and_dict():
+    old = CompactIndex(build_snapshot("stops", STOPS, STOP_COLUMNS))
+    new = {
+        "14001": {**STOPS["14001"], "platform": "02"},
+        "3": {"name": "Zaspa"},
+    }
+
+    assert diff_indexes(old, new) == {
+        "added": ["3"],
+        "removed": ["2"],
+        "changed": ["14001"],
+    }
+    assert diff_indexes(old, new, field="name")["changed"] == []
@@ -0,0 +1,47 @@
+"""Resolution of entity unique IDs to the stops a service call targets."""
+from types import SimpleNamespace
+
+from custom_components.ztm_gdansk import unique_id_stops
+
+
+def _coordinator(**kwargs):
+    defaults = {
+        "stop_ids": [1, 2, 3, 14001, 14002],
+        "stop_groups": {},
+        "panel_shards": [],
+        "data": None,
+    }
+    return SimpleNamespace(**{**defaults, **kwargs})
+
+
+def test_numbered_group_targets_member_stops():
+    coordinator = _coordinator(stop_groups={"Peron 3": [14001, 14002]})
+
+    assert unique_id_stops("ztm_group_peron_3", [coordinator]) == {14001, 14002}
+
+
+def test_panel_shard_targets_shard_stops():
+    coordinator = _coordinator(panel_shards=[[1, 2], [3, 14001], [14002]])
+
+    assert unique_id_stops("ztm_panel", [coordinator]) == {1, 2}
+    assert unique_id_stops("ztm_panel_2", [coordinator]) == {3, 14001}
+    assert unique_id_stops("ztm_panel_4", [coordinator]) == set()
+
+
+def test_stop_entities_target_monitored_stops_only():
+    coordinator = _coordinator()
+
+    assert unique_id_stops("ztm_stop_14001", [coordinator]) == {14001}
+    assert unique_id_stops("ztm_next_2", [coordinator]) == {2}
+    assert unique_id_stops("ztm_data_age_3", [coordinator]) == {3}
+    assert unique_id_stops("ztm_leave_now_1", [coordinator]) == {1}
+    assert unique_id_stops("ztm_stop_99999", [coordinator]) == set()
+    assert unique_id_stops("ztm_metric_error_rate", [coordinator]) == set()
+
+
+def test_line_entities_target_stops_the_line_departs_from():
+    coordinator = _coordinator(
+        data={"routes": {"N1": [("1", {}), ("3", {})], "130": [("2", {})]}}
+    )
+
+    assert unique_id_stops("ztm_route_n1", [coordinator]) == {1, 3}